@@ -0,0 +1,118 @@
+"""
+Agency Names Module
+Process-wide index of every agency name variant, shared by the transcript and prompt name matchers
+"""
+
+import time
+import threading
+import logging
+from typing import AbstractSet, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from core.autocomplete import store_signature
+from core.backend import StorageBackend
+from core.name_matching import NameMatrix, SoundIndex
+from utils.normalization import has_arabic_script, normalize_text
+
+logger = logging.getLogger(__name__)
+
+_names: Dict[str, "AgencyNames"] = {}
+_lock = threading.Lock()
+
+
+class AgencyNames:
+    """
+    Immutable list of agency names in source order (Arabic then English name of
+    each agencies row, the English one only when it differs)
+
+    Each name keeps its raw, lowercased and normalized forms and the source row
+    and agency it came from; the fuzzy scoring matrix, name-spotting automaton
+    and transliteration key index are built over the same list, so a matcher's
+    index maps back to all of them.
+    """
+
+    __slots__ = ("names", "lowered", "normalized", "row_ids", "agency_ids", "positions", "matrix", "sounds",
+                 "signature")
+
+    def __init__(self, rows: Sequence[Tuple[int, Optional[str], Optional[str], Optional[str]]],
+                 signature: Optional[object] = None):
+        """rows: (agencies.id, agency_id, Arabic name, English name)"""
+        self.signature = signature
+        self.names: List[str] = []
+        self.row_ids: List[int] = []
+        self.agency_ids: List[Optional[str]] = []
+        for row_id, agency_id, ar, en in rows:
+            for name in (ar, en if en != ar else None):
+                if name and name.strip():
+                    self.names.append(name.strip())
+                    self.row_ids.append(row_id)
+                    self.agency_ids.append(agency_id)
+        self.lowered = [name.lower() for name in self.names]
+        self.normalized = [normalize_text(name) for name in self.names]
+        # agency_id → indices of its names
+        self.positions: Dict[str, List[int]] = {}
+        for i, agency_id in enumerate(self.agency_ids):
+            if agency_id:
+                self.positions.setdefault(agency_id, []).append(i)
+        self.matrix = NameMatrix(self.names, self.normalized)
+        self.sounds = SoundIndex(self.normalized)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def names_of(self, agency_id: str) -> List[str]:
+        """Every name variant of one agency"""
+        return [self.names[i] for i in self.positions.get(agency_id, [])]
+
+    def sound_match(self, text_norm: str, ignore: AbstractSet[str] = frozenset()) -> Optional[Tuple[int, int, int]]:
+        """
+        First word window of text_norm (without ignore words) spelling one
+        agency's name in another script or transliteration, as (first word, end
+        word, name index); the name is taken in the script of the window when
+        the agency has one
+        """
+        words = text_norm.split()
+        for start, end, hits in self.sounds.find(text_norm, ignore):
+            agencies = {self.agency_ids[i] or self.normalized[i] for i in hits}
+            if len(agencies) != 1:
+                continue
+            agency_id = self.agency_ids[hits[0]]
+            variants = self.positions.get(agency_id, hits) if agency_id else hits
+            arabic = has_arabic_script(" ".join(words[start:end]))
+            same_script = [i for i in variants if has_arabic_script(self.normalized[i]) == arabic]
+            return start, end, (same_script or hits)[0]
+        return None
+
+
+def load_agency_names(backend: StorageBackend, signature: Optional[object] = None) -> AgencyNames:
+    """Read every agency name through the backend's pool"""
+    started = time.perf_counter()
+    # agency_id exists from the canonical entity migration on
+    agency_id = "agency_id" if backend.schema_version >= 6 else "NULL"
+    with backend.engine.connect() as conn:
+        rows = [tuple(row) for row in conn.execute(text(
+            f"SELECT id, {agency_id}, hajj_company_ar, hajj_company_en FROM agencies ORDER BY id"
+        ))]
+    names = AgencyNames(rows, signature)
+    logger.info(f"📊 Loaded {len(names)} agency names in {time.perf_counter() - started:.3f}s")
+    return names
+
+
+def get_agency_names(backend: StorageBackend) -> AgencyNames:
+    """Process-wide agency names of a store, reloaded when the store changes"""
+    signature = store_signature(backend)
+    with _lock:
+        cached = _names.get(backend.cache_namespace)
+        if cached is not None and cached.signature == signature:
+            return cached
+        if cached is not None:
+            logger.info(f"♻️ Agency names changed, reloading for {backend}")
+        names = load_agency_names(backend, signature)
+        _names[backend.cache_namespace] = names
+        return names
+
+
+def clear_agency_names() -> None:
+    with _lock:
+        _names.clear()
@@ -0,0 +1,213 @@
+"""
+Agency Autocomplete Module
+Process-wide sorted-array prefix index over normalized agency names for type-ahead suggestions
+"""
+
+import time
+import threading
+import logging
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from core.backend import StorageBackend, get_backend
+from core.query_cache import file_signature
+from utils.normalization import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Fewer normalized characters than this get no suggestions
+MIN_PREFIX_CHARS = 2
+# Prefixes up to this length are answered from a precomputed top-N table
+# (they match thousands of names, too many to rank per keystroke)
+SHORT_PREFIX_CHARS = 3
+DEFAULT_SUGGESTIONS = 8
+MAX_SUGGESTIONS = 20
+# Matching keys examined per sorted array for a longer prefix
+MAX_SCAN = 256
+# A store without a local file is re-read this often
+REMOTE_RELOAD_SECONDS = 600
+
+_indexes: Dict[str, "NameIndex"] = {}
+_lock = threading.Lock()
+
+
+class Suggestion:
+    """One agency offered for a typed prefix, with the name variant that matched"""
+
+    __slots__ = ("agency_id", "name", "name_en", "name_ar", "city", "country", "city_ar", "country_ar",
+                 "is_authorized")
+
+    def __init__(self, agency_id: str, name: str, name_en: Optional[str], name_ar: Optional[str],
+                 city: Optional[str], country: Optional[str], city_ar: Optional[str], country_ar: Optional[str],
+                 is_authorized: Optional[str]):
+        self.agency_id = agency_id
+        self.name = name
+        self.name_en = name_en
+        self.name_ar = name_ar
+        self.city = city
+        self.country = country
+        self.city_ar = city_ar
+        self.country_ar = country_ar
+        self.is_authorized = is_authorized
+
+    def label(self, lang: str = "English") -> str:
+        """Matched name with its city and country, for a suggestion list"""
+        places = (self.city, self.country) if lang == "English" else (self.city_ar, self.country_ar)
+        place = (", " if lang == "English" else "، ").join(p for p in places if p)
+        return f"{self.name} — {place}" if place else self.name
+
+    def __repr__(self) -> str:
+        return f"Suggestion({self.name!r}, {self.agency_id})"
+
+
+# ---------------- Index ----------------
+class NameIndex:
+    """
+    Immutable prefix index over every name variant in agency_alias
+
+    Two sorted key arrays are searched with bisect: whole names, and the tail
+    of each name from its second word on (so "huda" finds "al huda group").
+    Whole-name matches rank first, then agencies with more reviews.
+    """
+
+    def __init__(self, agencies: Sequence[tuple], aliases: Sequence[Tuple[str, str, str]],
+                 signature: Optional[object] = None):
+        self.signature = signature
+        self.agencies = list(agencies)
+        position = {row[0]: i for i, row in enumerate(self.agencies)}
+        # Popularity of each agency (review count), for ranking
+        self._popularity = [row[-1] or 0 for row in self.agencies]
+
+        names: List[Tuple[str, int, str]] = []
+        tails: List[Tuple[str, int, str]] = []
+        for alias_norm, alias, agency_id in aliases:
+            at = position.get(agency_id)
+            if at is None or not alias_norm:
+                continue
+            names.append((alias_norm, at, alias or alias_norm))
+            words = alias_norm.split()
+            for start in range(1, len(words)):
+                tails.append((" ".join(words[start:]), at, alias or alias_norm))
+        names.sort()
+        tails.sort()
+        self._arrays = (
+            ([k for k, _, _ in names], [(at, alias) for _, at, alias in names]),
+            ([k for k, _, _ in tails], [(at, alias) for _, at, alias in tails]),
+        )
+        self._short = self._build_short_prefixes()
+
+    def __len__(self) -> int:
+        return len(self.agencies)
+
+    def _rank(self, kind: int, key: str, at: int) -> Tuple[int, int, int]:
+        return (kind, -self._popularity[at], len(key))
+
+    def _build_short_prefixes(self) -> Dict[str, List[Tuple[int, str]]]:
+        """Best MAX_SUGGESTIONS distinct agencies for every prefix of up to SHORT_PREFIX_CHARS"""
+        candidates: Dict[str, List[Tuple[Tuple[int, int, int], int, str]]] = {}
+        for kind, (keys, refs) in enumerate(self._arrays):
+            for key, (at, alias) in zip(keys, refs):
+                for n in range(MIN_PREFIX_CHARS, min(len(key), SHORT_PREFIX_CHARS) + 1):
+                    candidates.setdefault(key[:n], []).append((self._rank(kind, key, at), at, alias))
+        return {prefix: self._best(found, MAX_SUGGESTIONS) for prefix, found in candidates.items()}
+
+    @staticmethod
+    def _best(found: List[Tuple[Tuple[int, int, int], int, str]], limit: int) -> List[Tuple[int, str]]:
+        """Top entries by rank, one per agency"""
+        found.sort(key=lambda entry: entry[0])
+        best: List[Tuple[int, str]] = []
+        seen = set()
+        for _, at, alias in found:
+            if at not in seen:
+                seen.add(at)
+                best.append((at, alias))
+                if len(best) == limit:
+                    break
+        return best
+
+    def suggest(self, prefix: str, limit: int = DEFAULT_SUGGESTIONS) -> List[Suggestion]:
+        """Agencies with a name (or a later word of one) starting with prefix, best first"""
+        q = normalize_text(prefix)
+        limit = max(0, min(limit, MAX_SUGGESTIONS))
+        if len(q) < MIN_PREFIX_CHARS or not limit:
+            return []
+        if len(q) <= SHORT_PREFIX_CHARS:
+            best = self._short.get(q, [])[:limit]
+        else:
+            found = []
+            for kind, (keys, refs) in enumerate(self._arrays):
+                i = bisect_left(keys, q)
+                end = min(len(keys), i + MAX_SCAN)
+                while i < end and keys[i].startswith(q):
+                    at, alias = refs[i]
+                    found.append((self._rank(kind, keys[i], at), at, alias))
+                    i += 1
+            best = self._best(found, limit)
+        return [Suggestion(self.agencies[at][0], alias, *self.agencies[at][1:-1]) for at, alias in best]
+
+
+# ---------------- Loading ----------------
+def load_name_index(backend: StorageBackend, signature: Optional[object] = None) -> NameIndex:
+    """Read the agency and agency_alias tables through the backend's pool"""
+    started = time.perf_counter()
+    with backend.engine.connect() as conn:
+        agencies = [tuple(row) for row in conn.execute(text("""
+            SELECT agency_id, hajj_company_en, hajj_company_ar, city, country, "المدينة", "الدولة",
+                   is_authorized, review_count
+            FROM agency
+            ORDER BY row_id
+        """))]
+        aliases = [tuple(row) for row in conn.execute(text("SELECT alias_norm, alias, agency_id FROM agency_alias"))]
+    index = NameIndex(agencies, aliases, signature)
+    logger.info(
+        f"🔤 Loaded name index: {len(aliases)} names of {len(agencies)} agencies in {time.perf_counter() - started:.3f}s"
+    )
+    return index
+
+
+def store_signature(backend: StorageBackend) -> Optional[object]:
+    """Changes when the index must be rebuilt: the file identity, or a time bucket for a remote store"""
+    if backend.local_path is not None:
+        return file_signature(backend.local_path)
+    return int(time.time() // REMOTE_RELOAD_SECONDS)
+
+
+def get_name_index(backend: StorageBackend) -> NameIndex:
+    """Process-wide name index of a store, rebuilt when the store changes"""
+    signature = store_signature(backend)
+    with _lock:
+        cached = _indexes.get(backend.cache_namespace)
+        if cached is not None and cached.signature == signature:
+            return cached
+        if cached is not None:
+            logger.info(f"♻️ Agency names changed, rebuilding name index for {backend}")
+        index = load_name_index(backend, signature)
+        _indexes[backend.cache_namespace] = index
+        return index
+
+
+def suggest(prefix: str, limit: int = DEFAULT_SUGGESTIONS,
+            backend: Optional[StorageBackend] = None) -> List[Suggestion]:
+    """
+    Type-ahead agency suggestions for prefix (Arabic, Urdu or English)
+
+    Uses the configured store when no backend is given; [] when the store has
+    no agency tables yet or cannot be read.
+    """
+    if len(normalize_text(prefix)) < MIN_PREFIX_CHARS:
+        return []
+    try:
+        backend = backend or get_backend()
+        if backend.schema_version < 6:
+            return []
+        return get_name_index(backend).suggest(prefix, limit)
+    except Exception as e:
+        logger.warning(f"Agency suggestions unavailable: {e}")
+        return []
+
+
+def clear_indexes() -> None:
+    with _lock:
+        _indexes.clear()
@@ -0,0 +1,442 @@
+"""
+Storage Backend Module
+Pluggable agency stores: a local SQLite file or a shared, pooled PostgreSQL database
+
+Usage:
+    python -m core.backend                                   # health of the configured store
+    HAJJ_DATABASE_URL=postgresql://host/hajj python -m core.backend
+"""
+
+import os
+import json
+import time
+import sqlite3
+import argparse
+import logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Column, Float, BigInteger, Index, MetaData, Table, Text, text
+from sqlalchemy.engine import Connection, Engine, make_url
+
+from core import schema
+from core.engine import create_postgres_engine, get_engine, get_postgres_engine, pool_metrics, pool_status
+from core.query_budget import QueryBudget, QueryBudgetExceeded, check_plan, execution_limits
+
+logger = logging.getLogger(__name__)
+
+# Set on every app node to share one PostgreSQL store instead of the local file
+DATABASE_URL_ENV = "HAJJ_DATABASE_URL"
+
+# Tables copied from a built SQLite file into PostgreSQL by publish()
+PUBLISHED_TABLES = ("agencies", "agency", "agency_alias", "agency_stats", "agency_stats_breakdown")
+
+# Columns given a pg_trgm GIN index, so fuzzy LIKE '%term%' lookups avoid a scan
+TRIGRAM_COLUMNS = {
+    "agencies": schema.SEARCH_COLUMNS,
+    "agency_alias": ["alias_norm"],
+}
+
+# Schema level the published tables provide (normalized columns, stats, ratings, entities);
+# the change log (v7) and the R*Tree location index (v8) stay SQLite-only
+POSTGRES_SCHEMA_VERSION = 6
+
+# SQLSTATE of a statement cancelled by statement_timeout
+QUERY_CANCELED = "57014"
+
+PUBLISH_BATCH_SIZE = 1000
+
+# Result columns of a fuzzy search, from the canonical agency table aliased e
+_SEARCH_RESULT_COLUMNS = """e.agency_id,
+                e.hajj_company_en, e.hajj_company_ar, e.formatted_address,
+                e.city, e.country, e."المدينة", e."الدولة",
+                e.email, e.contact_info AS "contact_Info", e.rating_reviews, e.is_authorized, e.google_maps_link"""
+
+
+class StorageBackend(ABC):
+    """
+    Where DatabaseManager reads agencies from
+
+    A backend owns the pooled engine, reports the schema level its tables
+    provide, enforces query budgets and supplies the dialect-specific fuzzy
+    search. Everything else DatabaseManager runs is portable SQL.
+    """
+
+    name = "base"
+
+    def __init__(self, cache_namespace: str, local_path: Optional[str] = None):
+        # Key under which the shared query cache files this store's results
+        self.cache_namespace = cache_namespace
+        # SQLite file behind the store, for the features that read it directly
+        # (agency snapshot, change feed); None for a remote store
+        self.local_path = local_path
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.cache_namespace!r})"
+
+    @property
+    @abstractmethod
+    def engine(self) -> Engine:
+        """Pooled engine of the store"""
+
+    @property
+    @abstractmethod
+    def schema_version(self) -> int:
+        """Schema level the store's tables provide (see core.schema)"""
+
+    @abstractmethod
+    def limits(self, conn: Connection, sql: str, params: Optional[Dict],
+               budget: Optional[QueryBudget]) -> ContextManager[None]:
+        """Apply budget to the next statement run on conn (no-op without a budget)"""
+
+    @abstractmethod
+    def search_query(self, term: str, entities: bool) -> Tuple[str, Dict[str, Any]]:
+        """Fuzzy substring search over names and places, name hits ranked first"""
+
+    # ---------------- Health & Metrics ----------------
+    def health_check(self) -> Dict[str, Any]:
+        """
+        Round trip through the pool plus a read of the agency tables
+
+        Returns:
+            {"backend", "ok", "latency_ms", "error", ...backend details}; never raises
+        """
+        report: Dict[str, Any] = {"backend": self.name, "ok": False, "latency_ms": None, "error": None}
+        started = time.perf_counter()
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT 1")).scalar()
+                report["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+                report.update(self._probe(conn))
+            report["ok"] = True
+        except Exception as e:
+            report["error"] = str(e)
+            logger.warning(f"🩺 Health check failed for {self}: {e}")
+        return report
+
+    def _probe(self, conn: Connection) -> Dict[str, Any]:
+        return {"agencies": int(conn.execute(text("SELECT COUNT(*) FROM agencies")).scalar())}
+
+    def pool_metrics(self) -> Dict[str, int]:
+        """Occupancy and lifetime counters of this store's connection pool"""
+        return pool_metrics(self.engine)
+
+    def pool_status(self) -> Dict[str, str]:
+        return {"default": self.engine.pool.status()}
+
+
+# ---------------- SQLite ----------------
+class SQLiteBackend(StorageBackend):
+    """
+    The agencies database file on this node, read at the schema version core.ingest
+    left it at (never migrated here, so serving never rewrites the file)
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path: str = "hajj_companies.db", engine_profile: Optional[Dict[str, Any]] = None):
+        super().__init__(db_path, local_path=db_path)
+        self.db_path = db_path
+        self.engine_profile = engine_profile
+        self._schema_version = schema.current_version(db_path)
+        if self._schema_version < schema.SCHEMA_VERSION:
+            logger.warning(
+                f"⚠️ {db_path} is at schema version {self._schema_version} of {schema.SCHEMA_VERSION}: "
+                f"serving it with the baseline queries (rebuild it with core.ingest)"
+            )
+
+    @property
+    def engine(self) -> Engine:
+        """Shared pooled engine for this file, recycled when the file changes"""
+        return get_engine(self.db_path, self.engine_profile)
+
+    @property
+    def schema_version(self) -> int:
+        return self._schema_version
+
+    @contextmanager
+    def limits(self, conn: Connection, sql: str, params: Optional[Dict],
+               budget: Optional[QueryBudget]) -> Iterator[None]:
+        """Reject unbounded plans, then limit the statement's VM steps and run time"""
+        if budget is None:
+            yield
+            return
+        check_plan(conn, sql, params)
+        with execution_limits(conn.connection.dbapi_connection, budget):
+            yield
+
+    def search_query(self, term: str, entities: bool) -> Tuple[str, Dict[str, Any]]:
+        """Trigram FTS5 lookup, name hits weighted above location hits"""
+        params = {"match": '"' + term.replace('"', '""') + '"'}
+        if entities:
+            # Variant rows of one company collapse onto its entity, keeping the best score
+            # (bm25() cannot be aggregated directly, the rank column can)
+            return f"""
+            SELECT {_SEARCH_RESULT_COLUMNS}
+            FROM (
+                SELECT a.agency_id, MIN(agencies_fts.rank) AS score
+                FROM agencies_fts
+                JOIN agencies a ON a.id = agencies_fts.rowid
+                WHERE agencies_fts MATCH :match
+                  AND agencies_fts.rank MATCH 'bm25(10.0, 10.0, 1.0, 1.0, 1.0, 1.0)'
+                GROUP BY a.agency_id
+            ) hits
+            JOIN agency e ON e.agency_id = hits.agency_id
+            ORDER BY hits.score
+            LIMIT 50
+            """, params
+        return """
+            SELECT DISTINCT
+                a.hajj_company_en, a.hajj_company_ar, a.formatted_address,
+                a.city, a.country, a."المدينة", a."الدولة",
+                a.email, a.contact_info AS "contact_Info", a.rating_reviews, a.is_authorized, a.google_maps_link
+            FROM agencies_fts
+            JOIN agencies a ON a.id = agencies_fts.rowid
+            WHERE agencies_fts MATCH :match
+            ORDER BY bm25(agencies_fts, 10.0, 10.0, 1.0, 1.0, 1.0, 1.0)
+            LIMIT 50
+            """, params
+
+    def _probe(self, conn: Connection) -> Dict[str, Any]:
+        return {**super()._probe(conn), "schema_version": self.schema_version}
+
+    def pool_status(self) -> Dict[str, str]:
+        return pool_status(self.db_path)
+
+
+# ---------------- PostgreSQL ----------------
+class PostgresBackend(StorageBackend):
+    """
+    A PostgreSQL database holding the tables publish() copied from a built
+    SQLite file; any number of app nodes can read it through their own pools
+    """
+
+    name = "postgresql"
+
+    def __init__(self, url: str, engine_profile: Optional[Dict[str, Any]] = None):
+        super().__init__(make_url(url).render_as_string(hide_password=True))
+        self.url = url
+        self.engine_profile = engine_profile
+        self._schema_version: Optional[int] = None
+
+    @property
+    def engine(self) -> Engine:
+        return get_postgres_engine(self.url, self.engine_profile)
+
+    @property
+    def schema_version(self) -> int:
+        """Schema level of the published tables, read once (0 before the first publish)"""
+        if self._schema_version is None:
+            with self.engine.connect() as conn:
+                published = conn.execute(text(
+                    "SELECT value FROM agency_meta WHERE name = 'schema_version'"
+                )).scalar() if _has_relation(conn, "agency_meta") else None
+            self._schema_version = min(int(published or 0), POSTGRES_SCHEMA_VERSION)
+        return self._schema_version
+
+    @contextmanager
+    def limits(self, conn: Connection, sql: str, params: Optional[Dict],
+               budget: Optional[QueryBudget]) -> Iterator[None]:
+        """Server-side statement_timeout for the current transaction"""
+        if budget is None:
+            yield
+            return
+        conn.execute(text(f"SET LOCAL statement_timeout = {max(1, int(budget.timeout_seconds * 1000))}"))
+        try:
+            yield
+        except Exception as e:
+            orig = getattr(e, "orig", None)
+            if getattr(orig, "pgcode", None) == QUERY_CANCELED or getattr(orig, "sqlstate", None) == QUERY_CANCELED:
+                logger.warning(f"⏱️ Query cancelled after {budget.timeout_seconds}s: {e}")
+                raise QueryBudgetExceeded("Query exceeded its execution budget") from e
+            raise
+
+    def search_query(self, term: str, entities: bool) -> Tuple[str, Dict[str, Any]]:
+        """
+        Substring match served by the pg_trgm GIN indexes, ranked by trigram
+        similarity with name hits weighted like the SQLite bm25 ranking
+        (published tables always carry entities, so entities is ignored)
+        """
+        names = ", ".join(f"similarity(a.{c}, :term)" for c in schema.SEARCH_COLUMNS[:2])
+        places = ", ".join(f"similarity(a.{c}, :term)" for c in schema.SEARCH_COLUMNS[2:])
+        matches = " OR ".join(f"a.{c} LIKE :pattern" for c in schema.SEARCH_COLUMNS)
+        escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return f"""
+            SELECT {_SEARCH_RESULT_COLUMNS}
+            FROM (
+                SELECT a.agency_id,
+                       MAX(10 * COALESCE(GREATEST({names}), 0) + COALESCE(GREATEST({places}), 0)) AS score
+                FROM agencies a
+                WHERE {matches}
+                GROUP BY a.agency_id
+            ) hits
+            JOIN agency e ON e.agency_id = hits.agency_id
+            ORDER BY hits.score DESC
+            LIMIT 50
+            """, {"term": term, "pattern": f"%{escaped}%"}
+
+    def _probe(self, conn: Connection) -> Dict[str, Any]:
+        trigrams = conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar()
+        published_at = conn.execute(text(
+            "SELECT value FROM agency_meta WHERE name = 'published_at'"
+        )).scalar() if _has_relation(conn, "agency_meta") else None
+        return {
+            **super()._probe(conn),
+            "schema_version": self.schema_version,
+            "pg_trgm": bool(trigrams),
+            "published_at": published_at,
+        }
+
+    def publish(self, db_path: str) -> Dict[str, int]:
+        """
+        Replace the published tables with those of the SQLite file at db_path,
+        in one transaction (readers keep seeing the previous copy until commit)
+
+        Returns:
+            Rows copied per table
+        """
+        engine = create_postgres_engine(self.url, {"read_only": False, "pool_size": 1, "max_overflow": 0})
+        try:
+            with engine.begin() as conn:
+                counts = publish_tables(db_path, conn)
+        finally:
+            engine.dispose()
+        self._schema_version = None
+        return counts
+
+
+def _has_relation(conn: Connection, name: str) -> bool:
+    return conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+
+
+# ---------------- Publishing ----------------
+def _column_type(declared: str):
+    """SQLAlchemy type for a declared SQLite column type (BOOLEAN columns hold 'Yes'/'No')"""
+    declared = (declared or "").upper()
+    if "INT" in declared:
+        return BigInteger
+    if any(t in declared for t in ("REAL", "FLOA", "DOUB")):
+        return Float
+    return Text
+
+
+def published_tables(source: sqlite3.Connection, metadata: MetaData) -> List[Table]:
+    """
+    Portable definitions of the PUBLISHED_TABLES present in source, with the
+    same keys and secondary indexes, plus trigram indexes for fuzzy search.
+    Columns are keyed c0, c1, ... so Arabic names never become bind parameter names
+    """
+    tables = []
+    for name in PUBLISHED_TABLES:
+        if not schema.has_table(source, name):
+            continue
+        info = source.execute(f"PRAGMA table_info({name})").fetchall()
+        columns = [
+            Column(column, _column_type(declared), key=f"c{cid}", primary_key=pk > 0,
+                   nullable=not (notnull or pk), autoincrement=False)
+            for cid, column, declared, notnull, _, pk in info
+        ]
+        table = Table(name, metadata, *columns)
+        by_name = {column.name: column for column in table.columns}
+        for _, index_name, unique, origin, _ in source.execute(f"PRAGMA index_list({name})").fetchall():
+            if origin != "c":
+                continue  # primary key and UNIQUE constraints come with the table
+            indexed = [row[2] for row in source.execute(f'PRAGMA index_info("{index_name}")')]
+            if all(column in by_name for column in indexed):
+                Index(index_name, *(by_name[column] for column in indexed), unique=bool(unique))
+        for column in TRIGRAM_COLUMNS.get(name, ()):
+            if column in by_name:
+                Index(f"idx_{name}_{column}_trgm", by_name[column],
+                      postgresql_using="gin", postgresql_ops={by_name[column].key: "gin_trgm_ops"})
+        tables.append(table)
+    return tables
+
+
+def publish_tables(db_path: str, conn: Connection) -> Dict[str, int]:
+    """
+    (Re)create the published tables on conn and copy db_path's rows into them.
+    Runs in the caller's transaction; works on any SQLAlchemy dialect, adding
+    the pg_trgm extension on PostgreSQL
+    """
+    version = schema.current_version(db_path)
+    if version < POSTGRES_SCHEMA_VERSION:
+        raise ValueError(
+            f"{db_path} is at schema version {version}, publishing needs {POSTGRES_SCHEMA_VERSION} "
+            f"(rebuild it with core.ingest first)"
+        )
+    started = time.perf_counter()
+    source = sqlite3.connect(schema.file_uri(db_path), uri=True)
+    try:
+        metadata = MetaData()
+        tables = published_tables(source, metadata)
+        meta = Table(
+            "agency_meta", metadata,
+            Column("name", Text, primary_key=True),
+            Column("value", Text),
+        )
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        metadata.drop_all(conn)
+        metadata.create_all(conn)
+        counts: Dict[str, int] = {}
+        for table in tables:
+            keys = [column.key for column in table.columns]
+            names = ", ".join(f'"{column.name}"' for column in table.columns)
+            cursor = source.execute(f"SELECT {names} FROM {table.name}")
+            counts[table.name] = 0
+            while True:
+                batch = cursor.fetchmany(PUBLISH_BATCH_SIZE)
+                if not batch:
+                    break
+                conn.execute(table.insert(), [dict(zip(keys, row)) for row in batch])
+                counts[table.name] += len(batch)
+        conn.execute(meta.insert(), [
+            {"name": "schema_version", "value": str(version)},
+            {"name": "published_at", "value": datetime.now(timezone.utc).isoformat(timespec="seconds")},
+            {"name": "source", "value": os.path.basename(db_path)},
+        ])
+    finally:
+        source.close()
+    logger.info(
+        f"📤 Published {counts.get('agency', 0)} agencies ({sum(counts.values())} rows) "
+        f"in {time.perf_counter() - started:.3f}s"
+    )
+    return counts
+
+
+# ---------------- Selection ----------------
+def get_backend(db_path: str = "hajj_companies.db", engine_profile: Optional[Dict[str, Any]] = None,
+                url: Optional[str] = None) -> StorageBackend:
+    """
+    Backend for url, else for $HAJJ_DATABASE_URL, else the SQLite file at db_path
+    (a sqlite:/// URL also selects a local file)
+    """
+    url = url or os.environ.get(DATABASE_URL_ENV)
+    if not url:
+        return SQLiteBackend(db_path, engine_profile)
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        return SQLiteBackend(parsed.database or db_path, engine_profile)
+    if parsed.get_backend_name() == "postgresql":
+        return PostgresBackend(url, engine_profile)
+    raise ValueError(f"Unsupported database URL: {parsed.render_as_string(hide_password=True)}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check the health of the agency store")
+    parser.add_argument("--db", default="hajj_companies.db", help="SQLite file when no URL is configured")
+    parser.add_argument("--url", help=f"database URL (default: ${DATABASE_URL_ENV})")
+    args = parser.parse_args(argv)
+
+    backend = get_backend(args.db, url=args.url)
+    report = backend.health_check()
+    if report["ok"]:
+        report["pool"] = backend.pool_metrics()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -5,30 +5,153 @@ Handles all database operations with proper security and error handling
 
 import streamlit as st
 import pandas as pd
-from sqlalchemy import create_engine, text
-from typing import Optional, Dict, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from typing import Any, FrozenSet, Iterator, List, Optional, Dict, Sequence, Set, Tuple
 import logging
+import re
+import json
+import base64
+from functools import partial
+
+from core.schema import read_changes
+from core.backend import StorageBackend, get_backend
+from core.query_cache import query_cache, make_key
+from core.query_budget import QueryBudget, apply_row_cap
+from core.snapshot import ORDER_RATING, RESULT_COLUMNS, get_snapshot, sort_order
+from core.agency_names import get_agency_names
+from core.autocomplete import DEFAULT_SUGGESTIONS, Suggestion, suggest
+from core.geo import PRECISION_CITY, PRECISION_DISTRICT, bounding_box, lookup_place
+from core.fact_cards import CARD_LANGUAGES, LOOKUP_WORDS, build_card
+from utils.normalization import normalize_text, normalize_company_name, contains_phrase
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Rows pulled from the cursor per fetchmany() call
+FETCH_BATCH_SIZE = 100
+
+
+class QueryResult:
+    """Column names plus row tuples: the pandas-free result of execute_rows"""
+
+    __slots__ = ("columns", "rows", "truncated", "next_cursor")
+
+    def __init__(self, columns: Sequence[str], rows: List[tuple], truncated: bool = False,
+                 next_cursor: Optional[str] = None):
+        self.columns = tuple(columns)
+        self.rows = rows
+        # True when the query matched more rows than were fetched
+        self.truncated = truncated
+        # Cursor for DatabaseManager.fetch_page when this is one page of a list
+        self.next_cursor = next_cursor
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __iter__(self) -> Iterator[tuple]:
+        return iter(self.rows)
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Rows as dicts keyed by column name (the shape graph state carries)"""
+        columns = self.columns
+        return [dict(zip(columns, row)) for row in self.rows]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """DataFrame view, for callers that render a table"""
+        return pd.DataFrame.from_records(self.rows, columns=list(self.columns), coerce_float=True)
+
+
+# ---------------- SQL Prompt Schema ----------------
+def sql_prompt_schema(entity_ids: bool = True, ratings: bool = True, locations: bool = True) -> Dict[str, Any]:
+    """
+    What LLM-generated SQL may query, for the SQL prompts: the company table and
+    its columns, and whether the numeric rating columns and the location tables
+    (geo_place, agency_geo, distance_km(), normalize_text()) exist. The defaults
+    describe a fully migrated SQLite file
+    """
+    columns = [
+        "agency_id (stable company id, use it to refer back to one company)",
+        "row_id (INTEGER; a plain list of companies selects it and ends with ORDER BY row_id, so the answer can be paged)",
+    ] if entity_ids else []
+    columns += [
+        "hajj_company_ar", "hajj_company_en", "formatted_address", "city", "country", "email",
+        'contact_info (select it as contact_info AS "contact_Info", the key answers read)',
+        'rating_reviews (display text, e.g. "4.6 (5243 reviews)")',
+    ]
+    if ratings:
+        columns += ["rating (REAL 0-5, NULL when unrated)", "review_count (INTEGER, NULL when unrated)"]
+    columns += [
+        "is_authorized ('Yes' or 'No')", "google_maps_link",
+        '"المدينة" (city in Arabic - use this for Arabic queries)',
+        '"الدولة" (country in Arabic - use this for Arabic queries)',
+    ]
+    return {
+        "table": "agency" if entity_ids else "agencies",
+        "columns": columns,
+        "entity_ids": entity_ids,
+        "ratings": ratings,
+        "locations": locations,
+    }
+
+
 class DatabaseManager:
     """Manages database connections and queries with security"""
     
-    def __init__(self, db_path: str = "hajj_companies.db"):
-        """Initialize database connection"""
-        self.db_path = db_path
-        self.engine = self._create_engine()
-    
-    @st.cache_resource
-    def _create_engine(_self):
-        """Create and cache database engine"""
+    def __init__(self, db_path: str = "hajj_companies.db", engine_profile: Optional[Dict[str, Any]] = None,
+                 backend: Optional[StorageBackend] = None):
+        """
+        Initialize database connection
+
+        Args:
+            backend: Where agencies are read from; by default $HAJJ_DATABASE_URL
+                when set (a shared PostgreSQL store), else the SQLite file at db_path
+        """
         try:
-            return create_engine(f"sqlite:///{_self.db_path}")
+            self.backend = backend or get_backend(db_path, engine_profile)
+            self.schema_version = self.backend.schema_version
         except Exception as e:
             logger.error(f"Database connection failed: {e}")
             st.error(f"❌ Database connection failed: {e}")
             st.stop()
+        # Cache key of this store; the file path for SQLite
+        self.db_path = self.backend.cache_namespace
+        # Migration 3 adds the *_norm columns and the search index together
+        self.has_normalized_columns = self.has_search_index = self.schema_version >= 3
+        self.has_rating_columns = self.schema_version >= 5
+        # One row per company in the agency table, so lookups need no DISTINCT
+        self.has_entities = self.schema_version >= 6
+        self.entity_table = "agency" if self.has_entities else "agencies"
+        self.has_change_log = self.schema_version >= 7
+        self.has_locations = self.schema_version >= 8
+        # The columnar snapshot is loaded straight from a local SQLite file
+        self.has_snapshot = self.has_entities and self.backend.local_path is not None
+        if self.has_change_log:
+            # Delta syncs then keep cached results of agencies they did not touch
+            query_cache.set_change_feed(self.db_path, partial(read_changes, self.backend.local_path))
+        try:
+            self.engine
+        except Exception as e:
+            logger.error(f"Database connection failed: {e}")
+            st.error(f"❌ Database connection failed: {e}")
+            st.stop()
+
+    @property
+    def engine(self) -> Engine:
+        """Shared pooled engine of the backend (for SQLite, recycled when the file changes)"""
+        return self.backend.engine
+
+    def get_pool_status(self) -> Dict[str, str]:
+        """Connection pool occupancy of the shared engines for this database"""
+        return self.backend.pool_status()
+
+    def get_pool_metrics(self) -> Dict[str, int]:
+        """Pool occupancy plus connect/checkout/invalidation counters"""
+        return self.backend.pool_metrics()
+
+    def health_check(self) -> Dict[str, Any]:
+        """Round trip to the agency store; see StorageBackend.health_check"""
+        return self.backend.health_check()
     
     # ---------------- SQL Safety ----------------
     def sanitize_sql(self, sql_query: str) -> Optional[str]:
@@ -49,58 +172,288 @@ class DatabaseManager:
             return None
         return sql_query.strip().rstrip(';')
     
-    # ---------------- Execute Query ----------------
-    def execute_query(self, sql_query: str, params: Optional[Dict] = None) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    def _prepare_query(self, sql_query: str, budget: Optional[QueryBudget],
+                       row_cap: Optional[int] = None) -> Optional[str]:
+        """Validated SQL, row-capped by the budget and/or the caller's own cap"""
         safe_query = self.sanitize_sql(sql_query)
+        if safe_query and budget is not None:
+            row_cap = min(row_cap, budget.max_rows) if row_cap is not None else budget.max_rows
+        if safe_query and row_cap is not None:
+            safe_query = apply_row_cap(safe_query, row_cap)
+        return safe_query
+
+    # ---------------- Execute Query ----------------
+    def execute_query(self, sql_query: str, params: Optional[Dict] = None,
+                      budget: Optional[QueryBudget] = None) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+        """
+        Run a validated SELECT, serving repeats from the process-wide result cache.
+        Cached DataFrames are shared between callers and must be treated as read-only.
+        Pass a QueryBudget for SQL that did not come from this module (e.g. LLM output)
+        """
+        safe_query = self._prepare_query(sql_query, budget)
         if not safe_query:
             return None, "Query failed security validation"
+        cache_key = make_key(self.db_path, safe_query, params)
+        cached = query_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Query served from cache: {len(cached)} rows")
+            return cached, None
         try:
-            with self.engine.connect() as conn:
+            with self.engine.connect() as conn, self.backend.limits(conn, safe_query, params, budget):
                 df = pd.read_sql(text(safe_query), conn, params=params) if params else pd.read_sql(text(safe_query), conn)
                 logger.info(f"Query executed successfully: {len(df)} rows")
+                query_cache.put(cache_key, df)
                 return df, None
         except Exception as e:
             logger.error(f"Query execution failed: {e}")
             return None, str(e)
     
-    # ---------------- Database Stats ----------------
-    @st.cache_data(ttl=300)
-    def get_stats(_self) -> Dict[str, int]:
-        query = """
-        SELECT 
-            COUNT(DISTINCT hajj_company_en) as total,
-            COUNT(DISTINCT CASE WHEN is_authorized = 'Yes' THEN hajj_company_en END) as authorized,
-            COUNT(DISTINCT country) as countries,
-            COUNT(DISTINCT city) as cities,
-            COUNT(DISTINCT "الدولة") as countries_ar,
-            COUNT(DISTINCT "المدينة") as cities_ar
-        FROM agencies
+    def execute_rows(self, sql_query: str, params: Optional[Dict] = None,
+                     budget: Optional[QueryBudget] = None,
+                     max_rows: Optional[int] = None,
+                     agency_ids: Optional[FrozenSet[str]] = None) -> Tuple[Optional[QueryResult], Optional[str]]:
+        """
+        Same as execute_query but returns a QueryResult instead of a DataFrame.
+        Use this on the per-turn path where rows are only read, not rendered
+
+        Args:
+            max_rows: Rows the caller will actually use. Pushed down as a LIMIT and
+                fetched in batches; result.truncated tells whether more rows matched
+            agency_ids: The only agencies the result depends on, if known. The cached
+                result then survives delta syncs that change other agencies
         """
+        # One probe row past max_rows tells whether the result was cut short
+        safe_query = self._prepare_query(sql_query, budget, max_rows + 1 if max_rows is not None else None)
+        if not safe_query:
+            return None, "Query failed security validation"
+        cache_key = make_key(self.db_path, safe_query, params, kind="rows")
+        cached = query_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Query served from cache: {len(cached)} rows")
+            return cached, None
         try:
-            with _self.engine.connect() as conn:
-                result = pd.read_sql(text(query), conn).iloc[0]
-                return {
-                    'total': int(result['total']),
-                    'authorized': int(result['authorized']),
-                    'countries': int(result['countries']),
-                    'cities': int(result['cities']),
-                    'countries_ar': int(result['countries_ar']),
-                    'cities_ar': int(result['cities_ar'])
-                }
+            columns: Sequence[str] = ()
+            rows: List[tuple] = []
+            batch_size = min(FETCH_BATCH_SIZE, max_rows + 1) if max_rows is not None else FETCH_BATCH_SIZE
+            batches = self._iter_batches(safe_query, params, batch_size, budget)
+            try:
+                for batch in batches:
+                    columns = batch.columns
+                    rows.extend(batch.rows)
+                    if max_rows is not None and len(rows) > max_rows:
+                        break
+            finally:
+                batches.close()
+            truncated = max_rows is not None and len(rows) > max_rows
+            result = QueryResult(columns, rows[:max_rows] if truncated else rows, truncated)
+            logger.info(f"Query executed successfully: {len(result)} rows{' (truncated)' if truncated else ''}")
+            query_cache.put(cache_key, result, agency_ids)
+            return result, None
         except Exception as e:
-            logger.error(f"Failed to fetch stats: {e}")
-            return {'total':0,'authorized':0,'countries':0,'cities':0,'countries_ar':0,'cities_ar':0}
+            logger.error(f"Query execution failed: {e}")
+            return None, str(e)
+
+    def iter_batches(self, sql_query: str, params: Optional[Dict] = None,
+                     batch_size: int = FETCH_BATCH_SIZE,
+                     budget: Optional[QueryBudget] = None) -> Iterator[QueryResult]:
+        """
+        Stream a validated SELECT as QueryResult batches of up to batch_size rows
+        (the first batch may be empty)
+
+        The connection stays checked out until the generator is exhausted or closed,
+        so stop early with close() (or a with-block via contextlib.closing).
+        Results are not cached; errors are raised rather than returned.
+        """
+        safe_query = self._prepare_query(sql_query, budget)
+        if not safe_query:
+            raise ValueError("Query failed security validation")
+        return self._iter_batches(safe_query, params, batch_size, budget)
+
+    def _iter_batches(self, safe_query: str, params: Optional[Dict], batch_size: int,
+                      budget: Optional[QueryBudget]) -> Iterator[QueryResult]:
+        with self.engine.connect() as conn, self.backend.limits(conn, safe_query, params, budget):
+            cursor = conn.execute(text(safe_query), params or {})
+            columns = tuple(cursor.keys())
+            try:
+                # The first batch is always yielded (possibly empty) so columns are known
+                batch = cursor.fetchmany(batch_size)
+                yield QueryResult(columns, [tuple(row) for row in batch])
+                while len(batch) == batch_size:
+                    batch = cursor.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    yield QueryResult(columns, [tuple(row) for row in batch])
+            finally:
+                cursor.close()
+
+    def get_cache_stats(self) -> Dict[str, float]:
+        """Hit/miss counters of the shared query result cache"""
+        return query_cache.stats()
+
+    # ---------------- Database Stats ----------------
+    STATS_KEYS = ('total', 'authorized', 'countries', 'cities', 'countries_ar', 'cities_ar')
+
+    def get_stats(self) -> Dict[str, int]:
+        """Headline counts, read from the materialized agency_stats table when present"""
+        if self.schema_version >= 4:
+            query = "SELECT name, value FROM agency_stats"
+        else:
+            query = """
+            SELECT 'total' AS name, COUNT(DISTINCT hajj_company_en) AS value FROM agencies
+            UNION ALL SELECT 'authorized', COUNT(DISTINCT CASE WHEN is_authorized = 'Yes' THEN hajj_company_en END) FROM agencies
+            UNION ALL SELECT 'countries', COUNT(DISTINCT country) FROM agencies
+            UNION ALL SELECT 'cities', COUNT(DISTINCT city) FROM agencies
+            UNION ALL SELECT 'countries_ar', COUNT(DISTINCT "الدولة") FROM agencies
+            UNION ALL SELECT 'cities_ar', COUNT(DISTINCT "المدينة") FROM agencies
+            """
+        result, error = self.execute_rows(query)
+        if error:
+            logger.error(f"Failed to fetch stats: {error}")
+            return {key: 0 for key in self.STATS_KEYS}
+        values = dict(result.rows)
+        return {key: int(values.get(key) or 0) for key in self.STATS_KEYS}
+
+    def get_stats_breakdown(self, dimension: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Agency counts per value of a dimension (city, country, city_ar, country_ar, authorization),
+        largest first
+        """
+        if self.schema_version < 4:
+            return []
+        query = """
+        SELECT value, total, authorized FROM agency_stats_breakdown
+        WHERE dimension = :dimension
+        ORDER BY total DESC, value
+        """
+        params: Dict[str, Any] = {"dimension": dimension}
+        if limit:
+            query += " LIMIT :limit"
+            params["limit"] = int(limit)
+        result, error = self.execute_rows(query, params)
+        if error:
+            logger.error(f"Failed to fetch stats breakdown: {error}")
+            return []
+        return result.records()
+
+    # ---------------- SQL Prompt Schema ----------------
+    def get_sql_prompt_schema(self) -> Dict[str, Any]:
+        """
+        sql_prompt_schema of this store. The location tables need the SQL functions
+        only SQLite connections register (PostgreSQL publishes the schema 6 tables)
+        """
+        return sql_prompt_schema(self.has_entities, self.has_rating_columns,
+                                 self.has_locations and self.backend.name == "sqlite")
+
+    # ---------------- Agency Entities ----------------
+    def get_agency(self, agency_id: str) -> Optional[Dict[str, Any]]:
+        """
+        One company by its stable agency_id (as returned in lookup results), with the
+        name variants it was merged from under "aliases". None when unknown
+        """
+        if not self.has_entities or not agency_id:
+            return None
+        scope = frozenset([agency_id])
+        result, error = self.execute_rows(
+            "SELECT * FROM agency WHERE agency_id = :id", {"id": agency_id}, agency_ids=scope
+        )
+        if error or not result:
+            return None
+        agency = result.records()[0]
+        aliases, error = self.execute_rows(
+            "SELECT alias FROM agency_alias WHERE agency_id = :id ORDER BY alias_norm", {"id": agency_id},
+            agency_ids=scope,
+        )
+        agency["aliases"] = [row[0] for row in aliases.rows] if not error else []
+        return agency
+
+    def get_fact_card(self, agency_id: str, language: Optional[str] = None) -> Optional[Dict[str, Dict[str, str]]]:
+        """
+        Answer card of one company (language → field → markdown line, see
+        core.fact_cards), rendered from its agency row in language, or in every
+        language when none is given. None when unknown
+        """
+        if not self.has_entities or not agency_id:
+            return None
+        result, error = self.execute_rows(
+            "SELECT * FROM agency WHERE agency_id = :id", {"id": agency_id}, agency_ids=frozenset([agency_id])
+        )
+        if error or not result:
+            return None
+        agency = result.records()[0]
+        languages = [language] if language in CARD_LANGUAGES else CARD_LANGUAGES
+        return {lang: build_card(agency, lang) for lang in languages}
+
+    def suggest_agencies(self, prefix: str, limit: int = DEFAULT_SUGGESTIONS) -> List[Suggestion]:
+        """Type-ahead agency names for a partially typed prefix, from the process-wide name index"""
+        if not self.has_entities:
+            return []
+        return suggest(prefix, limit, backend=self.backend)
+
+    # Least rapidfuzz token_set_ratio of a misspelt name to the agency name it stands for
+    MISSPELT_NAME_SCORE = 80
+
+    def shortlist_agencies(self, name: str) -> Set[str]:
+        """
+        Agencies (ids) among whose names the ones sharing the most character
+        trigrams with name are, from the process-wide agency name index; the
+        fuzzy scorers then only need to re-rank these
+        """
+        if not self.has_entities:
+            return set()
+        names = get_agency_names(self.backend)
+        return {names.agency_ids[i] for i in names.matrix.shortlist(normalize_text(name))} - {None}
+
+    def match_misspelt_agencies(self, name: str, limit: int = 10) -> List[str]:
+        """Agency ids whose name name misspells (best first): the trigram shortlist re-ranked by rapidfuzz"""
+        if not self.has_entities:
+            return []
+        term = normalize_text(name)
+        names = get_agency_names(self.backend)
+        matrix = names.matrix
+        scores = matrix.token_set_scores(term, self.MISSPELT_NAME_SCORE, matrix.shortlist(term))
+        matches = matrix.top(scores, self.MISSPELT_NAME_SCORE, limit)
+        return list(dict.fromkeys(names.agency_ids[i] for _, _, i in matches if names.agency_ids[i]))
 
     # ---------------- Heuristic Query ----------------
     def get_heuristic_query(self, question: str) -> Tuple[Optional[str], Optional[Dict]]:
         q = question.lower().strip()
+        # Proximity ("authorized agencies near Al Aziziyah", "within 3 km of Ajyad")
+        if self.has_locations:
+            sql, params = self._get_proximity_query(q)
+            if sql:
+                return sql, params
+        # Ranking ("top rated agencies in Jeddah", "more than 100 reviews")
+        if self.has_rating_columns:
+            sql, params = self._get_rating_query(q)
+            if sql:
+                return sql, params
         if len(q.split()) <= 6 and not any(w in q for w in ["all", "list", "show", "count", "how many"]):
+            if self.has_entities:
+                return (
+                    """
+                    SELECT agency_id,
+                        hajj_company_en, hajj_company_ar, formatted_address,
+                        city, country, "المدينة", "الدولة",
+                        email, contact_info AS "contact_Info", rating_reviews, is_authorized,
+                        google_maps_link
+                    FROM agency
+                    WHERE agency_id IN (SELECT agency_id FROM agency_alias WHERE alias_norm = :search)
+                       OR address_norm = :search
+                       OR city_norm = :search
+                       OR country_norm = :search
+                       OR city_ar_norm = :search
+                       OR country_ar_norm = :search
+                    LIMIT 50
+                    """,
+                    {"search": normalize_text(q)}
+                )
+            # Unmigrated file: the baseline query
             return (
                 """
                 SELECT DISTINCT 
                     hajj_company_en, hajj_company_ar, formatted_address, 
                     city, country, "المدينة", "الدولة",
-                    email, contact_Info, rating_reviews, is_authorized,
+                    email, contact_info AS "contact_Info", rating_reviews, is_authorized,
                     google_maps_link
                 FROM agencies
                 WHERE LOWER(hajj_company_en) = :search
@@ -114,14 +467,17 @@ class DatabaseManager:
                 """,
                 {"search": q}
             )
+        table = self.entity_table
+        # Lists of the agency table come in row_id order, so query_cursor can page them
+        order = " ORDER BY row_id" if self.has_entities else ""
         # Authorized agencies
         if "authorized" in q or "معتمدة" in q:
             if "not" in q or "غير" in q:
-                return "SELECT * FROM agencies WHERE is_authorized = 'No' LIMIT 100", None
-            return "SELECT * FROM agencies WHERE is_authorized = 'Yes' LIMIT 100", None
+                return f"SELECT * FROM {table} WHERE is_authorized = 'No'{order} LIMIT 100", None
+            return f"SELECT * FROM {table} WHERE is_authorized = 'Yes'{order} LIMIT 100", None
         # Email queries
         if "email" in q:
-            return "SELECT * FROM agencies WHERE email IS NOT NULL AND email != '' LIMIT 100", None
+            return f"SELECT * FROM {table} WHERE email IS NOT NULL AND email != ''{order} LIMIT 100", None
         # Country queries
         if "country" in q or "countries" in q or "دول" in q:
             if "how many" in q or "كم" in q:
@@ -134,23 +490,506 @@ class DatabaseManager:
             return 'SELECT DISTINCT city, "المدينة" FROM agencies ORDER BY city LIMIT 25', None
         # Show all
         if any(word in q for word in ["all", "show", "list", "عرض", "قائمة"]):
-            return "SELECT * FROM agencies LIMIT 100", None
+            return f"SELECT * FROM {table}{order} LIMIT 100", None
         return None, None
 
+    RATING_TERMS = (
+        "top rated", "top-rated", "highest rated", "best rated", "best", "top", "highest rating", "most reviewed",
+        "أفضل", "افضل", "الأعلى تقييم", "الاعلى تقييم", "أعلى تقييم", "اعلى تقييم",
+        "بہترین", "سب سے اچھی", "ٹاپ",
+    )
+    _REVIEWS_OVER = re.compile(
+        r"(?:more than|over|at least|above|أكثر من|اكثر من|سے زیادہ)\s*(\d+)\s*(?:reviews?|مراجع|تقييم|ریویو)"
+    )
+    _PLACE = re.compile(r"(?:\bin\b|\bfrom\b|\bفي\b|\bفى\b)\s*([^?؟]+?)\s*[?؟]?$")
+
+    def _get_rating_query(self, q: str) -> Tuple[Optional[str], Optional[Dict]]:
+        """Top-N by rating/review count, optionally within one city or country"""
+        reviews_over = self._REVIEWS_OVER.search(q)
+        if not reviews_over and not any(contains_phrase(normalize_text(q), normalize_text(t)) for t in self.RATING_TERMS):
+            return None, None
+
+        conditions = ["rating IS NOT NULL"]
+        params: Dict[str, Any] = {}
+        if reviews_over:
+            conditions.append("review_count > :min_reviews")
+            params["min_reviews"] = int(reviews_over.group(1))
+        place = self._PLACE.search(q)
+        if place:
+            conditions.append(
+                "(city_norm = :place OR country_norm = :place OR city_ar_norm = :place OR country_ar_norm = :place)"
+            )
+            params["place"] = normalize_text(place.group(1))
+        where = " AND ".join(conditions)
+        entity_id = "agency_id, " if self.has_entities else ""
+        return (
+            f"""
+            SELECT {entity_id}hajj_company_en, hajj_company_ar, formatted_address,
+                   city, country, "المدينة", "الدولة",
+                   email, contact_info AS "contact_Info", rating_reviews, rating, review_count, is_authorized,
+                   google_maps_link
+            FROM {self.entity_table}
+            WHERE {where}
+            ORDER BY rating DESC, review_count DESC
+            LIMIT 10
+            """,
+            params,
+        )
+
+    # ---------------- Proximity ----------------
+    # Search radius when the question gives none, by the kind of place it names
+    NEAR_RADIUS_KM = {"district": 5.0, "city": 25.0}
+    # Radii tried in turn by find_nearby until enough agencies are found
+    NEAREST_RADII_KM = (2.0, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0)
+    _WITHIN = re.compile(
+        r"(?:within|في نطاق|خلال)\s*(\d+(?:\.\d+)?)\s*(?:km|kilometers?|كم|كيلو\w*)\s*(?:of|from|around|من|حول)?\s*([^?؟]+?)\s*[?؟]?$"
+    )
+    _NEAR = re.compile(
+        r"(?:\bnear(?:by)?\b|\baround\b|\bclose to\b|\bnext to\b|بالقرب من|قريب[ةه]? من|قرب)\s*([^?؟]+?)\s*[?؟]?$"
+    )
+    _NEAR_UR = re.compile(r"([^?؟]+?)\s*کے\s*(?:قریب|پاس)")
+
+    def _get_proximity_filters(self, q: str) -> Optional[Dict[str, Any]]:
+        """
+        find_nearby arguments for a question about agencies around a known place
+        ("authorized agencies near Al Aziziyah", "within 3 km of Ajyad"), else None
+        """
+        filters: Dict[str, Any] = {}
+        within = self._WITHIN.search(q)
+        if within:
+            filters["radius_km"], place_text = float(within.group(1)), within.group(2)
+        else:
+            near = self._NEAR.search(q) or self._NEAR_UR.search(q)
+            if not near:
+                return None
+            place_text = near.group(1)
+        place = lookup_place(place_text)
+        if place is None:
+            return None
+        filters["near"] = place_text.strip()
+        if any(t in q for t in ("not authorized", "unauthorized", "غير معتمد", "غير مرخص")):
+            filters["authorized"] = "No"
+        elif any(t in q for t in ("authorized", "licensed", "معتمد", "مرخص", "منظور شدہ")):
+            filters["authorized"] = "Yes"
+        return filters
+
+    def _get_proximity_query(self, q: str) -> Tuple[Optional[str], Optional[Dict]]:
+        """Agencies around a named place, nearest first, through the R*Tree"""
+        filters = self._get_proximity_filters(q)
+        if filters is None:
+            return None, None
+        place = lookup_place(filters["near"])
+        return self.nearby_query(
+            place.lat, place.lng, filters.get("radius_km") or self.NEAR_RADIUS_KM[place.kind],
+            limit=10, min_precision=place.precision, authorized=filters.get("authorized"),
+        )
+
+    def nearby_query(self, lat: float, lng: float, radius_km: float, limit: int = 10,
+                     min_precision: int = PRECISION_CITY,
+                     authorized: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        """
+        SQL for agencies within radius_km of a point, nearest first
+
+        The R*Tree bounding-box constraint narrows the candidates before the exact
+        distance is computed. Locations less precise than min_precision are left out
+        (a city-centroid guess says nothing about distances inside that city).
+        """
+        min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+        conditions = [
+            "g.min_lat <= :max_lat", "g.max_lat >= :min_lat",
+            "g.min_lng <= :max_lng", "g.max_lng >= :min_lng",
+            "g.precision >= :min_precision",
+        ]
+        params: Dict[str, Any] = {
+            "lat": lat, "lng": lng, "radius_km": radius_km, "min_precision": int(min_precision),
+            "min_lat": min_lat, "max_lat": max_lat, "min_lng": min_lng, "max_lng": max_lng,
+            "limit": int(limit),
+        }
+        if authorized:
+            conditions.append("e.is_authorized = :authorized")
+            params["authorized"] = authorized
+        where = " AND ".join(conditions)
+        return (
+            f"""
+            SELECT * FROM (
+                SELECT e.agency_id, e.hajj_company_en, e.hajj_company_ar, e.formatted_address,
+                       e.city, e.country, e."المدينة", e."الدولة",
+                       e.email, e.contact_info AS "contact_Info", e.rating_reviews, e.is_authorized, e.google_maps_link,
+                       g.lat, g.lng, g.precision AS location_precision,
+                       ROUND(distance_km(g.lat, g.lng, :lat, :lng), 2) AS distance_km
+                FROM agency_geo g
+                JOIN agency e ON e.row_id = g.id
+                WHERE {where}
+            )
+            WHERE distance_km <= :radius_km
+            ORDER BY distance_km, location_precision DESC
+            LIMIT :limit
+            """,
+            params,
+        )
+
+    def find_nearby(self, place: Optional[str] = None, lat: Optional[float] = None, lng: Optional[float] = None,
+                    radius_km: Optional[float] = None, limit: int = 10,
+                    authorized: Optional[str] = None) -> Tuple[Optional[QueryResult], Optional[str]]:
+        """
+        Agencies near a place name ("Al Aziziyah", "العزيزية") or a lat/lng point
+
+        With radius_km, every agency within it (up to limit); without, the limit
+        nearest ones, searching outwards ring by ring. Rows carry distance_km.
+        """
+        if not self.has_locations:
+            return None, "Location index unavailable"
+        min_precision = PRECISION_DISTRICT
+        if place is not None:
+            resolved = lookup_place(place)
+            if resolved is None:
+                return None, f"Unknown place: {place}"
+            lat, lng, min_precision = resolved.lat, resolved.lng, resolved.precision
+        if lat is None or lng is None:
+            return None, "A place or a lat/lng point is required"
+        radii = (radius_km,) if radius_km else self.NEAREST_RADII_KM
+        result, error = None, None
+        for radius in radii:
+            sql, params = self.nearby_query(lat, lng, radius, limit, min_precision, authorized)
+            result, error = self.execute_rows(sql, params)
+            if error or len(result) >= limit:
+                break
+        return result, error
+
+    # ---------------- Structured Query ----------------
+    # Words that only say "list agencies" (normalized); any other word left over
+    # means the question is not fully described by the slots below
+    STRUCTURED_FILLER = frozenset({
+        "show", "list", "all", "every", "display", "give", "get", "find", "me", "please",
+        "which", "what", "are", "is", "there", "the", "a", "an", "of", "with", "that", "have", "has",
+        "in", "from", "based", "located", "hajj", "umrah",
+        "agencies", "agency", "companies", "company", "offices", "operators",
+        "عرض", "اعرض", "قائمه", "كل", "جميع", "ما", "هي", "في", "من", "لي", "الحج", "حج",
+        "الشركات", "شركات", "الوكالات", "وكالات",
+    })
+    # Words that make a bare filter a listing request (so "email?" alone stays a follow-up)
+    STRUCTURED_SUBJECTS = frozenset({
+        "show", "list", "all", "display", "agencies", "companies", "offices", "operators",
+        "عرض", "اعرض", "قائمه", "جميع", "الشركات", "شركات", "الوكالات", "وكالات",
+    })
+    STRUCTURED_PHRASES = (
+        ("count", True, ("how many", "number of", "count", "كم عدد", "عدد", "كم")),
+        ("authorized", "No", ("not authorized", "unauthorized", "غير معتمده", "غير مرخصه")),
+        ("authorized", "Yes", ("authorized", "licensed", "معتمده", "المعتمده", "مرخصه")),
+        ("has_email", True, ("with email", "with an email", "email", "لديها بريد", "بريد", "ايميل")),
+    )
+    # Words a question about one named company may add to the name (its fact card
+    # answers it): lookup and listing words plus the card fields
+    NAME_QUESTION_WORDS = LOOKUP_WORDS | STRUCTURED_FILLER | frozenset(normalize_text(word) for word in (
+        "email", "mail", "phone", "number", "contact", "rating", "reviews", "address", "location",
+        "city", "country", "map", "maps", "link",
+        "بريد", "ايميل", "رقم", "هاتف", "تواصل", "تقييم", "عنوان", "موقع", "مدينه", "دوله", "خريطه", "رابط",
+        "ای", "میل", "فون", "نمبر", "رابطہ", "ریٹنگ", "پتہ", "شہر", "ملک", "نقشہ",
+    ))
+    _MIN_REVIEWS = re.compile(
+        r"(?:%s)\s*(\d+)\s*(?:%s)\w*" % (
+            "|".join(re.escape(normalize_text(t)) for t in ("more than", "over", "at least", "above", "أكثر من", "سے زیادہ")),
+            "|".join(re.escape(normalize_text(t)) for t in ("review", "مراجع", "تقييم", "ریویو")),
+        )
+    )
+
+    def get_structured_filters(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Slot-fill a question that is only a combination of known filters
+        (name or place, authorization, email, rating/review ranking, count)
+
+        Returns:
+            Filters for execute_structured, or None when any part of the question
+            is not understood (the LLM then writes the SQL)
+        """
+        # Agencies around a known place are answered by find_nearby
+        if self.has_locations:
+            nearby = self._get_proximity_filters(question.lower().strip())
+            if nearby:
+                return {**nearby, "limit": 10}
+        if not self.has_snapshot:
+            return None
+        snapshot = get_snapshot(self.backend.local_path)
+        q = normalize_text(question)
+        if snapshot is None or not q:
+            return None
+        # The whole question is a company name or a place, as in get_heuristic_query
+        if snapshot.has_name(q):
+            return {"name": q, "limit": 50}
+        if snapshot.has_place(q):
+            return {"place": q, "limit": 50}
+
+        filters: Dict[str, Any] = {}
+        text = f" {q} "
+        reviews = self._MIN_REVIEWS.search(text)
+        if reviews:
+            filters["min_reviews"] = int(reviews.group(1))
+            filters["top_rated"] = True
+            text = text[:reviews.start()] + " " + text[reviews.end():]
+        for term in self.RATING_TERMS:
+            phrase = f" {normalize_text(term)} "
+            if phrase in text:
+                filters["top_rated"] = True
+                text = text.replace(phrase, " ")
+        for key, value, terms in self.STRUCTURED_PHRASES:
+            for term in terms:
+                phrase = f" {normalize_text(term)} "
+                if phrase in text and key not in filters:
+                    filters[key] = value
+                    text = text.replace(phrase, " ")
+        words = text.split()
+        rest = [w for w in words if w not in self.STRUCTURED_FILLER]
+        if rest:
+            place = " ".join(rest)
+            if not snapshot.has_place(place):
+                return self._name_question(snapshot, q)
+            filters["place"] = place
+        listing = set(filters) - {"has_email", "authorized"} or any(w in self.STRUCTURED_SUBJECTS for w in words)
+        if not listing:
+            return self._name_question(snapshot, q)
+        filters["limit"] = 10 if filters.get("top_rated") else 100
+        return filters
+
+    def _name_question(self, snapshot, q: str) -> Optional[Dict[str, Any]]:
+        """
+        Name filter for a question about one company named inside it ("is X
+        authorized", "X email"): an exact mention, else the same name spelt in
+        another script or transliteration
+        """
+        words = q.split()
+        for mentions in (snapshot.find_names(q), snapshot.find_names_by_sound(q, self.NAME_QUESTION_WORDS)):
+            names = {name for _, _, name in mentions}
+            if len(names) != 1 or snapshot.has_place(next(iter(names))):
+                continue
+            covered = {i for start, end, _ in mentions for i in range(start, end)}
+            if all(w in self.NAME_QUESTION_WORDS for i, w in enumerate(words) if i not in covered):
+                return {"name": names.pop(), "limit": 50}
+        return None
+
+    def execute_structured(self, filters: Dict[str, Any],
+                           max_rows: Optional[int] = None) -> Tuple[Optional[QueryResult], Optional[str]]:
+        """
+        Answer get_structured_filters output from the in-memory agency snapshot
+        (no SQLite round trip); same result shape as execute_rows. Without a
+        snapshot, listings are answered by keyset SQL and counts are unavailable.
+        Proximity filters are answered by find_nearby
+        """
+        if filters.get("near"):
+            limit = filters.get("limit") or 10
+            return self.find_nearby(
+                filters["near"], radius_km=filters.get("radius_km"),
+                limit=min(limit, max_rows) if max_rows is not None else limit,
+                authorized=filters.get("authorized"),
+            )
+        snapshot = get_snapshot(self.backend.local_path) if self.has_snapshot else None
+        if snapshot is None:
+            if not self.has_entities or filters.get("count"):
+                return None, "Agency snapshot unavailable"
+            limit = filters.get("limit") or self.PAGE_SIZE
+            return self._keyset_page(filters, None, min(limit, max_rows) if max_rows is not None else limit)
+        try:
+            columns, rows, total, last_key = snapshot.select(filters, max_rows)
+        except Exception as e:
+            logger.error(f"Structured query failed: {e}")
+            return None, str(e)
+        truncated = total > len(rows) and max_rows is not None and len(rows) == max_rows
+        next_cursor = self.encode_cursor(filters, last_key) if last_key is not None else None
+        logger.info(f"Structured query answered from snapshot: {len(rows)} of {total} rows")
+        return QueryResult(columns, rows, truncated, next_cursor), None
+
+    # ---------------- Pagination ----------------
+    # Rows per page fetched by fetch_page
+    PAGE_SIZE = 20
+    # Structured filters a cursor carries (limit and count do not apply to paging)
+    PAGE_FILTERS = ("name", "place", "authorized", "has_email", "min_reviews", "top_rated")
+    # SQL whose rows come in row_id order (optionally capped), the order query_cursor pages by
+    _ROW_ID_ORDER = re.compile(r"\bORDER\s+BY\s+(?:\w+\.)?row_id(?:\s+ASC)?(?:\s+LIMIT\s+\d+)?\s*;?\s*$", re.IGNORECASE)
+    _TRAILING_LIMIT = re.compile(r"\s+LIMIT\s+\d+\s*;?\s*$", re.IGNORECASE)
+
+    def encode_cursor(self, filters: Dict[str, Any], key: Sequence) -> str:
+        """
+        Opaque cursor for the rows matching filters that sort after key
+        (the keyset of the last row shown). It carries everything the next
+        page needs, so paging never goes back to the question or the LLM
+        """
+        return self._encode_payload({
+            "f": {k: filters[k] for k in self.PAGE_FILTERS if filters.get(k) is not None},
+            "k": list(key),
+        })
+
+    def query_cursor(self, sql_query: str, params: Optional[Dict],
+                     result: QueryResult) -> Optional[str]:
+        """
+        Cursor for the rows after result, an execute_rows page of sql_query cut
+        at max_rows. Only SQL that selects row_id and ends ORDER BY row_id
+        (a list of the agency table, from get_heuristic_query or the LLM) can be
+        paged; None for anything else or when no rows were left out
+        """
+        if not (self.has_entities and result.truncated and result.rows and "row_id" in result.columns):
+            return None
+        if not self._ROW_ID_ORDER.search(sql_query.strip()):
+            return None
+        last_id = result.rows[-1][result.columns.index("row_id")]
+        if not isinstance(last_id, int):
+            return None
+        return self._encode_payload({"q": sql_query.strip().rstrip(";"), "p": params or {}, "k": [last_id]})
+
+    @staticmethod
+    def _encode_payload(payload: Dict[str, Any]) -> str:
+        raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def _decode_payload(cursor: str) -> Dict[str, Any]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            payload = json.loads(raw.decode("utf-8"))
+        except Exception as e:
+            raise ValueError(f"Invalid page cursor: {e}") from e
+        if not isinstance(payload, dict) or not isinstance(payload.get("k"), list):
+            raise ValueError("Invalid page cursor: bad keyset")
+        return payload
+
+    def decode_cursor(self, cursor: str) -> Tuple[Dict[str, Any], List]:
+        """(filters, keyset) of a cursor from encode_cursor; ValueError when malformed"""
+        payload = self._decode_payload(cursor)
+        filters, key = payload.get("f"), payload["k"]
+        if not isinstance(filters, dict) or set(filters) - set(self.PAGE_FILTERS):
+            raise ValueError("Invalid page cursor: unknown filters")
+        expected = 3 if sort_order(filters) == ORDER_RATING else 1
+        if not isinstance(key, list) or len(key) != expected or not all(isinstance(v, (int, float)) for v in key):
+            raise ValueError("Invalid page cursor: bad keyset")
+        return filters, key
+
+    def keyset_query(self, filters: Dict[str, Any], after: Optional[Sequence] = None,
+                     page_size: int = PAGE_SIZE) -> Tuple[str, Dict[str, Any]]:
+        """
+        SQL for the page of agencies matching filters that follows the keyset after,
+        in the snapshot's order (row_id, or rating, review count, row_id when
+        top_rated). The keyset predicate seeks past earlier rows instead of
+        scanning and discarding them as OFFSET would. Selects row_id last.
+        """
+        conditions: List[str] = []
+        params: Dict[str, Any] = {}
+        if filters.get("name") is not None:
+            conditions.append("agency_id IN (SELECT agency_id FROM agency_alias WHERE alias_norm = :name)")
+            params["name"] = filters["name"]
+        if filters.get("place") is not None:
+            conditions.append(
+                "(city_norm = :place OR country_norm = :place OR city_ar_norm = :place OR country_ar_norm = :place)"
+            )
+            params["place"] = filters["place"]
+        if filters.get("authorized") is not None:
+            conditions.append("is_authorized = :authorized")
+            params["authorized"] = filters["authorized"]
+        if filters.get("has_email"):
+            conditions.append("email IS NOT NULL AND email != ''")
+        if filters.get("min_reviews") is not None:
+            conditions.append("review_count > :min_reviews")
+            params["min_reviews"] = int(filters["min_reviews"])
+        if sort_order(filters) == ORDER_RATING:
+            # Missing review counts sort as -1, as in the snapshot
+            reviews = "COALESCE(review_count, -1)"
+            conditions.append("rating IS NOT NULL")
+            order_by = f"rating DESC, {reviews} DESC, row_id"
+            if after is not None:
+                conditions.append(
+                    f"rating <= :after_rating AND (rating < :after_rating OR {reviews} < :after_reviews"
+                    f" OR ({reviews} = :after_reviews AND row_id > :after_id))"
+                )
+                params.update(after_rating=float(after[0]), after_reviews=int(after[1]), after_id=int(after[2]))
+        else:
+            order_by = "row_id"
+            if after is not None:
+                conditions.append("row_id > :after_id")
+                params["after_id"] = int(after[0])
+        selected = ", ".join(
+            'contact_info AS "contact_Info"' if c == "contact_Info" else f'"{c}"' for c in RESULT_COLUMNS
+        )
+        where = " AND ".join(conditions) or "1 = 1"
+        return (
+            f"""
+            SELECT {selected}, row_id
+            FROM agency
+            WHERE {where}
+            ORDER BY {order_by}
+            LIMIT {int(page_size) + 1}
+            """,
+            params,
+        )
+
+    def fetch_page(self, cursor: str, page_size: int = PAGE_SIZE) -> Tuple[Optional[QueryResult], Optional[str]]:
+        """
+        The page of a list answer that follows cursor (from result.next_cursor)
+
+        Served from the agency snapshot when there is one, else with a keyset
+        query; either way earlier pages are not re-read. The result carries
+        next_cursor while more rows follow.
+        """
+        if not self.has_entities:
+            return None, "Pagination needs the agency table"
+        try:
+            if "q" in self._decode_payload(cursor):
+                return self._query_page(cursor, page_size)
+            filters, key = self.decode_cursor(cursor)
+        except ValueError as e:
+            return None, str(e)
+        snapshot = get_snapshot(self.backend.local_path) if self.has_snapshot else None
+        if snapshot is not None:
+            columns, rows, _, last_key = snapshot.select(filters, page_size, after=key)
+            next_cursor = self.encode_cursor(filters, last_key) if last_key is not None else None
+            logger.info(f"Page of {len(rows)} rows served from snapshot")
+            return QueryResult(columns, rows, next_cursor is not None, next_cursor), None
+
+        return self._keyset_page(filters, key, page_size)
+
+    def _keyset_page(self, filters: Dict[str, Any], key: Optional[Sequence],
+                     page_size: int) -> Tuple[Optional[QueryResult], Optional[str]]:
+        """One page through keyset_query, with the cursor of the page after it"""
+        sql, params = self.keyset_query(filters, key, page_size)
+        result, error = self.execute_rows(sql, params, max_rows=page_size)
+        if error:
+            return None, error
+        rows = [row[:-1] for row in result.rows]
+        next_cursor = None
+        if result.truncated and result.rows:
+            last = result.rows[-1]
+            values = dict(zip(result.columns, last))
+            if sort_order(filters) == ORDER_RATING:
+                reviews = values["review_count"]
+                last_key = (values["rating"], reviews if reviews is not None else -1, values["row_id"])
+            else:
+                last_key = (values["row_id"],)
+            next_cursor = self.encode_cursor(filters, last_key)
+        return QueryResult(result.columns[:-1], rows, result.truncated, next_cursor), None
+
+    def _query_page(self, cursor: str, page_size: int) -> Tuple[Optional[QueryResult], Optional[str]]:
+        """The next page of a query_cursor: its SQL again, seeking past the last row_id"""
+        payload = self._decode_payload(cursor)
+        sql_query, params, key = payload["q"], payload.get("p"), payload["k"]
+        if not isinstance(sql_query, str) or not isinstance(params, dict) or len(key) != 1 \
+                or not isinstance(key[0], int) or not self._ROW_ID_ORDER.search(sql_query):
+            raise ValueError("Invalid page cursor: bad query")
+        inner = self._TRAILING_LIMIT.sub("", sql_query)
+        paged = f"SELECT * FROM (\n{inner}\n) AS page WHERE row_id > :page_after_row_id ORDER BY row_id"
+        result, error = self.execute_rows(paged, {**params, "page_after_row_id": key[0]}, max_rows=page_size)
+        if error:
+            return None, error
+        next_cursor = self.query_cursor(sql_query, params, result)
+        return QueryResult(result.columns, result.rows, result.truncated, next_cursor), None
+
     # ---------------- Fuzzy Search ----------------
     def search_agency_fuzzy(self, search_term: str) -> pd.DataFrame:
-        original_term = search_term.strip().lower()
+        original_term = normalize_text(search_term)
         if len(original_term) < 2:
             return pd.DataFrame()
 
-        cleaned_term = (
-            original_term.replace("شركة","").replace("وكالة","").replace("مؤسسة","")
-            .replace("agency","").replace("travel","").strip()
-        )
+        cleaned_term = normalize_company_name(search_term)
 
         def _save_last_company(row, df_source: pd.DataFrame):
             st.session_state["last_company_name_ar"] = row.get("hajj_company_ar","")
             st.session_state["last_company_name_en"] = row.get("hajj_company_en","")
+            st.session_state["last_agency_id"] = row.get("agency_id")
             st.session_state["last_city"] = row.get("city","")
             st.session_state["last_country"] = row.get("country","")
             st.session_state["last_city_ar"] = row.get("المدينة","")
@@ -162,21 +1001,33 @@ class DatabaseManager:
             st.session_state["last_result_rows"] = df_source.to_dict(orient="records")
             st.session_state["last_intent"] = "DATABASE"
 
-        exact_query = """
-        SELECT DISTINCT 
-            hajj_company_en, hajj_company_ar, formatted_address,
-            city, country, "المدينة", "الدولة",
-            email, contact_Info, rating_reviews, is_authorized, google_maps_link
-        FROM agencies
-        WHERE LOWER(TRIM(hajj_company_en)) = LOWER(:term)
-           OR LOWER(TRIM(hajj_company_ar)) = LOWER(:term)
-        LIMIT 10
-        """
+        if self.has_entities:
+            exact_query = """
+            SELECT e.agency_id,
+                e.hajj_company_en, e.hajj_company_ar, e.formatted_address,
+                e.city, e.country, e."المدينة", e."الدولة",
+                e.email, e.contact_info AS "contact_Info", e.rating_reviews, e.is_authorized, e.google_maps_link
+            FROM agency_alias al
+            JOIN agency e ON e.agency_id = al.agency_id
+            WHERE al.alias_norm = :term
+            LIMIT 10
+            """
+        else:
+            exact_query = """
+            SELECT DISTINCT 
+                hajj_company_en, hajj_company_ar, formatted_address,
+                city, country, "المدينة", "الدولة",
+                email, contact_info AS "contact_Info", rating_reviews, is_authorized, google_maps_link
+            FROM agencies
+            WHERE LOWER(TRIM(hajj_company_en)) = LOWER(:term)
+               OR LOWER(TRIM(hajj_company_ar)) = LOWER(:term)
+            LIMIT 10
+            """
         fuzzy_query = """
         SELECT DISTINCT 
             hajj_company_en, hajj_company_ar, formatted_address,
             city, country, "المدينة", "الدولة",
-            email, contact_Info, rating_reviews, is_authorized, google_maps_link
+            email, contact_info AS "contact_Info", rating_reviews, is_authorized, google_maps_link
         FROM agencies
         WHERE LOWER(TRIM(hajj_company_en)) LIKE LOWER(:term)
            OR LOWER(TRIM(hajj_company_ar)) LIKE LOWER(:term)
@@ -186,7 +1037,6 @@ class DatabaseManager:
            OR LOWER("الدولة") LIKE LOWER(:term)
         LIMIT 50
         """
-
         # 1️⃣ Exact match
         df, _ = self.execute_query(exact_query, {"term": original_term})
         if isinstance(df, pd.DataFrame) and not df.empty:
@@ -200,11 +1050,32 @@ class DatabaseManager:
                 if len(df) == 1: _save_last_company(df.iloc[0], df)
                 return df
 
-        # 3️⃣ Fuzzy match
-        term_to_search = f"%{cleaned_term or original_term}%"
-        df, _ = self.execute_query(fuzzy_query, {"term": term_to_search})
+        # 3️⃣ Fuzzy match through the backend's trigram index (trigrams need at least 3 characters)
+        term = cleaned_term or original_term
+        if self.has_search_index and len(term) >= 3:
+            df, _ = self.execute_query(*self.backend.search_query(term, self.has_entities))
+        else:
+            df, _ = self.execute_query(fuzzy_query, {"term": f"%{term}%"})
         if isinstance(df, pd.DataFrame) and not df.empty:
             if len(df) == 1: _save_last_company(df.iloc[0], df)
             return df
 
+        # 4️⃣ Misspelt name (no substring match): trigram shortlist re-ranked by rapidfuzz
+        agency_ids = self.match_misspelt_agencies(term)
+        if agency_ids:
+            params = {f"id{i}": agency_id for i, agency_id in enumerate(agency_ids)}
+            df, _ = self.execute_query(f"""
+            SELECT e.agency_id,
+                e.hajj_company_en, e.hajj_company_ar, e.formatted_address,
+                e.city, e.country, e."المدينة", e."الدولة",
+                e.email, e.contact_info AS "contact_Info", e.rating_reviews, e.is_authorized, e.google_maps_link
+            FROM agency e
+            WHERE e.agency_id IN ({", ".join(f":{key}" for key in params)})
+            """, params)
+            if isinstance(df, pd.DataFrame) and not df.empty:
+                # Best match first
+                df = df.iloc[df["agency_id"].map(agency_ids.index).argsort()].reset_index(drop=True)
+                if len(df) == 1: _save_last_company(df.iloc[0], df)
+                return df
+
         return pd.DataFrame()
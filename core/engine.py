@@ -0,0 +1,256 @@
+"""
+Database Engine Module
+Process-wide pooled SQLAlchemy engines with tuned SQLite and PostgreSQL connection profiles
+"""
+
+import os
+import sqlite3
+import itertools
+import threading
+import logging
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from core.query_cache import file_signature
+from core.schema import file_uri, register_functions
+
+logger = logging.getLogger(__name__)
+
+
+def default_pool_size() -> int:
+    """Same sizing rule as ThreadPoolExecutor, which serves Streamlit's session threads"""
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+# Settings applied to every connection of an agencies engine
+DEFAULT_ENGINE_PROFILE: Dict[str, Any] = {
+    "read_only": True,           # open with mode=ro, the app never writes through the engine
+    # serve queries from a shared in-memory copy of the file (HAJJ_DB_IN_MEMORY=1 at startup)
+    "in_memory": os.environ.get("HAJJ_DB_IN_MEMORY", "").lower() in ("1", "true", "yes"),
+    "immutable": True,           # skip file locking; safe because writers swap or re-stamp the file
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size_kib": 64 * 1024,
+    "temp_store": "MEMORY",
+    "pool_size": default_pool_size(),
+    "max_overflow": 4,
+    "pool_timeout": 30,
+}
+
+# Settings of a PostgreSQL engine (a shared agency store served to several app nodes)
+DEFAULT_POSTGRES_PROFILE: Dict[str, Any] = {
+    "read_only": True,           # every transaction read-only, the app never writes through the engine
+    "pool_size": default_pool_size(),
+    "max_overflow": 4,
+    "pool_timeout": 30,
+    "pool_recycle": 1800,        # reconnect before server or proxy idle timeouts drop the connection
+    "pool_pre_ping": True,       # replace connections lost to a failover or server restart on checkout
+    "connect_timeout": 5,
+    "application_name": "hajj-chatbot",
+}
+
+# key → (file signature, engine, connection keeping its in-memory copy alive or None)
+_engines: Dict[Tuple, Tuple[Optional[Tuple[int, int, int]], Engine, Optional[sqlite3.Connection]]] = {}
+_lock = threading.Lock()
+_memory_names = itertools.count(1)
+# engine → connection pool event counters
+_pool_counters: "weakref.WeakKeyDictionary[Engine, Dict[str, int]]" = weakref.WeakKeyDictionary()
+_counters_lock = threading.Lock()
+
+
+# ---------------- Engine Construction ----------------
+def build_url(db_path: str, profile: Dict[str, Any], memory_name: Optional[str] = None) -> str:
+    """
+    SQLAlchemy URL for db_path, as a read-only SQLite URI when the profile asks for it,
+    or for the shared in-memory database memory_name
+    """
+    if memory_name is not None:
+        return f"sqlite:///file:{memory_name}?mode=memory&cache=shared&uri=true"
+    if not profile["read_only"]:
+        return f"sqlite:///{db_path}"
+    options = "mode=ro"
+    # A pending WAL file holds committed pages an immutable reader would never see
+    if profile["immutable"] and not os.path.exists(f"{db_path}-wal"):
+        options += "&immutable=1"
+    return f"sqlite:///{file_uri(db_path, options)}&uri=true"
+
+
+def _configure_connection(profile: Dict[str, Any]):
+    """Connect hook applying the profile PRAGMAs to each new DBAPI connection"""
+    def on_connect(dbapi_conn, _record) -> None:
+        register_functions(dbapi_conn)
+        cursor = dbapi_conn.cursor()
+        try:
+            cursor.execute(f"PRAGMA mmap_size = {int(profile['mmap_size'])}")
+            cursor.execute(f"PRAGMA cache_size = -{int(profile['cache_size_kib'])}")
+            cursor.execute(f"PRAGMA temp_store = {profile['temp_store']}")
+            if profile["read_only"]:
+                cursor.execute("PRAGMA query_only = ON")
+        finally:
+            cursor.close()
+    return on_connect
+
+
+def create_sqlite_engine(db_path: str, profile: Optional[Dict[str, Any]] = None,
+                         memory_name: Optional[str] = None) -> Engine:
+    """New pooled engine for db_path using DEFAULT_ENGINE_PROFILE updated with profile"""
+    settings = {**DEFAULT_ENGINE_PROFILE, **(profile or {})}
+    engine = create_engine(
+        build_url(db_path, settings, memory_name),
+        poolclass=QueuePool,
+        pool_size=settings["pool_size"],
+        max_overflow=settings["max_overflow"],
+        pool_timeout=settings["pool_timeout"],
+        connect_args={"check_same_thread": False},
+    )
+    event.listen(engine, "connect", _configure_connection(settings))
+    track_pool(engine)
+    return engine
+
+
+def create_postgres_engine(url: str, profile: Optional[Dict[str, Any]] = None) -> Engine:
+    """New pooled engine for a PostgreSQL URL using DEFAULT_POSTGRES_PROFILE updated with profile"""
+    settings = {**DEFAULT_POSTGRES_PROFILE, **(profile or {})}
+    connect_args: Dict[str, Any] = {
+        "connect_timeout": settings["connect_timeout"],
+        "application_name": settings["application_name"],
+    }
+    if settings["read_only"]:
+        connect_args["options"] = "-c default_transaction_read_only=on"
+    engine = create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=settings["pool_size"],
+        max_overflow=settings["max_overflow"],
+        pool_timeout=settings["pool_timeout"],
+        pool_recycle=settings["pool_recycle"],
+        pool_pre_ping=settings["pool_pre_ping"],
+        connect_args=connect_args,
+    )
+    track_pool(engine)
+    return engine
+
+
+# ---------------- Pool Metrics ----------------
+def track_pool(engine: Engine) -> None:
+    """Count the connections an engine's pool opens, hands out and discards"""
+    counters = {"connects": 0, "checkouts": 0, "checkins": 0, "invalidations": 0}
+
+    def counting(name: str):
+        def on_event(*_args) -> None:
+            with _counters_lock:
+                counters[name] += 1
+        return on_event
+
+    event.listen(engine, "connect", counting("connects"))
+    event.listen(engine, "checkout", counting("checkouts"))
+    event.listen(engine, "checkin", counting("checkins"))
+    event.listen(engine, "invalidate", counting("invalidations"))
+    with _counters_lock:
+        _pool_counters[engine] = counters
+
+
+def pool_metrics(engine: Engine) -> Dict[str, int]:
+    """Current occupancy of an engine's pool plus its lifetime event counters"""
+    pool = engine.pool
+    with _counters_lock:
+        counters = dict(_pool_counters.get(engine, {}))
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        **counters,
+    }
+
+
+# ---------------- In-Memory Copies ----------------
+def load_memory_copy(db_path: str) -> Tuple[str, sqlite3.Connection]:
+    """
+    Copy db_path into a new shared-cache in-memory database with the backup API
+
+    Returns:
+        (database name, connection holding it). SQLite frees the copy once its
+        last connection closes, so the caller keeps this one open while in use.
+    """
+    name = f"agencies-{os.getpid()}-{next(_memory_names)}"
+    holder = sqlite3.connect(f"file:{name}?mode=memory&cache=shared", uri=True, check_same_thread=False)
+    source = sqlite3.connect(file_uri(db_path), uri=True)
+    try:
+        source.backup(holder)
+    except Exception:
+        holder.close()
+        raise
+    finally:
+        source.close()
+    return name, holder
+
+
+# ---------------- Shared Engines ----------------
+def get_engine(db_path: str, profile: Optional[Dict[str, Any]] = None) -> Engine:
+    """
+    Process-wide engine for db_path and profile
+
+    The engine is rebuilt (and the old pool disposed) when the database file
+    changes on disk, so immutable connections never outlive the file they read.
+    With the in_memory profile the file is copied into RAM first and every
+    connection reads the copy; a changed file is copied again.
+    """
+    key = (os.path.abspath(db_path), tuple(sorted((profile or {}).items())))
+    signature = file_signature(db_path)
+    with _lock:
+        cached = _engines.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        if cached is not None:
+            logger.info(f"♻️ Database file changed, recycling connection pool for {db_path}")
+            _release(cached)
+        memory_name, holder = None, None
+        if {**DEFAULT_ENGINE_PROFILE, **(profile or {})}["in_memory"]:
+            memory_name, holder = load_memory_copy(db_path)
+            logger.info(f"🧠 Loaded {db_path} into shared in-memory database {memory_name}")
+        engine = create_sqlite_engine(db_path, profile, memory_name)
+        _engines[key] = (signature, engine, holder)
+        return engine
+
+
+def get_postgres_engine(url: str, profile: Optional[Dict[str, Any]] = None) -> Engine:
+    """Process-wide engine for a PostgreSQL URL and profile"""
+    key = (url, tuple(sorted((profile or {}).items())))
+    with _lock:
+        cached = _engines.get(key)
+        if cached is not None:
+            return cached[1]
+        engine = create_postgres_engine(url, profile)
+        _engines[key] = (None, engine, None)
+        return engine
+
+
+def _release(cached: Tuple[Optional[Tuple[int, int, int]], Engine, Optional[sqlite3.Connection]]) -> None:
+    """Dispose an engine's pool; its in-memory copy lives on until checked-out connections return"""
+    _, engine, holder = cached
+    engine.dispose()
+    if holder is not None:
+        holder.close()
+
+
+def pool_status(db_path: str) -> Dict[str, str]:
+    """Pool occupancy of every shared engine for db_path"""
+    path = os.path.abspath(db_path)
+    with _lock:
+        return {
+            (repr(key[1]) if key[1] else "default"): engine.pool.status()
+            for key, (_, engine, _) in _engines.items()
+            if key[0] == path
+        }
+
+
+def dispose_engines() -> None:
+    """Close every pooled connection and forget all shared engines"""
+    with _lock:
+        for cached in _engines.values():
+            _release(cached)
+        _engines.clear()
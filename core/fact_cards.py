@@ -0,0 +1,107 @@
+"""
+Agency Fact Card Module
+Per-agency answer cards in every supported language, rendered without the LLM
+"""
+
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+from utils.normalization import normalize_text
+from utils.translations import t
+
+CARD_LANGUAGES = ["English", "العربية", "اردو"]
+
+# Card lines under the name, in display order
+CARD_FIELDS = ["status", "city", "country", "address", "contact", "email", "rating", "maps"]
+
+# Lines that answer a question about one field (LLMManager's specific_field_request)
+FIELD_LINES = {
+    "rating": ["rating"],
+    "contact": ["contact"],
+    "email": ["email"],
+    "contact_methods": ["contact", "email"],
+    "city": ["city"],
+    "country": ["country"],
+    "address": ["address", "city", "country", "maps"],
+    "maps": ["maps"],
+}
+
+# Words of a plain lookup ("is X authorized?", "tell me about X", "تحقق من شركة X");
+# anything else left after the company name makes the question open-ended
+LOOKUP_WORDS = frozenset(normalize_text(word) for word in (
+    "is", "are", "the", "a", "an", "of", "about", "for", "on", "it", "its", "this", "that",
+    "what", "who", "where", "please", "can", "you", "i", "me", "tell", "show", "give", "want", "know",
+    "info", "information", "details", "check", "verify", "status", "authorized", "licensed", "approved",
+    "legit", "legitimate", "real", "fake", "company", "agency", "office",
+    "هل", "ما", "هي", "هو", "عن", "من", "في", "هذه", "هذا", "اريد", "اعرف", "اعطني", "معلومات", "تفاصيل",
+    "تحقق", "حاله", "شركه", "الشركه", "وكاله", "الوكاله", "مكتب", "معتمده", "مرخصه", "موثوقه",
+    "کیا", "ہے", "ہیں", "کے", "کی", "کا", "بارے", "میں", "یہ", "وہ", "بتائیں", "تفصیلات", "تصدیق", "کریں",
+    "ایجنسی", "کمپنی", "مجاز", "منظور", "شدہ",
+))
+
+
+def _line(lang: str, label: str, value: Optional[str]) -> str:
+    return f"- **{t(label, lang)}:** {value or t('card_not_available', lang)}"
+
+
+def build_card(agency: Mapping[str, Any], lang: str) -> Dict[str, str]:
+    """Fact card of one agency table row in lang: field name → markdown line"""
+    english = lang == "English"
+    names = [agency.get("hajj_company_en"), agency.get("hajj_company_ar")]
+    if not english:
+        names.reverse()
+    names = [name for name in dict.fromkeys(names) if name]
+    title = f"{names[0]} ({names[1]})" if len(names) > 1 else (names[0] if names else t("card_not_available", lang))
+
+    # Arabic-script cards use the Arabic place columns, falling back to the English ones
+    if english:
+        city, country = agency.get("city"), agency.get("country")
+    else:
+        city = agency.get("المدينة") or agency.get("city")
+        country = agency.get("الدولة") or agency.get("country")
+
+    authorized = str(agency.get("is_authorized") or "").lower() in ("yes", "true", "1")
+    status = f"✅ {t('status_authorized', lang)}" if authorized else f"❌ {t('status_not_authorized', lang)}"
+
+    rating = agency.get("rating")
+    reviews = agency.get("review_count")
+    if rating is not None:
+        rating = f"{rating:g} ⭐" + (f" ({t('card_reviews', lang, count=reviews)})" if reviews else "")
+    else:
+        rating = agency.get("rating_reviews")
+
+    return {
+        "name": f"🏢 **{title}**",
+        "status": _line(lang, "card_status", status),
+        "city": _line(lang, "card_city", city),
+        "country": _line(lang, "card_country", country),
+        "address": _line(lang, "card_address", agency.get("formatted_address")),
+        "contact": _line(lang, "card_contact", agency.get("contact_info")),
+        "email": _line(lang, "card_email", agency.get("email")),
+        "rating": _line(lang, "card_rating", rating),
+        "maps": _line(lang, "card_maps", agency.get("google_maps_link")),
+    }
+
+
+def render_card(cards: Mapping[str, Mapping[str, str]], language: str, field: Optional[str] = None) -> Optional[str]:
+    """
+    Answer text from one agency's cards (language → card)
+
+    With field, only the lines answering it follow the name. None when there is
+    no card to render.
+    """
+    card = cards.get(language) or cards.get("English")
+    if not card:
+        return None
+    lines = [card[name] for name in FIELD_LINES.get(field, CARD_FIELDS) if name in card]
+    return "\n".join([card["name"], ""] + lines)
+
+
+def is_lookup_question(question: str, names: Iterable[Optional[str]]) -> bool:
+    """
+    Whether question only asks about the company called names (its card answers
+    it in full); one unknown word is tolerated for a misspelt name
+    """
+    known = set(LOOKUP_WORDS)
+    for name in names:
+        known.update(normalize_text(name).split())
+    return sum(word not in known for word in normalize_text(question).split()) <= 1
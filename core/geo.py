@@ -0,0 +1,405 @@
+"""
+Geo Module
+Offline geocoding of agency addresses (explicit coordinates, plus codes, place centroids)
+"""
+
+import math
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+from utils.normalization import normalize_text, contains_phrase
+
+EARTH_RADIUS_KM = 6371.0088
+
+# How a location was obtained, best last; stored as the precision rank
+PRECISION_CITY = 1
+PRECISION_DISTRICT = 2
+PRECISION_PLUS_CODE = 3
+PRECISION_EXACT = 4
+PRECISION_NAMES = {
+    PRECISION_CITY: "city",
+    PRECISION_DISTRICT: "district",
+    PRECISION_PLUS_CODE: "plus_code",
+    PRECISION_EXACT: "exact",
+}
+
+# ---------------- Gazetteer ----------------
+# Approximate centroids: (names incl. spellings/Arabic, country or None, lat, lng).
+# Cities are matched against an agency's city column; districts against its address
+# and only within their parent city.
+CITIES: List[Tuple[Tuple[str, ...], Optional[str], float, float]] = [
+    (("Makkah", "Mecca", "Makkah Al Mukarramah", "مكة", "مكة المكرمة"), "Saudi Arabia", 21.4225, 39.8262),
+    (("Madinah", "Medina", "Al Madinah Al Munawwarah", "المدينة المنورة"), "Saudi Arabia", 24.4672, 39.6111),
+    (("Jeddah", "Jiddah", "جدة"), "Saudi Arabia", 21.5433, 39.1728),
+    (("Riyadh", "Ar Riyadh", "الرياض"), "Saudi Arabia", 24.7136, 46.6753),
+    (("Dammam", "الدمام"), "Saudi Arabia", 26.4207, 50.0888),
+    (("Khobar", "Al Khobar", "الخبر"), "Saudi Arabia", 26.2172, 50.1971),
+    (("Taif", "At Taif", "الطائف"), "Saudi Arabia", 21.2703, 40.4158),
+    (("Az Zilfi", "Zulfi", "الزلفي"), "Saudi Arabia", 26.2990, 44.8150),
+    (("Buraydah", "بريدة"), "Saudi Arabia", 26.3260, 43.9750),
+    (("Unaizah", "عنيزة"), "Saudi Arabia", 26.0843, 43.9935),
+    (("Abha", "أبها"), "Saudi Arabia", 18.2164, 42.5053),
+    (("Khamis Mushait", "خميس مشيط"), "Saudi Arabia", 18.3000, 42.7333),
+    (("Tabuk", "تبوك"), "Saudi Arabia", 28.3835, 36.5662),
+    (("Hail", "حائل"), "Saudi Arabia", 27.5114, 41.7208),
+    (("Jazan", "Jizan", "جازان"), "Saudi Arabia", 16.8892, 42.5511),
+    (("Najran", "نجران"), "Saudi Arabia", 17.4924, 44.1277),
+    (("Hofuf", "Al Hofuf", "Al Ahsa", "الهفوف", "الأحساء"), "Saudi Arabia", 25.3833, 49.5867),
+    (("Yanbu", "ينبع"), "Saudi Arabia", 24.0890, 38.0637),
+    (("Qatif", "Al Qatif", "القطيف"), "Saudi Arabia", 26.5196, 50.0115),
+    (("Jubail", "Al Jubail", "الجبيل"), "Saudi Arabia", 27.0046, 49.6460),
+    (("Al Kharj", "الخرج"), "Saudi Arabia", 24.1556, 47.3120),
+    (("Cairo", "Cairo Governorate", "القاهرة"), "Egypt", 30.0444, 31.2357),
+    (("Giza", "Giza Governorate", "الجيزة"), "Egypt", 30.0131, 31.2089),
+    (("Alexandria", "Alexandria Governorate", "الإسكندرية"), "Egypt", 31.2001, 29.9187),
+    (("Mansoura", "Dakahlia Governorate", "الدقهلية", "المنصورة"), "Egypt", 31.0409, 31.3785),
+    (("Amman", "عمان"), "Jordan", 31.9454, 35.9284),
+    (("Dubai", "دبي"), "United Arab Emirates", 25.2048, 55.2708),
+    (("Abu Dhabi", "أبو ظبي", "أبوظبي"), "United Arab Emirates", 24.4539, 54.3773),
+    (("Sharjah", "الشارقة"), "United Arab Emirates", 25.3463, 55.4209),
+    (("Doha", "الدوحة"), "Qatar", 25.2854, 51.5310),
+    (("Kuwait City", "مدينة الكويت"), "Kuwait", 29.3759, 47.9774),
+    (("Manama", "المنامة"), "Bahrain", 26.2285, 50.5860),
+    (("Muscat", "مسقط"), "Oman", 23.5880, 58.3829),
+    (("Baghdad", "بغداد"), "Iraq", 33.3152, 44.3661),
+    (("Beirut", "بيروت"), "Lebanon", 33.8938, 35.5018),
+    (("Damascus", "دمشق"), "Syria", 33.5138, 36.2765),
+    (("Tarabulus", "Tripoli", "طرابلس"), "Libya", 32.8872, 13.1913),
+    (("Tunis", "تونس"), "Tunisia", 36.8065, 10.1815),
+    (("Algiers", "الجزائر"), "Algeria", 36.7538, 3.0588),
+    (("Casablanca", "الدار البيضاء"), "Morocco", 33.5731, -7.5898),
+    (("Rabat", "الرباط"), "Morocco", 34.0209, -6.8416),
+    (("Khartoum", "الخرطوم"), "Sudan", 15.5007, 32.5599),
+    (("Sanaa", "Sana'a", "صنعاء"), "Yemen", 15.3694, 44.1910),
+    (("Tehran", "طهران"), "Iran", 35.6892, 51.3890),
+    (("Istanbul", "إسطنبول"), "Türkiye", 41.0082, 28.9784),
+    (("Karachi", "كراتشي"), "Pakistan", 24.8607, 67.0011),
+    (("Lahore", "لاهور"), "Pakistan", 31.5204, 74.3587),
+    (("Islamabad", "إسلام آباد"), "Pakistan", 33.6844, 73.0479),
+    (("Rawalpindi", "راولبندي"), "Pakistan", 33.5651, 73.0169),
+    (("Peshawar", "بيشاور"), "Pakistan", 34.0151, 71.5249),
+    (("Kabul", "كابول"), "Afghanistan", 34.5553, 69.2075),
+    (("Dhaka", "ঢাকা", "دكا"), "Bangladesh", 23.8103, 90.4125),
+    (("Chittagong", "Chattogram", "شيتاغونغ"), "Bangladesh", 22.3569, 91.7832),
+    (("Mumbai", "مومباي"), "India", 19.0760, 72.8777),
+    (("Hyderabad", "حيدر أباد", "حيدر آباد"), "India", 17.3850, 78.4867),
+    (("New Delhi", "Delhi", "نيودلهي"), "India", 28.6139, 77.2090),
+    (("Bengaluru", "Bangalore", "بنغالور"), "India", 12.9716, 77.5946),
+    (("Kolkata", "كولكاتا"), "India", 22.5726, 88.3639),
+    (("Chennai", "تشيناي"), "India", 13.0827, 80.2707),
+    (("Jakarta", "جاكرتا"), "Indonesia", -6.2088, 106.8456),
+    (("Kuala Lumpur", "كوالالمبور"), "Malaysia", 3.1390, 101.6869),
+    (("London", "لندن"), "United Kingdom", 51.5074, -0.1278),
+    (("Birmingham", "برمنغهام"), "United Kingdom", 52.4862, -1.8904),
+    (("Amsterdam", "أمستردام"), "Netherlands", 52.3676, 4.9041),
+    (("Rotterdam", "روتردام"), "Netherlands", 51.9244, 4.4777),
+    (("Haarlem", "هارلم"), "Netherlands", 52.3874, 4.6462),
+    (("Amersfoort", "أمرسفورت"), "Netherlands", 52.1561, 5.3878),
+    (("Brussels", "بروكسل"), "Belgium", 50.8503, 4.3517),
+    (("Paris", "باريس"), "France", 48.8566, 2.3522),
+    (("Berlin", "برلين"), "Germany", 52.5200, 13.4050),
+    (("New York", "نيويورك"), "United States", 40.7128, -74.0060),
+    (("Chicago", "شيكاغو"), "United States", 41.8781, -87.6298),
+    (("Houston", "هيوستن"), "United States", 29.7604, -95.3698),
+    (("Los Angeles", "لوس أنجلوس"), "United States", 34.0522, -118.2437),
+    (("Toronto", "تورونتو"), "Canada", 43.6532, -79.3832),
+    (("Sydney", "سيدني"), "Australia", -33.8688, 151.2093),
+    (("Tanta", "Gharbia Governorate", "الغربية"), "Egypt", 30.7865, 31.0004),
+    (("Zagazig", "Al-Sharqia Governorate", "Sharqia Governorate", "الشرقية"), "Egypt", 30.5877, 31.5020),
+    (("Damanhur", "Beheira Governorate", "البحيرة"), "Egypt", 31.0341, 30.4682),
+    (("Shibin El Kom", "Menofia Governorate", "المنوفية"), "Egypt", 30.5526, 31.0106),
+    (("Hurghada", "Red Sea Governorate", "البحر الأحمر"), "Egypt", 27.2579, 33.8116),
+    (("Port Said", "Port Said Governorate", "بورسعيد"), "Egypt", 31.2653, 32.3019),
+    (("Luxor", "Luxor Governorate", "الأقصر"), "Egypt", 25.6872, 32.6396),
+    (("Sohag", "Sohag Governorate", "سوهاج"), "Egypt", 26.5591, 31.6957),
+    (("Beni Suef", "Beni Suef Governorate", "بني سويف"), "Egypt", 29.0661, 31.0994),
+    (("Irbid", "إربد"), "Jordan", 32.5556, 35.8500),
+    (("Ajman", "عجمان"), "United Arab Emirates", 25.4052, 55.5136),
+    (("Ras Al Khaimah", "Ras Al-Khaimah", "رأس الخيمة"), "United Arab Emirates", 25.8007, 55.9762),
+    (("Al Ain", "العين"), "United Arab Emirates", 24.2075, 55.7447),
+    (("Kuwait", "الكويت"), "Kuwait", 29.3759, 47.9774),
+    (("Salmiya", "السالمية"), "Kuwait", 29.3339, 48.0761),
+    (("Riffa", "الرفاع"), "Bahrain", 26.1300, 50.5550),
+    (("Seeb", "السيب"), "Oman", 23.6703, 58.1891),
+    (("Salalah", "صلالة"), "Oman", 17.0151, 54.0924),
+    (("Mosul", "الموصل"), "Iraq", 36.3350, 43.1189),
+    (("Erbil", "أربيل"), "Iraq", 36.1911, 44.0092),
+    (("Kirkuk", "كركوك"), "Iraq", 35.4681, 44.3922),
+    (("Marrakech", "مراكش"), "Morocco", 31.6295, -7.9811),
+    (("Agadir", "أكادير"), "Morocco", 30.4278, -9.5981),
+    (("Oran", "وهران"), "Algeria", 35.6971, -0.6308),
+    (("Dakar", "داكار"), "Senegal", 14.7167, -17.4677),
+    (("Lagos", "لاغوس"), "Nigeria", 6.5244, 3.3792),
+    (("Kano", "كانو"), "Nigeria", 12.0022, 8.5920),
+    (("Faisalabad", "فيصل آباد"), "Pakistan", 31.4504, 73.1350),
+    (("Gujranwala", "جوجرانوالا"), "Pakistan", 32.1877, 74.1945),
+    (("Ahmedabad", "أحمد آباد"), "India", 23.0225, 72.5714),
+    (("Sylhet", "سلهت"), "Bangladesh", 24.8949, 91.8687),
+    (("Colombo", "كولومبو"), "Sri Lanka", 6.9271, 79.8612),
+    (("Den Haag", "The Hague", "لاهاي"), "Netherlands", 52.0705, 4.3007),
+    (("Utrecht", "أوتريخت"), "Netherlands", 52.0907, 5.1214),
+    (("Eindhoven", "آيندهوفن"), "Netherlands", 51.4416, 5.4697),
+    (("Almere", "ألمير"), "Netherlands", 52.3508, 5.2647),
+    (("Essen", "إيسن"), "Germany", 51.4556, 7.0116),
+    (("Düsseldorf", "دوسلدورف"), "Germany", 51.2277, 6.7735),
+    (("Köln", "Cologne", "كولونيا"), "Germany", 50.9375, 6.9603),
+    (("Wien", "Vienna", "فيينا"), "Austria", 48.2082, 16.3738),
+    (("Mississauga", "ميسيساغا"), "Canada", 43.5890, -79.6441),
+    (("Montréal", "Montreal", "مونتريال"), "Canada", 45.5019, -73.5674),
+    (("Seattle", "سياتل"), "United States", 47.6062, -122.3321),
+]
+
+# (names, parent city, lat, lng)
+DISTRICTS: List[Tuple[Tuple[str, ...], str, float, float]] = [
+    # Makkah: the Haram and the areas pilgrims stay in
+    (("Al Haram", "Masjid al Haram", "الحرم"), "Makkah", 21.4225, 39.8262),
+    (("Ash Shubaikah", "Al Shubaikah", "Shubaikah", "الشبيكة"), "Makkah", 21.4235, 39.8210),
+    (("Ajyad", "أجياد"), "Makkah", 21.4170, 39.8270),
+    (("Misfalah", "Al Misfalah", "المسفلة"), "Makkah", 21.4130, 39.8220),
+    (("Jarwal", "جرول"), "Makkah", 21.4300, 39.8150),
+    (("Al Utaybiyyah", "Al Otaibiya", "العتيبية"), "Makkah", 21.4370, 39.8120),
+    (("Az Zahir", "Al Zahir", "الزاهر"), "Makkah", 21.4450, 39.8100),
+    (("Kudai", "كدي"), "Makkah", 21.4010, 39.8200),
+    (("Al Aziziyah", "Aziziyah", "Al Aziziya", "العزيزية"), "Makkah", 21.4030, 39.8730),
+    (("Al Awali", "العوالي"), "Makkah", 21.3550, 39.8800),
+    (("Ash Shawqiyah", "Al Shawqiyah", "الشوقية"), "Makkah", 21.3700, 39.7900),
+    (("Ar Rusayfah", "Al Rusaifah", "الرصيفة"), "Makkah", 21.4000, 39.7900),
+    (("Al Kakiyah", "الككية"), "Makkah", 21.3800, 39.8000),
+    (("Batha Quraish", "بطحاء قريش"), "Makkah", 21.3800, 39.8400),
+    (("Mina", "منى"), "Makkah", 21.4133, 39.8933),
+    (("Muzdalifah", "مزدلفة"), "Makkah", 21.3935, 39.9368),
+    (("Arafat", "عرفات"), "Makkah", 21.3549, 39.9841),
+    # Madinah
+    (("Al Haram", "Markaziyah", "المركزية", "الحرم"), "Madinah", 24.4672, 39.6111),
+    (("Quba", "قباء"), "Madinah", 24.4397, 39.6172),
+    # Jeddah
+    (("Al Balad", "البلد"), "Jeddah", 21.4858, 39.1925),
+    (("Al Faisaliyyah", "Al Faisaliyah", "الفيصلية"), "Jeddah", 21.5740, 39.1660),
+    (("As Salamah", "Al Salamah", "السلامة"), "Jeddah", 21.5890, 39.1500),
+    (("Ar Rawdah", "Al Rawdah", "الروضة"), "Jeddah", 21.5630, 39.1510),
+    (("Al Hamra", "الحمراء"), "Jeddah", 21.5200, 39.1600),
+    (("Az Zahra", "Al Zahra", "الزهراء"), "Jeddah", 21.6000, 39.1400),
+]
+
+
+class Place:
+    """A gazetteer entry resolved from user text or an agency row"""
+
+    __slots__ = ("name", "kind", "city", "country", "lat", "lng")
+
+    def __init__(self, name: str, kind: str, city: Optional[str], country: Optional[str], lat: float, lng: float):
+        self.name = name
+        self.kind = kind
+        self.city = city
+        self.country = country
+        self.lat = lat
+        self.lng = lng
+
+    @property
+    def precision(self) -> int:
+        return PRECISION_DISTRICT if self.kind == "district" else PRECISION_CITY
+
+    def __repr__(self) -> str:
+        return f"Place({self.name!r}, {self.kind}, {self.lat}, {self.lng})"
+
+
+def _build_index() -> Tuple[Dict[str, List[Place]], Dict[str, List[Tuple[str, Place]]]]:
+    cities: Dict[str, List[Place]] = {}
+    districts: Dict[str, List[Tuple[str, Place]]] = {}
+    city_keys: Dict[str, str] = {}
+    for names, country, lat, lng in CITIES:
+        place = Place(names[0], "city", names[0], country, lat, lng)
+        for name in names:
+            cities.setdefault(normalize_text(name), []).append(place)
+        city_keys[names[0]] = normalize_text(names[0])
+    for names, parent, lat, lng in DISTRICTS:
+        city = next(p for p in cities[city_keys[parent]] if p.name == parent)
+        place = Place(names[0], "district", parent, city.country, lat, lng)
+        for name in names:
+            districts.setdefault(parent, []).append((normalize_text(name), place))
+    return cities, districts
+
+
+_CITY_INDEX, _DISTRICT_INDEX = _build_index()
+
+
+def find_city(city: Optional[str], country: Optional[str] = None) -> Optional[Place]:
+    """Gazetteer city for a city column value, preferring one in the given country"""
+    candidates = _CITY_INDEX.get(normalize_text(city)) if city else None
+    if not candidates:
+        return None
+    country_norm = normalize_text(country)
+    for place in candidates:
+        if place.country and normalize_text(place.country) == country_norm:
+            return place
+    # A bare city name that exists in one country only
+    return candidates[0] if len(candidates) == 1 and not country_norm else None
+
+
+def find_district(address: Optional[str], city: Place) -> Optional[Place]:
+    """Known district of city named in an address"""
+    text = normalize_text(address)
+    if not text:
+        return None
+    for name, place in _DISTRICT_INDEX.get(city.name, ()):
+        if contains_phrase(text, name):
+            return place
+    return None
+
+
+def lookup_place(text: Optional[str]) -> Optional[Place]:
+    """
+    Resolve a place name from a question ("Al Aziziyah", "العزيزية", "Jeddah")
+
+    Districts win over cities; a district name shared by several cities resolves to
+    the holy-city one listed first (Makkah before Madinah).
+    """
+    name = normalize_text(text)
+    if not name:
+        return None
+    for parent in _DISTRICT_INDEX:
+        for district_name, place in _DISTRICT_INDEX[parent]:
+            if district_name == name:
+                return place
+    candidates = _CITY_INDEX.get(name)
+    return candidates[0] if candidates else None
+
+
+# ---------------- Plus Codes ----------------
+# Open Location Code alphabet and the size in degrees of each character pair
+_OLC_ALPHABET = "23456789CFGHJMPQRVWX"
+_OLC_PAIR_RESOLUTIONS = (20.0, 1.0, 0.05, 0.0025, 0.000125)
+_PLUS_CODE = re.compile(r"(?<![\w+])([23456789CFGHJMPQRVWX]{4,8})\+([23456789CFGHJMPQRVWX]{2,3})?(?![\w+])")
+
+
+def _encode_prefix(lat: float, lng: float, length: int) -> str:
+    """First length characters (even) of the full plus code for a point"""
+    lat = min(max(lat, -90.0), 90.0 - 1e-10) + 90.0
+    lng = ((lng + 180.0) % 360.0)
+    code = []
+    for resolution in _OLC_PAIR_RESOLUTIONS[: length // 2]:
+        lat_digit, lng_digit = int(lat // resolution), int(lng // resolution)
+        code.append(_OLC_ALPHABET[lat_digit] + _OLC_ALPHABET[lng_digit])
+        lat -= lat_digit * resolution
+        lng -= lng_digit * resolution
+    return "".join(code)
+
+
+def decode_plus_code(code: str) -> Optional[Tuple[float, float]]:
+    """Center of a full plus code such as "7GVCH7JQ+7X" (8 characters before the +)"""
+    head, _, tail = code.upper().partition("+")
+    digits = head + tail[:2]
+    if len(head) != 8 or len(digits) % 2:
+        return None
+    lat, lng = -90.0, -180.0
+    resolution = _OLC_PAIR_RESOLUTIONS[0]
+    for i in range(0, len(digits), 2):
+        resolution = _OLC_PAIR_RESOLUTIONS[i // 2]
+        lat += _OLC_ALPHABET.index(digits[i]) * resolution
+        lng += _OLC_ALPHABET.index(digits[i + 1]) * resolution
+    lat_size, lng_size = resolution, resolution
+    if len(tail) > 2:
+        # Grid refinement: a 5 x 4 cell
+        index = _OLC_ALPHABET.index(tail[2])
+        lat_size, lng_size = resolution / 5, resolution / 4
+        lat += (index // 4) * lat_size
+        lng += (index % 4) * lng_size
+    return lat + lat_size / 2, lng + lng_size / 2
+
+
+def recover_plus_code(code: str, ref_lat: float, ref_lng: float) -> Optional[Tuple[float, float]]:
+    """
+    Center of a short plus code ("9FQ4+W7Q") using a reference point within about
+    half a degree of it (the Open Location Code nearest-match recovery)
+    """
+    head = code.upper().split("+")[0]
+    if len(head) == 8:
+        return decode_plus_code(code)
+    missing = 8 - len(head)
+    decoded = decode_plus_code(_encode_prefix(ref_lat, ref_lng, missing) + code.upper())
+    if decoded is None:
+        return None
+    lat, lng = decoded
+    resolution = 20.0 ** (2 - missing / 2)
+    half = resolution / 2
+    if ref_lat + half < lat and lat - resolution >= -90:
+        lat -= resolution
+    elif ref_lat - half > lat and lat + resolution <= 90:
+        lat += resolution
+    if ref_lng + half < lng:
+        lng -= resolution
+    elif ref_lng - half > lng:
+        lng += resolution
+    return lat, lng
+
+
+# ---------------- Geocoding ----------------
+_COORDINATES = re.compile(r"(?:@|query=|q=|ll=|\b)(-?\d{1,2}\.\d{4,})\s*,\s*(-?\d{1,3}\.\d{4,})")
+
+
+def _explicit_coordinates(*texts: Optional[str]) -> Optional[Tuple[float, float]]:
+    for text in texts:
+        match = _COORDINATES.search(unquote(text)) if text else None
+        if match:
+            lat, lng = float(match.group(1)), float(match.group(2))
+            if -90 <= lat <= 90 and -180 <= lng <= 180:
+                return lat, lng
+    return None
+
+
+@lru_cache(maxsize=20_000)
+def geocode(address: Optional[str], maps_link: Optional[str], city: Optional[str],
+            city_ar: Optional[str], country: Optional[str]) -> Optional[Tuple[float, float, int]]:
+    """
+    (lat, lng, precision) for one agency row, without network access
+
+    In order: coordinates in the address or map link; a plus code in the address,
+    recovered against the district or city centroid; the centroid of a known
+    district named in the address; the centroid of the row's city. None otherwise.
+    """
+    explicit = _explicit_coordinates(maps_link, address)
+    if explicit:
+        return explicit[0], explicit[1], PRECISION_EXACT
+    city_place = find_city(city, country) or find_city(city_ar, country)
+    district = find_district(address, city_place) if city_place else None
+    reference = district or city_place
+    plus_code = _PLUS_CODE.search(address or "")
+    if plus_code:
+        code = plus_code.group(0)
+        point = decode_plus_code(code) if len(plus_code.group(1)) == 8 else (
+            recover_plus_code(code, reference.lat, reference.lng) if reference else None
+        )
+        if point:
+            return point[0], point[1], PRECISION_PLUS_CODE
+    if reference:
+        return reference.lat, reference.lng, reference.precision
+    return None
+
+
+def geocode_part(index: int):
+    """SQL function returning one field of geocode() (lat, lng or precision)"""
+    def part(address, maps_link, city, city_ar, country):
+        located = geocode(address, maps_link, city, city_ar, country)
+        return located[index] if located else None
+    return part
+
+
+# ---------------- Distance ----------------
+def distance_km(lat1: Optional[float], lng1: Optional[float],
+                lat2: Optional[float], lng2: Optional[float]) -> Optional[float]:
+    """Great-circle (haversine) distance in kilometres"""
+    if None in (lat1, lng1, lat2, lng2):
+        return None
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi, dlmb = phi2 - phi1, math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat: float, lng: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_lng, max_lng) enclosing a circle, for the R*Tree lookup"""
+    dlat = radius_km / 111.32
+    dlng = radius_km / (111.32 * max(math.cos(math.radians(lat)), 0.01))
+    return lat - dlat, lat + dlat, max(lng - dlng, -180.0), min(lng + dlng, 180.0)
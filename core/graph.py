@@ -7,8 +7,14 @@ from typing import TypedDict, Optional, List, Dict
 from langgraph.graph import StateGraph, START, END
 import logging
 
+from core.name_matching import TrigramIndex
+from core.query_budget import QueryBudget
+
 logger = logging.getLogger(__name__)
 
+# Rows fetched per query when the LLM manager does not say how many it reads
+DEFAULT_SUMMARY_ROWS = 50
+
 
 # -----------------------------
 # State Definition
@@ -30,9 +36,12 @@ class GraphState(TypedDict):
     sql_filters: Optional[List[str]]
     sql_explanation: Optional[str]
     sql_error: Optional[str]
+    structured_filters: Optional[Dict]
     result_rows: Optional[List[Dict]]
     columns: Optional[List[str]]
     row_count: Optional[int]
+    results_truncated: Optional[bool]
+    next_cursor: Optional[str]
     summary: Optional[str]
     greeting_text: Optional[str]
     general_answer: Optional[str]
@@ -52,6 +61,8 @@ class ChatGraph:
         """Initialize with database and LLM managers"""
         self.db = db_manager
         self.llm = llm_manager
+        # Limits for generated SQL so one bad query cannot stall a worker
+        self.query_budget = QueryBudget()
         self.graph = self._build_graph()
     
     def _build_graph(self):
@@ -155,8 +166,20 @@ class ChatGraph:
         user_input = state["user_input"]
         language = state["language"]
         
+        # Questions that are only known filters are answered from the agency snapshot
+        filters = self.db.get_structured_filters(user_input)
+        if filters:
+            return {
+                "sql_query": None,
+                "sql_query_type": "structured",
+                "sql_filters": [f"{k} = {v}" for k, v in filters.items() if k != "limit"],
+                "sql_explanation": "Answered from the in-memory agency snapshot",
+                "sql_params": None,
+                "structured_filters": filters
+            }
+        
         # Try LLM-generated SQL first
-        sql_result = self.llm.generate_sql(user_input, language)
+        sql_result = self.llm.generate_sql(user_input, language, schema=self.db.get_sql_prompt_schema())
         
         if sql_result:
             return {
@@ -191,15 +214,21 @@ class ChatGraph:
         """Execute SQL query"""
         sql_query = state.get("sql_query")
         params = state.get("sql_params")
+        filters = state.get("structured_filters")
         
-        if not sql_query:
+        if not sql_query and not filters:
             return {
                 "sql_error": "No SQL query generated",
                 "result_rows": [],
                 "row_count": 0
             }
         
-        df, error = self.db.execute_query(sql_query, params)
+        # Fetch only what the summarizer reads
+        max_rows = getattr(self.llm, "SUMMARY_ROW_LIMIT", DEFAULT_SUMMARY_ROWS)
+        if filters:
+            result, error = self.db.execute_structured(filters, max_rows=max_rows)
+        else:
+            result, error = self.db.execute_rows(sql_query, params, budget=self.query_budget, max_rows=max_rows)
         
         if error:
             return {
@@ -208,11 +237,17 @@ class ChatGraph:
                 "row_count": 0
             }
         
-        if df is not None:
+        if result is not None:
+            next_cursor = result.next_cursor
+            if next_cursor is None and sql_query:
+                next_cursor = self.db.query_cursor(sql_query, params, result)
             return {
-                "result_rows": df.to_dict(orient="records"),
-                "columns": list(df.columns),
-                "row_count": len(df)
+                "result_rows": result.records(),
+                "columns": list(result.columns),
+                "row_count": len(result),
+                "results_truncated": result.truncated,
+                # Set for list answers: db.fetch_page(next_cursor) returns the rows after these
+                "next_cursor": next_cursor
             }
         
         return {
@@ -225,11 +260,24 @@ class ChatGraph:
         row_count = state.get("row_count", 0)
         rows = state.get("result_rows", [])
         
+        # Rows of a single company come with its fact card so the answer can skip the LLM
+        kwargs = {}
+        agency_ids = {row.get("agency_id") for row in rows}
+        if len(agency_ids) == 1 and None not in agency_ids:
+            fact_card = self.db.get_fact_card(agency_ids.pop(), state["language"])
+            if fact_card:
+                kwargs["fact_card"] = fact_card
+        elif len(rows) > TrigramIndex.SHORTLIST_SIZE and None not in agency_ids:
+            # Many companies: the summary's name matching only re-ranks the trigram shortlist
+            kwargs["name_shortlist"] = self.db.shortlist_agencies
+        
         summary_result = self.llm.generate_summary(
             state["user_input"],
             state["language"],
             row_count,
-            rows
+            rows,
+            truncated=bool(state.get("results_truncated")),
+            **kwargs
         )
         
         return {
@@ -273,9 +321,12 @@ class ChatGraph:
             "sql_filters": None,
             "sql_explanation": None,
             "sql_error": None,
+            "structured_filters": None,
             "result_rows": None,
             "columns": None,
             "row_count": None,
+            "results_truncated": None,
+            "next_cursor": None,
             "summary": None,
             "greeting_text": None,
             "": None,
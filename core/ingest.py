@@ -0,0 +1,566 @@
+"""
+Ingestion Module
+Rebuild or delta-sync the agencies database from the cleaned CSV export and swap it in atomically
+
+Usage:
+    python -m core.ingest Cleaned_Data_Final.csv --db hajj_companies.db
+    python -m core.ingest Cleaned_Data_Final.csv --db hajj_companies.db --delta
+    python -m core.ingest Cleaned_Data_Final.csv --db hajj_companies.db --publish postgresql://host/hajj
+"""
+
+import os
+import re
+import csv
+import sqlite3
+import argparse
+import logging
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from core import schema
+from core.backend import PostgresBackend
+from utils.normalization import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# CSV header → agencies column
+CSV_COLUMNS = {
+    "Hajj Company (Arabic)": "hajj_company_ar",
+    "Hajj Company (English)": "hajj_company_en",
+    "formattedAddress": "formatted_address",
+    "City": "city",
+    "Country": "country",
+    "email": "email",
+    "Contact_Info": "contact_info",
+    "Rating Reviews": "rating_reviews",
+    "is_autorized": "is_authorized",
+    "Google_Maps_Link": "google_maps_link",
+}
+
+# Stored columns in insert order. The CSV has a single City/Country pair, in
+# English or Arabic depending on the row; the other language is carried over
+AGENCY_COLUMNS = schema.SOURCE_COLUMNS
+
+AGENCIES_DDL = """
+CREATE TABLE agencies (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hajj_company_ar TEXT,
+    hajj_company_en TEXT,
+    formatted_address TEXT,
+    city TEXT,
+    country TEXT,
+    email TEXT,
+    contact_info TEXT,
+    rating_reviews TEXT,
+    is_authorized BOOLEAN,
+    google_maps_link TEXT,
+    "المدينة" TEXT,
+    "الدولة" TEXT
+)
+"""
+
+# Tried in order; the export from Excel is Windows-1256, not UTF-8
+ENCODING_CANDIDATES = ("utf-8-sig", "cp1256", "latin-1")
+SAMPLE_BYTES = 1 << 20
+CHUNK_SIZE = 1000
+
+# Stored in both languages when the export has no city/country
+UNKNOWN_PLACE = "Unknown"
+
+_ARABIC = re.compile(r"[\u0600-\u06FF]")
+
+# (English name, Arabic name) of a city or country
+NamePair = Tuple[Optional[str], Optional[str]]
+
+
+# ---------------- Reading ----------------
+def detect_encoding(path: str, candidates: Tuple[str, ...] = ENCODING_CANDIDATES) -> str:
+    """First candidate encoding that decodes a sample of the file without errors"""
+    with open(path, "rb") as f:
+        sample = f.read(SAMPLE_BYTES)
+    for encoding in candidates:
+        try:
+            sample.decode(encoding)
+        except UnicodeDecodeError as e:
+            # A multi-byte character cut at the end of the sample is not a real error
+            if e.start < len(sample) - 4:
+                continue
+        return encoding
+    raise ValueError(f"Could not detect the encoding of {path}")
+
+
+def _clean(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    value = value.strip()
+    return value or None
+
+
+def read_chunks(path: str, encoding: str, chunk_size: int = CHUNK_SIZE) -> Iterator[List[Dict[str, Optional[str]]]]:
+    """Stream CSV rows as lists of {agencies column: value} dicts"""
+    with open(path, newline="", encoding=encoding) as f:
+        reader = csv.DictReader(f)
+        missing = set(CSV_COLUMNS) - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+        chunk: List[Dict[str, Optional[str]]] = []
+        for raw in reader:
+            row = {column: _clean(raw.get(header)) for header, column in CSV_COLUMNS.items()}
+            if (raw.get("Link_Valid") or "").strip().upper() == "FALSE":
+                row["google_maps_link"] = None
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+# ---------------- Carried-over Values ----------------
+def agency_identity(name_en: Optional[str], name_ar: Optional[str], address: Optional[str]) -> Tuple[str, str, str]:
+    """Key that recognises the same agency across exports"""
+    return (normalize_text(name_en), normalize_text(name_ar), normalize_text(address))
+
+
+def _as_exported(value: Optional[str], encoding: Optional[str]) -> Optional[str]:
+    """value as it reads back from a CSV saved in encoding (unencodable characters become '?')"""
+    if value is None or not encoding:
+        return value
+    return value.encode(encoding, errors="replace").decode(encoding)
+
+
+def _key(value: Optional[str], encoding: Optional[str] = None) -> str:
+    return normalize_text(_as_exported(value, encoding))
+
+
+def _split_by_script(value: Optional[str]) -> NamePair:
+    """Place name missing from the gazetteer as (English, Arabic) according to its script"""
+    if not value:
+        return (UNKNOWN_PLACE, UNKNOWN_PLACE)
+    if _ARABIC.search(value):
+        return (None, value)
+    return (value, None)
+
+
+class Gazetteer:
+    """
+    English/Arabic city and country names of the deployed database
+
+    The CSV has one City and one Country per row, each in English or Arabic
+    depending on the row. Names are looked up in either language and
+    resolved to the pair most often stored together.
+    """
+
+    def __init__(self):
+        self._country_votes: Dict[str, Counter] = defaultdict(Counter)
+        self._city_votes: Dict[Tuple[str, str], Counter] = defaultdict(Counter)
+        self.countries: Dict[str, NamePair] = {}
+        self.cities: Dict[Tuple[str, str], NamePair] = {}
+
+    def add(self, city: NamePair, country: NamePair, encoding: Optional[str] = None) -> None:
+        country_key = _key(country[0], encoding)
+        for name in country:
+            if name:
+                self._country_votes[_key(name, encoding)][country] += 1
+        for name in city:
+            if name:
+                self._city_votes[(_key(name, encoding), country_key)][city] += 1
+
+    def finish(self) -> "Gazetteer":
+        self.countries = {k: votes.most_common(1)[0][0] for k, votes in self._country_votes.items()}
+        self.cities = {k: votes.most_common(1)[0][0] for k, votes in self._city_votes.items()}
+        return self
+
+    def resolve(self, city: Optional[str], country: Optional[str]) -> Tuple[NamePair, NamePair]:
+        country_pair = self.countries.get(_key(country)) or _split_by_script(country)
+        city_pair = self.cities.get((_key(city), _key(country_pair[0]))) or _split_by_script(city)
+        return city_pair, country_pair
+
+
+def load_reference(db_path: Optional[str], encoding: Optional[str] = None) -> Tuple[Dict[Tuple, Dict], Gazetteer]:
+    """
+    Rows of the currently deployed database, to carry over what the CSV cannot hold
+
+    The CSV has one City/Country language per row and loses every character
+    its encoding cannot represent (Urdu/Persian letters, accented Latin).
+    Identities are computed on values as they would read back from such a
+    CSV, so those agencies are still recognised.
+
+    Returns:
+        (reference row by agency identity, gazetteer of stored locations)
+    """
+    by_identity: Dict[Tuple, Dict] = {}
+    gazetteer = Gazetteer()
+    if not db_path or not os.path.exists(db_path):
+        return by_identity, gazetteer.finish()
+
+    conn = sqlite3.connect(schema.file_uri(db_path), uri=True)
+    try:
+        if not schema.has_table(conn, "agencies"):
+            return by_identity, gazetteer.finish()
+        columns = ", ".join(f'"{c}"' for c in AGENCY_COLUMNS)
+        for values in conn.execute(f"SELECT {columns} FROM agencies ORDER BY id"):
+            ref = dict(zip(AGENCY_COLUMNS, values))
+            identity = agency_identity(*(
+                _as_exported(ref[c], encoding) for c in ("hajj_company_en", "hajj_company_ar", "formatted_address")
+            ))
+            by_identity.setdefault(identity, ref)
+            gazetteer.add((ref["city"], ref["المدينة"]), (ref["country"], ref["الدولة"]), encoding)
+    finally:
+        conn.close()
+    return by_identity, gazetteer.finish()
+
+
+def merge_with_reference(row: Dict[str, Optional[str]], by_identity: Dict, gazetteer: Gazetteer,
+                         encoding: Optional[str] = None) -> Dict[str, Optional[str]]:
+    """
+    CSV row completed from the deployed database
+
+    A known agency keeps its stored value wherever the CSV holds the same
+    value up to export loss, and its stored city/country pairs while the
+    CSV names them in either language. Everything else goes through the
+    gazetteer.
+    """
+    merged = dict(row)
+    ref = by_identity.get(agency_identity(row["hajj_company_en"], row["hajj_company_ar"], row["formatted_address"]))
+    if ref:
+        for column in CSV_COLUMNS.values():
+            if column not in ("city", "country") and _as_exported(ref[column], encoding) == row[column]:
+                merged[column] = ref[column]
+
+    city, country = gazetteer.resolve(row["city"], row["country"])
+    if ref:
+        if _key(row["country"]) in (_key(ref["country"], encoding), _key(ref["الدولة"], encoding)):
+            country = (ref["country"], ref["الدولة"])
+        if _key(row["city"]) in (_key(ref["city"], encoding), _key(ref["المدينة"], encoding)):
+            city = (ref["city"], ref["المدينة"])
+    merged["city"], merged["المدينة"] = city
+    merged["country"], merged["الدولة"] = country
+    return merged
+
+
+# ---------------- Building ----------------
+def build_database(csv_path: str, target_path: str, reference_path: Optional[str] = None,
+                   encoding: Optional[str] = None, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Create a complete, migrated agencies database at target_path from csv_path
+
+    Rows are bulk-loaded in one transaction before any index or trigger
+    exists; the schema migrations then build derived columns, search
+    index and statistics in one pass each.
+
+    Returns:
+        Number of agencies loaded
+    """
+    encoding = encoding or detect_encoding(csv_path)
+    logger.info(f"📥 Loading {csv_path} ({encoding})")
+    by_identity, gazetteer = load_reference(reference_path, encoding)
+
+    placeholders = ", ".join("?" for _ in AGENCY_COLUMNS)
+    columns = ", ".join(f'"{c}"' for c in AGENCY_COLUMNS)
+    insert = f"INSERT INTO agencies ({columns}) VALUES ({placeholders})"
+
+    conn = schema.connect(target_path, isolation_level=None)
+    try:
+        # Scratch file until it is swapped in: no journal needed
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(AGENCIES_DDL)
+
+        loaded = 0
+        conn.execute("BEGIN")
+        try:
+            for chunk in read_chunks(csv_path, encoding, chunk_size):
+                records = []
+                for row in chunk:
+                    row = merge_with_reference(row, by_identity, gazetteer, encoding)
+                    records.append(tuple(row[c] for c in AGENCY_COLUMNS))
+                conn.executemany(insert, records)
+                loaded += len(records)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if loaded == 0:
+            raise ValueError(f"No agencies found in {csv_path}")
+
+        version = schema.apply_migrations(conn)
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA journal_mode = DELETE")
+        check_integrity(conn)
+        logger.info(f"🛠️ Built {target_path}: {loaded} agencies, schema v{version}")
+        return loaded
+    finally:
+        conn.close()
+
+
+def check_integrity(conn: sqlite3.Connection) -> None:
+    """
+    Raise sqlite3.DatabaseError unless the file and its search index are sound
+
+    quick_check does not read the FTS5 shadow tables, so the index is also
+    compared with the agencies rows it was built from
+    """
+    check = conn.execute("PRAGMA quick_check").fetchone()[0]
+    if check != "ok":
+        raise sqlite3.DatabaseError(f"Integrity check failed: {check}")
+    if schema.has_table(conn, "agencies_fts"):
+        try:
+            conn.execute("INSERT INTO agencies_fts(agencies_fts, rank) VALUES ('integrity-check', 1)")
+        except sqlite3.DatabaseError as e:
+            raise sqlite3.DatabaseError(f"Search index integrity check failed: {e}") from e
+
+
+def swap_in(new_path: str, db_path: str) -> None:
+    """
+    Atomically replace db_path with new_path
+
+    Open connections keep reading the old file; new engines (and the query
+    cache) notice the changed file signature and move to the new one.
+    """
+    fd = os.open(new_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(new_path, db_path)
+    directory = os.path.dirname(os.path.abspath(db_path))
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # Directories cannot be opened for fsync on some platforms
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _staging_path(db_path: str, suffix: str) -> str:
+    """Scratch file next to db_path, so os.replace stays on one filesystem"""
+    directory = os.path.dirname(os.path.abspath(db_path))
+    tmp_path = os.path.join(directory, f".{os.path.basename(db_path)}.{os.getpid()}.{suffix}")
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    return tmp_path
+
+
+def ingest(csv_path: str, db_path: str = "hajj_companies.db", encoding: Optional[str] = None,
+           chunk_size: int = CHUNK_SIZE) -> Dict[str, float]:
+    """Build a new database next to db_path from csv_path and swap it in"""
+    started = time.perf_counter()
+    tmp_path = _staging_path(db_path, "ingest")
+    try:
+        rows = build_database(csv_path, tmp_path, reference_path=db_path, encoding=encoding, chunk_size=chunk_size)
+        swap_in(tmp_path, db_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    elapsed = time.perf_counter() - started
+    logger.info(f"✅ Swapped in {db_path} ({rows} agencies in {elapsed:.2f}s)")
+    return {"rows": rows, "seconds": round(elapsed, 3)}
+
+
+# ---------------- Delta Sync ----------------
+# Stored row matched by identity: (row id, source hash, agency id)
+StoredRow = Tuple[int, Optional[str], Optional[str]]
+
+
+def load_stored_rows(conn: sqlite3.Connection) -> Dict[Tuple[str, str, str], List[StoredRow]]:
+    """Rows of the database being synced, grouped by agency identity"""
+    stored: Dict[Tuple[str, str, str], List[StoredRow]] = defaultdict(list)
+    for row_id, name_en, name_ar, address, digest, agency_id in conn.execute(
+        "SELECT id, hajj_company_en, hajj_company_ar, formatted_address, source_hash, agency_id FROM agencies ORDER BY id"
+    ):
+        stored[agency_identity(name_en, name_ar, address)].append((row_id, digest, agency_id))
+    return stored
+
+
+def diff_rows(csv_path: str, stored: Dict[Tuple[str, str, str], List[StoredRow]], by_identity: Dict,
+              gazetteer: Gazetteer, encoding: str, chunk_size: int = CHUNK_SIZE) -> Dict[str, list]:
+    """
+    Compare the export with the stored rows by identity and source hash
+
+    Returns:
+        {"insert": [values + (hash,)], "update": [(stored row, values + (hash,))],
+         "delete": [stored row], "unchanged": count}, consuming stored
+    """
+    plan: Dict[str, list] = {"insert": [], "update": [], "delete": []}
+    unchanged = 0
+    for chunk in read_chunks(csv_path, encoding, chunk_size):
+        for row in chunk:
+            row = merge_with_reference(row, by_identity, gazetteer, encoding)
+            values = tuple(row[c] for c in AGENCY_COLUMNS)
+            digest = schema.source_hash(*values)
+            candidates = stored.get(agency_identity(row["hajj_company_en"], row["hajj_company_ar"], row["formatted_address"]))
+            if not candidates:
+                plan["insert"].append(values + (digest,))
+                continue
+            match = next((c for c in candidates if c[1] == digest), candidates[0])
+            candidates.remove(match)
+            if match[1] == digest:
+                unchanged += 1
+            else:
+                plan["update"].append((match, values + (digest,)))
+    plan["delete"] = [row for candidates in stored.values() for row in candidates]
+    plan["unchanged"] = unchanged
+    return plan
+
+
+def apply_delta(conn: sqlite3.Connection, plan: Dict[str, list], source: Optional[str] = None) -> Tuple[str, Set[str]]:
+    """
+    Apply a diff_rows plan in one transaction and log every change
+
+    Triggers keep the normalized columns, ratings, agency ids and search index of
+    the written rows current; only the entities those rows belong to are regrouped.
+
+    Returns:
+        (sync id, agency ids before and after the changes)
+    """
+    columns = ", ".join(f'"{c}"' for c in AGENCY_COLUMNS)
+    placeholders = ", ".join("?" for _ in AGENCY_COLUMNS)
+    assignments = ", ".join(f'"{c}" = ?' for c in AGENCY_COLUMNS)
+    new_agency_id = "SELECT agency_id FROM agencies WHERE id = ?"
+
+    sync_id = uuid.uuid4().hex
+    log: List[Tuple[str, int, Optional[str], Optional[str]]] = []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        parent_id = schema.head_sync(conn)
+        for row_id, _, agency_id in plan["delete"]:
+            conn.execute("DELETE FROM agencies WHERE id = ?", (row_id,))
+            log.append(("delete", row_id, None, agency_id))
+        for (row_id, _, agency_id), values in plan["update"]:
+            conn.execute(f"UPDATE agencies SET {assignments}, source_hash = ? WHERE id = ?", values + (row_id,))
+            log.append(("update", row_id, conn.execute(new_agency_id, (row_id,)).fetchone()[0], agency_id))
+        for values in plan["insert"]:
+            row_id = conn.execute(
+                f"INSERT INTO agencies ({columns}, source_hash) VALUES ({placeholders}, ?)", values
+            ).lastrowid
+            log.append(("insert", row_id, conn.execute(new_agency_id, (row_id,)).fetchone()[0], None))
+        conn.executemany(
+            "INSERT INTO agency_changes (sync_id, op, row_id, agency_id, old_agency_id) VALUES (?, ?, ?, ?, ?)",
+            [(sync_id,) + entry for entry in log],
+        )
+
+        affected = {i for _, _, new_id, old_id in log for i in (new_id, old_id) if i}
+        schema.refresh_entities(conn, affected)
+        schema.refresh_stats(conn, entities=False)
+        schema.record_sync(
+            conn, parent_id, source,
+            len(plan["insert"]), len(plan["update"]), len(plan["delete"]), sync_id=sync_id,
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return sync_id, affected
+
+
+def _stage_copy(db_path: str, staged_path: str) -> None:
+    """Consistent copy of db_path through the SQLite backup API"""
+    source = sqlite3.connect(schema.file_uri(db_path), uri=True)
+    try:
+        target = sqlite3.connect(staged_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+
+def sync(csv_path: str, db_path: str = "hajj_companies.db", encoding: Optional[str] = None,
+         chunk_size: int = CHUNK_SIZE) -> Dict[str, object]:
+    """
+    Apply only what changed in csv_path to db_path
+
+    Rows are matched by agency identity and compared by source hash; the inserts,
+    updates and deletes are applied to a staged copy that is then swapped in, so the
+    derived structures are kept and only touched rows are reindexed. Nothing is
+    swapped when nothing changed. The changes go to agency_changes, where the query
+    cache reads which agencies to invalidate.
+    """
+    if not os.path.exists(db_path):
+        logger.info(f"📥 No database at {db_path} to diff against, running a full ingest")
+        return ingest(csv_path, db_path, encoding=encoding, chunk_size=chunk_size)
+
+    started = time.perf_counter()
+    encoding = encoding or detect_encoding(csv_path)
+    logger.info(f"🔄 Syncing {db_path} with {csv_path} ({encoding})")
+    by_identity, gazetteer = load_reference(db_path, encoding)
+    tmp_path = _staging_path(db_path, "sync")
+    try:
+        _stage_copy(db_path, tmp_path)
+        conn = schema.connect(tmp_path, isolation_level=None)
+        try:
+            schema.apply_migrations(conn)
+            plan = diff_rows(csv_path, load_stored_rows(conn), by_identity, gazetteer, encoding, chunk_size)
+            if plan["unchanged"] + len(plan["insert"]) + len(plan["update"]) == 0:
+                raise ValueError(f"No agencies found in {csv_path}")
+            changed = len(plan["insert"]) + len(plan["update"]) + len(plan["delete"])
+            sync_id, affected = apply_delta(conn, plan, os.path.basename(csv_path)) if changed else (None, set())
+            if changed:
+                check_integrity(conn)
+        finally:
+            conn.close()
+        if changed:
+            swap_in(tmp_path, db_path)
+        else:
+            os.remove(tmp_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    elapsed = time.perf_counter() - started
+    result = {
+        "inserted": len(plan["insert"]),
+        "updated": len(plan["update"]),
+        "deleted": len(plan["delete"]),
+        "unchanged": plan["unchanged"],
+        "sync_id": sync_id,
+        "agency_ids": sorted(affected),
+        "seconds": round(elapsed, 3),
+    }
+    logger.info(
+        f"✅ Synced {db_path}: +{result['inserted']} ~{result['updated']} -{result['deleted']} "
+        f"({result['unchanged']} unchanged) in {elapsed:.2f}s"
+    )
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rebuild the agencies database from the cleaned CSV export")
+    parser.add_argument("csv_path", nargs="?", default="Cleaned_Data_Final.csv")
+    parser.add_argument("--db", default="hajj_companies.db", help="database file to replace")
+    parser.add_argument("--encoding", help="CSV encoding (detected when omitted)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--delta", action="store_true", help="apply only the rows that changed")
+    parser.add_argument("--publish", metavar="URL",
+                        help="then copy the agency tables into this shared PostgreSQL database")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.delta:
+        result = sync(args.csv_path, args.db, encoding=args.encoding, chunk_size=args.chunk_size)
+        if "rows" in result:
+            print(f"Loaded {result['rows']} agencies into {args.db} in {result['seconds']}s")
+        else:
+            print(
+                f"Synced {args.db}: {result['inserted']} inserted, {result['updated']} updated, "
+                f"{result['deleted']} deleted, {result['unchanged']} unchanged in {result['seconds']}s"
+            )
+    else:
+        result = ingest(args.csv_path, args.db, encoding=args.encoding, chunk_size=args.chunk_size)
+        print(f"Loaded {result['rows']} agencies into {args.db} in {result['seconds']}s")
+    if args.publish:
+        backend = PostgresBackend(args.publish)
+        counts = backend.publish(args.db)
+        print(f"Published {counts.get('agency', 0)} agencies to {backend.cache_namespace}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -13,11 +13,15 @@ from langsmith.wrappers import wrap_openai
 from openai import OpenAI
 import io
 import re
-from typing import Optional, List, Dict, Literal
+from typing import Any, Callable, Optional, List, Dict, Literal, Set
 from pydantic import BaseModel, Field
 from rapidfuzz import fuzz
 import logging
 import json
+
+from utils.normalization import normalize_text, normalize_company_name
+from core.database import sql_prompt_schema
+from core.fact_cards import is_lookup_question, render_card
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -112,6 +116,9 @@ class NEEDSInfoResponse(BaseModel):
 
 class LLMManager:
     """Manages OpenAI API calls with error handling, rate limiting, and context memory"""
+
+    # Result rows generate_summary reads; the graph fetches no more than this
+    SUMMARY_ROW_LIMIT = 50
     
     def __init__(self):
         """Initialize OpenAI client and company memory"""
@@ -157,6 +164,9 @@ class LLMManager:
     def update_last_company(self, company_name: Optional[str]):
         """Update the last mentioned company in session state"""
         if company_name:
+            if company_name != st.session_state.get("last_company_name"):
+                # The remembered id belongs to the previous company
+                st.session_state.pop("last_agency_id", None)
             st.session_state["last_company_name"] = company_name
             logger.info(f"💾 Company memory updated: {company_name}")
     
@@ -402,8 +412,14 @@ Avoid religious rulings or fatwa - stick to practical guidance."""
             logger.error(f"General answer generation failed: {e}")
             return "I encountered an error. Please try rephrasing your question."
     
-    def generate_sql(self, user_input: str, language: str) -> Optional[Dict]:
-        """Generate SQL query from user input with structured output and context awareness"""
+    def generate_sql(self, user_input: str, language: str,
+                     schema: Optional[Dict[str, Any]] = None) -> Optional[Dict]:
+        """
+        Generate SQL query from user input with structured output and context awareness
+
+        Args:
+            schema: What the store can be queried with (DatabaseManager.get_sql_prompt_schema)
+        """
         
         last_company = st.session_state.get("last_company_name", "")
         
@@ -486,12 +502,15 @@ Avoid religious rulings or fatwa - stick to practical guidance."""
         else:
             select_clause = "SELECT *"
         
+        last_agency_id = st.session_state.get("last_agency_id")
         if last_company and self._is_followup_question(user_input):
             context_note = f"\n\n⚠️ IMPORTANT CONTEXT: User is asking a follow-up question about '{last_company}' (mentioned previously in conversation). Generate SQL query specifically for this company using this SELECT clause: {select_clause}"
+            if last_agency_id:
+                context_note += f"\nThis company is agency_id '{last_agency_id}': query FROM agency WHERE agency_id = '{last_agency_id}' instead of matching its name."
         else:
             context_note = f"\n\n💡 Use this SELECT clause: {select_clause}"
         
-        sql_prompt = self._get_sql_system_prompt(language) + f"\n\nUser Question: {user_input}{context_note}"
+        sql_prompt = self._get_sql_system_prompt(language, schema) + f"\n\nUser Question: {user_input}{context_note}"
         
         try:
             response = self.client.beta.chat.completions.parse(
@@ -529,7 +548,10 @@ Avoid religious rulings or fatwa - stick to practical guidance."""
             logger.error(f"Structured SQL generation failed: {e}")
             return None
         
-    def generate_summary(self, user_input: str, language: str, row_count: int, sample_rows: List[Dict]) -> Dict:
+    def generate_summary(self, user_input: str, language: str, row_count: int, sample_rows: List[Dict],
+                         fact_card: Optional[Dict[str, Dict[str, str]]] = None,
+                         name_shortlist: Optional[Callable[[str], Set[str]]] = None,
+                         truncated: bool = False) -> Dict:
         """
         🔧 FIXED VERSION v2 - Improved company name matching + LLM-powered responses
         
@@ -539,6 +561,8 @@ Avoid religious rulings or fatwa - stick to practical guidance."""
         3. Handles partial matches more intelligently
         4. Fallback to showing all results if exact match fails
         5. Always uses LLM with focused prompts for all question types
+
+        truncated: the query matched more rows than the row_count shown
         """
         
         # Auto-detect language from user input
@@ -548,7 +572,13 @@ Avoid religious rulings or fatwa - stick to practical guidance."""
             logger.info(f"🌐 Language auto-detected from input: {language}")
         
         last_company = st.session_state.get("last_company_name", "")
+        if row_count == 1 and sample_rows and sample_rows[0].get("agency_id"):
+            # Follow-ups about this answer can address the company by id
+            st.session_state["last_agency_id"] = sample_rows[0]["agency_id"]
         
+        # A capped result is "the first N", never a total
+        count_text = f"{row_count}+" if truncated else str(row_count)
+
         # Detect if user asking for specific field only
         specific_field_request = None
         user_lower = user_input.lower()
@@ -644,6 +674,15 @@ Avoid religious rulings or fatwa - stick to practical guidance."""
                 else:
                     return {"summary": "No results found. Try rephrasing your question or broadening the search."}
         
+        # One company asked about by name or for one of its fields: render its fact card
+        if fact_card and (specific_field_request or is_lookup_question(
+            user_input, (sample_rows[0].get("hajj_company_en"), sample_rows[0].get("hajj_company_ar"))
+        )):
+            card_summary = render_card(fact_card, language, specific_field_request)
+            if card_summary:
+                logger.info(f"🪪 Answered from the fact card ({specific_field_request or 'full'})")
+                return {"summary": card_summary}
+
         # Prepare requested columns
         all_columns = [
             "hajj_company_en",
@@ -698,23 +737,27 @@ Avoid religious rulings or fatwa - stick to practical guidance."""
             requested_columns = all_columns
 
         # Use extracted company name for better matching
-        search_name = last_company.lower().strip() if last_company else user_input.lower().strip()
-        
-        # Remove common prefixes/suffixes for better matching
-        search_name = re.sub(r'\b(company|agency|شركة|وكالة|مؤسسة|کمپنی|ایجنسی)\b', '', search_name, flags=re.IGNORECASE).strip()
+        # Normalized and stripped of generic words (company, agency, شركة, ...)
+        search_name = normalize_company_name(last_company or user_input)
         
         logger.info(f"🔍 Searching for company: '{search_name}'")
         
         threshold = 60  # Lower threshold for more flexible matching
         matching_rows = []
 
-        for row in sample_rows:
-            name_en = row.get("hajj_company_en", "").lower()
-            name_ar = row.get("hajj_company_ar", "").lower()
+        # Many rows: only the agencies shortlisted by the trigram name index are scored
+        scored_rows = sample_rows
+        if name_shortlist is not None:
+            shortlisted = name_shortlist(search_name)
+            scored_rows = [row for row in sample_rows if row.get("agency_id") in shortlisted]
+
+        for row in scored_rows:
+            name_en = normalize_text(row.get("hajj_company_en"))
+            name_ar = normalize_text(row.get("hajj_company_ar"))
             
-            # Clean names for better matching
-            name_en_clean = re.sub(r'\b(company|agency|establishment)\b', '', name_en, flags=re.IGNORECASE).strip()
-            name_ar_clean = re.sub(r'\b(شركة|وكالة|مؤسسة|کمپنی|ایجنسی)\b', '', name_ar).strip()
+            # Clean names for better matching (memoized, repeated names are free)
+            name_en_clean = normalize_company_name(row.get("hajj_company_en"))
+            name_ar_clean = normalize_company_name(row.get("hajj_company_ar"))
             
             score_en = max(
                 fuzz.token_set_ratio(search_name, name_en),
@@ -757,7 +800,7 @@ Avoid religious rulings or fatwa - stick to practical guidance."""
             return {"summary": prompt_user}
 
         # Prepare FULL data for context (not just requested columns)
-        data_preview = matching_rows[:50]  # Send all columns
+        data_preview = matching_rows[:self.SUMMARY_ROW_LIMIT]  # Send all columns
         data_preview_json = json.dumps(data_preview, ensure_ascii=False)
 
         # Build focused instruction for LLM based on specific field request
@@ -898,6 +941,7 @@ Avoid religious rulings or fatwa - stick to practical guidance."""
 
     User question: {user_input}
     Data: {data_preview_json}
+    Rows found: {count_text}{" (only the first " + str(row_count) + " matches are shown; say so, never present it as the total)" if truncated else ""}
     {focus_instruction}
 
     Instructions:
@@ -1015,11 +1059,11 @@ Avoid religious rulings or fatwa - stick to practical guidance."""
         except Exception as e:
             logger.error(f"❌ Structured summary generation failed: {e}")
             if language == "اردو":
-                return {"summary": f"📊 {row_count} مماثل ریکارڈز ملے۔"}
+                return {"summary": f"📊 {count_text} مماثل ریکارڈز ملے۔"}
             elif language == "العربية":
-                return {"summary": f"📊 تم العثور على {row_count} سجلات متطابقة."}
+                return {"summary": f"📊 تم العثور على {count_text} سجلات متطابقة."}
             else:
-                return {"summary": f"📊 Found {row_count} matching records."}
+                return {"summary": f"📊 Found {count_text} matching records."}
 
     def text_to_speech(self, text: str, language: str) -> Optional[io.BytesIO]:
         """Convert text to speech using OpenAI TTS"""
@@ -1155,35 +1199,79 @@ Add a simple example of a more specific question.
                 }
     
     @staticmethod
-    def _get_sql_system_prompt(language: str) -> str:
-        """Get SQL generation system prompt with context awareness"""
+    def _get_sql_system_prompt(language: str, schema: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Get SQL generation system prompt with context awareness; tables, columns and
+        rules follow schema (sql_prompt_schema of the store, a full SQLite file by default)
+        """
+        schema = schema or sql_prompt_schema()
+        table = schema["table"]
+        columns = "\n".join(f"- {column}" for column in schema["columns"])
+        agency_id = "agency_id, " if schema["entity_ids"] else ""
+        rules = ""
+        if schema["ratings"]:
+            rules += """
+9. "Top rated" / "best" / "الأعلى تقييما" / "بہترین" → `WHERE rating IS NOT NULL ORDER BY rating DESC, review_count DESC`
+   - "rated above X" → `rating >= X`; "more than N reviews" → `review_count > N`
+   - Never parse rating_reviews text with LIKE or SUBSTR, use the numeric columns"""
+        if schema["locations"]:
+            rules += f"""
+10. "Near X" / "within N km of X" / "بالقرب من" / "کے قریب" → proximity through the location index:
+   - geo_place(name_norm, name, kind, city, lat, lng): known cities and districts (e.g. Al Aziziyah, Ajyad, Mina)
+   - agency_geo(id, min_lat, max_lat, min_lng, max_lng, lat, lng, precision): one point per agency, join with `{table} e ON e.row_id = g.id`
+   - precision: 1 city centroid, 2 district, 3 plus code, 4 exact; use `g.precision >= 2` when X is a district
+   - Constrain min_lat/min_lng to a box around the place (0.05 degrees ≈ 5 km), then order by `distance_km(g.lat, g.lng, p.lat, p.lng)`
+   - Never compute distances over the whole {table} table"""
+        follow_up = ""
+        if schema["entity_ids"]:
+            follow_up = "\n- If the context note gives its agency_id, filter with `WHERE agency_id = '<id>'` (exact, no LIKE needed)"
+        examples = ""
+        if schema["ratings"]:
+            examples += f"""
+Q: "أفضل الشركات تقييما في مكة"
+→ SELECT hajj_company_ar, hajj_company_en, "المدينة", rating, review_count, is_authorized
+FROM {table}
+WHERE rating IS NOT NULL
+  AND ("المدينة" LIKE '%مكة%' OR LOWER(city) LIKE '%makkah%' OR LOWER(city) LIKE '%mecca%')
+ORDER BY rating DESC, review_count DESC
+LIMIT 100;
+
+Q: "Agencies rated above 4.5 with more than 100 reviews"
+→ SELECT hajj_company_en, hajj_company_ar, city, country, rating, review_count, is_authorized
+FROM {table}
+WHERE rating >= 4.5 AND review_count > 100
+ORDER BY rating DESC, review_count DESC
+LIMIT 100;
+"""
+        if schema["locations"]:
+            examples += f"""
+Q: "Which authorized offices are near Al Aziziyah?"
+→ SELECT e.hajj_company_en, e.hajj_company_ar, e.formatted_address, e.is_authorized,
+       ROUND(distance_km(g.lat, g.lng, p.lat, p.lng), 2) AS distance_km
+FROM geo_place p
+JOIN agency_geo g ON g.min_lat BETWEEN p.lat - 0.05 AND p.lat + 0.05
+                 AND g.min_lng BETWEEN p.lng - 0.05 AND p.lng + 0.05
+JOIN {table} e ON e.row_id = g.id
+WHERE p.name_norm = normalize_text('Al Aziziyah') AND g.precision >= 2
+  AND e.is_authorized = 'Yes'
+ORDER BY distance_km
+LIMIT 10;
+"""
         return f"""
 You are a multilingual SQL fraud-prevention expert protecting Hajj pilgrims.
 
 🎯 MISSION: Generate an SQL query for database analysis on Hajj agencies.
-Do NOT generalize to world data — always query from the table 'agencies'.
+Do NOT generalize to world data — always query from the table '{table}' (one row per company, never SELECT DISTINCT company rows).
 
 TABLE STRUCTURE:
-- hajj_company_ar
-- hajj_company_en
-- formatted_address
-- city
-- country
-- email
-- contact_Info
-- rating_reviews
-- is_authorized ('Yes' or 'No')
-- google_maps_link
-- link_valid (boolean)
-- "المدينة" (city in Arabic - use this for Arabic queries)  
-- "الدولة" (country in Arabic - use this for Arabic queries)  
+{columns}
 
 --------------------------------------------
 🎯 LANGUAGE-SPECIFIC COLUMN USAGE:
 - For Arabic queries: Use "المدينة" and "الدولة" columns
 - For English/Urdu queries: Use city and country columns
-- Example Arabic: SELECT "المدينة", "الدولة" FROM agencies WHERE...
-- Example English: SELECT city, country FROM agencies WHERE...
+- Example Arabic: SELECT "المدينة", "الدولة" FROM {table} WHERE...
+- Example English: SELECT city, country FROM {table} WHERE...
 
 --------------------------------------------
 🔍 LANGUAGE DETECTION RULES:
@@ -1216,15 +1304,15 @@ TABLE STRUCTURE:
 4. "Countries" or "number of countries" or "الدول" or "ممالک" → use:
     - `SELECT COUNT(DISTINCT country)` if asking how many
     - `SELECT DISTINCT country` if asking for list
-    - Always based on agencies table
+    - Always based on {table} table
 5. "Cities" or "number of cities" or "المدن" or "شہر" → same logic as above but for `city`
 6. Never assume or add "Saudi Arabia" unless mentioned explicitly.
-7. When user asks about "countries that have agencies" → use `DISTINCT country` from `agencies`
-8. Always return agency-related data only, not external or world data.
+7. When user asks about "countries that have agencies" → use `DISTINCT country` from `{table}`
+8. Always return agency-related data only, not external or world data.{rules}
 
 --------------------------------------------
 🔗 FOLLOW-UP QUESTION HANDLING:
-- If a context note mentions a previously mentioned company, focus the query on that company
+- If a context note mentions a previously mentioned company, focus the query on that company{follow_up}
 - Use flexible LIKE matching to find the company in both Arabic and English columns
 - Example: If context says "about جبل عمر", include:
   WHERE (LOWER(TRIM(hajj_company_ar)) LIKE '%جبل%عمر%' 
@@ -1301,43 +1389,43 @@ Real Examples:
 ✅ EXAMPLES:
 
 Q: "هل شركة جبل عمر معتمدة؟"
-→ SELECT DISTINCT hajj_company_en, hajj_company_ar, formatted_address, city, country, email, contact_info, rating_reviews, is_authorized, google_maps_link
-FROM agencies
+→ SELECT {agency_id}hajj_company_en, hajj_company_ar, formatted_address, city, country, email, contact_info, rating_reviews, is_authorized, google_maps_link
+FROM {table}
 WHERE (LOWER(hajj_company_ar) LIKE '%جبل%' AND LOWER(hajj_company_ar) LIKE '%عمر%'
        OR LOWER(hajj_company_en) LIKE '%jabal%' AND LOWER(hajj_company_en) LIKE '%omar%')
 LIMIT 100;
 
 Q: "کیا جبل عمر منظور شدہ ہے؟"
-→ SELECT DISTINCT hajj_company_en, hajj_company_ar, formatted_address, city, country, email, contact_Info, rating_reviews, is_authorized, google_maps_link
-FROM agencies
+→ SELECT {agency_id}hajj_company_en, hajj_company_ar, formatted_address, city, country, email, contact_info AS "contact_Info", rating_reviews, is_authorized, google_maps_link
+FROM {table}
 WHERE (LOWER(TRIM(hajj_company_ar)) LIKE '%جبل%عمر%' 
        OR LOWER(TRIM(hajj_company_en)) LIKE '%jabal%omar%')
 LIMIT 1;
 
 Q: "is jabal omar authorized?"
-→ SELECT DISTINCT hajj_company_en, hajj_company_ar, formatted_address, city, country, email, contact_Info, rating_reviews, is_authorized, google_maps_link
-FROM agencies
+→ SELECT {agency_id}hajj_company_en, hajj_company_ar, formatted_address, city, country, email, contact_info AS "contact_Info", rating_reviews, is_authorized, google_maps_link
+FROM {table}
 WHERE (LOWER(TRIM(hajj_company_ar)) LIKE '%جبل%عمر%' 
        OR LOWER(TRIM(hajj_company_en)) LIKE '%jabal%omar%')
 LIMIT 1;
 
 Q: "یہ کہاں ہے؟" (with context: about "جبل عمر")
 → SELECT formatted_address, city, country, google_maps_link 
-FROM agencies 
+FROM {table} 
 WHERE (LOWER(TRIM(hajj_company_ar)) LIKE '%جبل%عمر%'
        OR LOWER(TRIM(hajj_company_en)) LIKE '%jabal%omar%')
 LIMIT 1;
 
 Q: "وين موقعها؟" (with context: about "جبل عمر")
 → SELECT formatted_address, city, country, google_maps_link 
-FROM agencies 
+FROM {table} 
 WHERE (LOWER(TRIM(hajj_company_ar)) LIKE '%جبل%عمر%'
        OR LOWER(TRIM(hajj_company_en)) LIKE '%jabal%omar%')
 LIMIT 1;
 
 Q: "کیا یہ ریاض میں ہے؟" (with context: about "جبل عمر")
 → SELECT hajj_company_en, hajj_company_ar, city, country, formatted_address
-FROM agencies
+FROM {table}
 WHERE (LOWER(TRIM(hajj_company_ar)) LIKE '%جبل%عمر%'
        OR LOWER(TRIM(hajj_company_en)) LIKE '%jabal%omar%')
   AND (city LIKE '%الرياض%' OR city LIKE '%ریاض%' OR LOWER(city) LIKE '%riyadh%')
@@ -1345,68 +1433,68 @@ LIMIT 1;
 
 Q: "هل موجودة في الرياض؟" (with context: about "جبل عمر")
 → SELECT hajj_company_en, hajj_company_ar, city, country, formatted_address
-FROM agencies
+FROM {table}
 WHERE (LOWER(TRIM(hajj_company_ar)) LIKE '%جبل%عمر%'
        OR LOWER(TRIM(hajj_company_en)) LIKE '%jabal%omar%')
   AND (city LIKE '%الرياض%' OR LOWER(city) LIKE '%riyadh%')
 LIMIT 1;
 
 Q: "Authorized agencies in Makkah"
-→ SELECT * FROM agencies 
+→ SELECT * FROM {table} 
 WHERE is_authorized = 'Yes' 
   AND (city LIKE '%مكة%' OR LOWER(city) LIKE '%mecca%' OR LOWER(city) LIKE '%makkah%') 
 LIMIT 100;
 
 Q: "مکہ میں منظور شدہ ایجنسیاں"
-→ SELECT * FROM agencies 
+→ SELECT * FROM {table} 
 WHERE is_authorized = 'Yes' 
   AND (city LIKE '%مكة%' OR city LIKE '%مکہ%' OR LOWER(city) LIKE '%mecca%' OR LOWER(city) LIKE '%makkah%') 
 LIMIT 100;
 
 Q: "كم عدد الشركات في المدينة؟"
-→ SELECT COUNT(*) FROM agencies 
+→ SELECT COUNT(*) FROM {table} 
 WHERE ("المدينة" LIKE '%المدينة%' OR "المدينة" LIKE '%مدینہ%' OR LOWER(city) LIKE '%medina%' OR LOWER(city) LIKE '%madinah%');
 
 Q: "وكالات معتمدة في الرياض"
 → SELECT hajj_company_ar, hajj_company_en, "المدينة", "الدولة", formatted_address, is_authorized 
-FROM agencies 
+FROM {table} 
 WHERE is_authorized = TRUE 
   AND ("المدينة" LIKE '%الرياض%' OR "المدينة" LIKE '%ریاض%' OR LOWER(city) LIKE '%riyadh%') 
 LIMIT 100;
 
 Q: "شركات في السعودية"
 → SELECT hajj_company_ar, hajj_company_en, "المدينة", "الدولة" 
-FROM agencies 
+FROM {table} 
 WHERE ("الدولة" LIKE '%السعودية%' OR "الدولة" LIKE '%سعودی%' OR LOWER(country) LIKE '%saudi%') 
 LIMIT 100;
 
 Q: "مدینہ میں کتنی کمپنیاں ہیں؟"
-→ SELECT COUNT(*) FROM agencies 
+→ SELECT COUNT(*) FROM {table} 
 WHERE (city LIKE '%المدينة%' OR city LIKE '%مدینہ%' OR LOWER(city) LIKE '%medina%' OR LOWER(city) LIKE '%madinah%');
 
 Q: "How many countries have agencies?"
-→ SELECT COUNT(DISTINCT country) FROM agencies;
+→ SELECT COUNT(DISTINCT country) FROM {table};
 
 Q: "کتنے ممالک میں ایجنسیاں ہیں؟"
-→ SELECT COUNT(DISTINCT country) FROM agencies;
+→ SELECT COUNT(DISTINCT country) FROM {table};
 
 Q: "رابطہ نمبر؟" (with context: about "الهدى")
-→ SELECT contact_Info, hajj_company_ar, hajj_company_en 
-FROM agencies 
+→ SELECT contact_info AS "contact_Info", hajj_company_ar, hajj_company_en 
+FROM {table} 
 WHERE (LOWER(TRIM(hajj_company_ar)) LIKE '%الهدى%'
        OR LOWER(TRIM(hajj_company_en)) LIKE '%huda%')
 LIMIT 1;
 
 Q: "List of countries that have agencies"
-→ SELECT DISTINCT country FROM agencies LIMIT 100;
+→ SELECT DISTINCT country FROM {table} LIMIT 100;
 
 Q: "رقم التواصل؟" (with context: about "الهدى")
-→ SELECT contact_Info, hajj_company_ar, hajj_company_en 
-FROM agencies 
+→ SELECT contact_info AS "contact_Info", hajj_company_ar, hajj_company_en 
+FROM {table} 
 WHERE (LOWER(TRIM(hajj_company_ar)) LIKE '%الهدى%'
        OR LOWER(TRIM(hajj_company_en)) LIKE '%huda%')
 LIMIT 1;
-"""
+{examples}"""
 
     @staticmethod
     def _extract_sql_from_response(response_text: str) -> Optional[str]:
@@ -0,0 +1,546 @@
+"""
+Agency Name Matching Module
+Precomputed agency name structures: a fuzzy scoring matrix, an exact name-spotting automaton
+and a cross-script transliteration key index
+"""
+
+import sys
+import time
+import sqlite3
+import random
+import argparse
+import logging
+from collections import deque
+from typing import AbstractSet, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from core import schema
+from utils.normalization import GENERIC_NAME_TERMS, has_arabic_script, normalize_text, phonetic_words
+
+logger = logging.getLogger(__name__)
+
+# Threads per cdist call (-1: one per core) once it scores at least PARALLEL_MIN_CHOICES
+# names; smaller calls finish before extra threads would start
+WORKERS = -1
+PARALLEL_MIN_CHOICES = 20000
+
+
+class NameAutomaton:
+    """
+    Word-level Aho-Corasick automaton over normalized phrases (agency names)
+
+    Transitions are whole words, so a match is always a whole-word mention
+    (contains_phrase semantics) and one pass over the words of a text finds
+    every phrase in it, however many phrases there are.
+    """
+
+    def __init__(self, phrases: Sequence[str]):
+        self.phrases = list(phrases)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._depth = [0]
+        # Indices of the phrases ending at each state
+        self._out: List[List[int]] = [[]]
+        for index, phrase in enumerate(self.phrases):
+            words = phrase.split() if phrase else []
+            if not words:
+                continue
+            state = 0
+            for word in words:
+                following = self._goto[state].get(word)
+                if following is None:
+                    following = len(self._goto)
+                    self._goto.append({})
+                    self._depth.append(self._depth[state] + 1)
+                    self._out.append([])
+                    self._goto[state][word] = following
+                state = following
+            self._out[state].append(index)
+
+        # Failure links (longest proper suffix that is a trie path) and output links
+        # (nearest suffix state where a phrase ends), breadth first
+        self._fail = [0] * len(self._goto)
+        self._output_link = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, following in self._goto[state].items():
+                queue.append(following)
+                fallback = self._fail[state]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                fail = self._goto[fallback].get(word, 0) if state else 0
+                self._fail[following] = fail
+                self._output_link[following] = fail if self._out[fail] else self._output_link[fail]
+
+    def __len__(self) -> int:
+        return len(self.phrases)
+
+    def find_all(self, text_norm: str) -> List[Tuple[int, int, int]]:
+        """Every phrase occurrence in text_norm as (first word, end word, phrase index), by end word"""
+        matches = []
+        state = 0
+        for position, word in enumerate(text_norm.split()):
+            while state and word not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(word, 0)
+            found = state if self._out[state] else self._output_link[state]
+            while found:
+                start = position + 1 - self._depth[found]
+                matches.extend((start, position + 1, index) for index in self._out[found])
+                found = self._output_link[found]
+        return matches
+
+    def find(self, text_norm: str) -> List[Tuple[int, int, int]]:
+        """Leftmost-longest non-overlapping mentions, in text order (first phrase on ties)"""
+        mentions = []
+        end = 0
+        for start, stop, index in sorted(self.find_all(text_norm), key=lambda m: (m[0], -m[1], m[2])):
+            if start >= end:
+                mentions.append((start, stop, index))
+                end = stop
+        return mentions
+
+    def contains_any(self, text_norm: str) -> bool:
+        """Whether any phrase occurs in text_norm"""
+        state = 0
+        for word in text_norm.split():
+            while state and word not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(word, 0)
+            if self._out[state] or self._output_link[state]:
+                return True
+        return False
+
+
+def trigrams(text_norm: str) -> set:
+    """Character trigrams of a normalized text, padded so word starts and ends count"""
+    padded = f" {text_norm.replace(' ', '  ')} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)} - {"   "}
+
+
+class TrigramIndex:
+    """
+    Inverted index from character trigrams to the phrases containing them
+
+    shortlist() ranks phrases by the trigrams they share with a query (Dice
+    overlap) and returns the top few for the rapidfuzz scorers to re-rank.
+    Trigrams found in a large share of the phrases (" al", "ravel") only
+    rank the phrases the selective ones found, so a probe reads short posting
+    lists instead of the whole name list.
+    """
+
+    # Phrases kept for re-ranking
+    SHORTLIST_SIZE = 200
+    # Trigrams in more than this share of the phrases (and more than
+    # SHORTLIST_SIZE of them) are too common to find candidates with
+    COMMON_SHARE = 0.02
+
+    def __init__(self, phrases: Sequence[str]):
+        postings: Dict[str, List[int]] = {}
+        counts = []
+        for index, phrase in enumerate(phrases):
+            grams = trigrams(phrase) if phrase else set()
+            counts.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(index)
+        self.size = len(counts)
+        self.gram_counts = np.array(counts, dtype=np.int32)
+        self.postings = {gram: np.array(rows, dtype=np.int64) for gram, rows in postings.items()}
+        self.common = max(self.SHORTLIST_SIZE, int(self.size * self.COMMON_SHARE))
+
+    def __len__(self) -> int:
+        return self.size
+
+    def shortlist(self, text_norm: str, limit: Optional[int] = None) -> np.ndarray:
+        """Indices (ascending) of the phrases sharing the most trigrams with text_norm"""
+        limit = limit or self.SHORTLIST_SIZE
+        grams = trigrams(text_norm)
+        lists = [self.postings[g] for g in grams if g in self.postings]
+        if not lists:
+            return np.zeros(0, dtype=np.int64)
+        selective = [rows for rows in lists if len(rows) <= self.common]
+        candidates = np.unique(np.concatenate(selective or lists))
+        if len(candidates) <= limit:
+            return candidates
+        # Shared trigrams of each candidate, common ones included
+        shared = np.zeros(len(candidates), dtype=np.int32)
+        for rows in lists:
+            shared += np.isin(candidates, rows, assume_unique=True)
+        dice = shared / (len(grams) + self.gram_counts[candidates])
+        best = np.argpartition(-dice, limit - 1)[:limit]
+        return np.sort(candidates[best])
+
+
+class SoundIndex:
+    """
+    Hash index of normalized phrases by transliteration key (phonetic_words),
+    so an Arabic or Urdu spelling of a Latin name, or the reverse, finds it with one probe
+
+    Each phrase is keyed whole; its words without generic ones (شركة, travel, ...)
+    and its leading words are keyed too when they keep at least two specific
+    words and half the phrase, since a spoken name is often the start of the
+    registered one but a greeting or a single common word is not a name. Only
+    phrases in the other script match: same-script spellings are left to the
+    exact and fuzzy matchers.
+    """
+
+    # A key needs this many consonants, and one more when it is a single word,
+    # to identify a name rather than a common word
+    MIN_KEY_LETTERS = 3
+    # Specific (non-generic) words a partial key of a phrase must keep
+    MIN_SPECIFIC_WORDS = 2
+    # Extra words a spoken window may have over the longest phrase (a split article)
+    WINDOW_SLACK = 2
+
+    def __init__(self, phrases: Sequence[str]):
+        self.keys: Dict[str, List[int]] = {}
+        self.prefixes: Dict[str, List[int]] = {}
+        self.arabic = [has_arabic_script(phrase) for phrase in phrases]
+        self.max_words = 0
+        for index, phrase in enumerate(phrases):
+            words = phrase.split()
+            # (word key, whether the word is specific) of each word that has a key
+            keyed = [(k, w not in GENERIC_NAME_TERMS) for w, k in zip(words, phonetic_words(phrase)) if k]
+            self._add(self.keys, self._key([k for k, _ in keyed]), index)
+            specific = [(k, True) for k, is_specific in keyed if is_specific]
+            if len(specific) >= self.MIN_SPECIFIC_WORDS:
+                self._add(self.keys, self._key([k for k, _ in specific]), index)
+                for variant in (keyed, specific):
+                    for size in range(max(2, (len(variant) + 1) // 2), len(variant)):
+                        prefix = variant[:size]
+                        if sum(is_specific for _, is_specific in prefix) >= self.MIN_SPECIFIC_WORDS:
+                            self._add(self.prefixes, self._key([k for k, _ in prefix]), index)
+            self.max_words = max(self.max_words, len(words))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @staticmethod
+    def _add(keys: Dict[str, List[int]], key: Optional[str], index: int) -> None:
+        if key is not None:
+            indices = keys.setdefault(key, [])
+            if not indices or indices[-1] != index:
+                indices.append(index)
+
+    def _key(self, word_keys: Sequence[str]) -> Optional[str]:
+        word_keys = [k for k in word_keys if k]
+        letters = sum(len(k) for k in word_keys)
+        if letters < self.MIN_KEY_LETTERS + (len(word_keys) == 1):
+            return None
+        return " ".join(word_keys)
+
+    def _probe(self, key: Optional[str], arabic: bool) -> List[int]:
+        """Phrases keyed by key (whole phrase first) written in the other script"""
+        if key is None:
+            return []
+        for keys in (self.keys, self.prefixes):
+            hits = [index for index in keys.get(key, ()) if self.arabic[index] != arabic]
+            if hits:
+                return hits
+        return []
+
+    def lookup(self, text_norm: str) -> List[int]:
+        """Indices of the phrases sounding like text_norm (whole phrase, else its start)"""
+        return self._probe(self._key(phonetic_words(text_norm)), has_arabic_script(text_norm))
+
+    def find(self, text_norm: str, ignore: AbstractSet[str] = frozenset()) -> List[Tuple[int, int, List[int]]]:
+        """
+        Leftmost-longest word windows of text_norm sounding like a phrase, as
+        (first word, end word, phrase indices), in text order; windows never
+        include an ignore word (question words that happen to sound like a name)
+        """
+        words = text_norm.split()
+        word_keys = phonetic_words(text_norm)
+        found = []
+        start = 0
+        while start < len(word_keys):
+            longest = min(len(word_keys), start + self.max_words + self.WINDOW_SLACK)
+            longest = next((end for end in range(start, longest) if words[end] in ignore), longest)
+            for end in range(longest, start, -1):
+                hits = self._probe(self._key(word_keys[start:end]), has_arabic_script(" ".join(words[start:end])))
+                if hits:
+                    found.append((start, end, hits))
+                    start = end
+                    break
+            else:
+                start += 1
+        return found
+
+
+class NameMatrix:
+    """
+    Agency names prepared once for fuzzy scoring against a spoken candidate
+
+    Every scorer is one cdist call over the names that can still reach its
+    cutoff (exact prefilters, so results equal a full process.extract):
+    - ratio-based scores skip names whose length alone caps the ratio below the cutoff
+    - token_sort_ratio is a plain ratio against each name's pre-sorted words
+    - token_set_ratio of a name sharing no word with the candidate is the ratio of
+      the two sorted word sets; only names sharing a word (found through an
+      inverted word index) need the full scorer
+    - word-by-word prefix matching scores each candidate word once against the
+      words found at its position, then reads the result through a
+      names × positions word-id matrix
+    """
+
+    def __init__(self, names: Sequence[str], normalized: Optional[Sequence[str]] = None):
+        self.names = list(names)
+        self.normalized = list(normalized) if normalized is not None else [normalize_text(name) for name in self.names]
+        words = [name.split() for name in self.normalized]
+
+        self.vocabulary: Dict[str, int] = {}
+        postings: List[List[int]] = []
+        for i, name_words in enumerate(words):
+            for word in dict.fromkeys(name_words):
+                word_id = self.vocabulary.setdefault(word, len(self.vocabulary))
+                if word_id == len(postings):
+                    postings.append([])
+                postings[word_id].append(i)
+        self.vocabulary_words = np.array(list(self.vocabulary), dtype=object)
+        self.vocabulary_lengths = np.array([len(w) for w in self.vocabulary], dtype=np.int32)
+        self.postings = [np.array(rows, dtype=np.int64) for rows in postings]
+
+        self.word_counts = np.array([len(w) for w in words], dtype=np.int32)
+        width = int(self.word_counts.max()) if words else 0
+        # Word ids by position from the start of each name; -1 past its last word
+        self.word_ids = np.full((len(words), width), -1, dtype=np.int32)
+        for i, name_words in enumerate(words):
+            self.word_ids[i, :len(name_words)] = [self.vocabulary[w] for w in name_words]
+        # Distinct word ids at each position
+        self.position_words = [np.unique(column[column >= 0]) for column in self.word_ids.T]
+
+        self.choices = np.array(self.normalized, dtype=object)
+        self.sorted_words = np.array([" ".join(sorted(w)) for w in words], dtype=object)
+        self.word_sets = np.array([" ".join(sorted(set(w))) for w in words], dtype=object)
+        self.lengths = np.array([len(name) for name in self.normalized], dtype=np.int32)
+        self.set_lengths = np.array([len(name) for name in self.word_sets], dtype=np.int32)
+        # First name with each normalized form
+        self.exact: Dict[str, int] = {}
+        for i, name in enumerate(self.normalized):
+            self.exact.setdefault(name, i)
+        self.automaton = NameAutomaton(self.normalized)
+        self.trigrams = TrigramIndex(self.normalized)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def find_exact(self, text_norm: str) -> Optional[int]:
+        """Index of the name whose normalized form is text_norm"""
+        return self.exact.get(text_norm) if text_norm else None
+
+    @staticmethod
+    def _within_length(lengths: np.ndarray, length: int, score_cutoff: float) -> np.ndarray:
+        """Names whose length lets fuzz.ratio against a length-long string reach score_cutoff"""
+        return 200 * np.minimum(lengths, length) >= score_cutoff * (lengths + length)
+
+    def _score(self, query: str, choices: np.ndarray, rows: np.ndarray, scorer, score_cutoff: float,
+               out: np.ndarray) -> None:
+        if len(rows):
+            workers = WORKERS if len(rows) >= PARALLEL_MIN_CHOICES else 1
+            out[rows] = process.cdist(
+                [query], choices[rows], scorer=scorer, score_cutoff=score_cutoff, dtype=np.float64, workers=workers
+            )[0]
+
+    def mentions(self, text_norm: str) -> List[int]:
+        """Indices of the names mentioned (whole words) in text_norm, in text order"""
+        found = dict.fromkeys(index for _, _, index in self.automaton.find_all(text_norm))
+        return list(found)
+
+    def shortlist(self, candidate_norm: str, limit: Optional[int] = None) -> np.ndarray:
+        """Names sharing the most character trigrams with candidate_norm, for the scorers' rows"""
+        return self.trigrams.shortlist(candidate_norm, limit)
+
+    def candidate_rows(self, candidate_norm: str) -> Optional[np.ndarray]:
+        """
+        Rows the scorers read for candidate_norm: its trigram shortlist, or None
+        (every name, the full cdist) when it shares no trigram with any name
+        """
+        rows = self.shortlist(candidate_norm)
+        return rows if len(rows) else None
+
+    def token_sort_scores(self, candidate_norm: str, score_cutoff: float = 0,
+                          rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        fuzz.token_sort_ratio of candidate_norm against every name, or only the
+        names at rows (such as a shortlist); 0 below score_cutoff and elsewhere
+        """
+        query = " ".join(sorted(candidate_norm.split()))
+        scores = np.zeros(len(self.names))
+        if rows is None:
+            rows = np.flatnonzero(self._within_length(self.lengths, len(query), score_cutoff))
+        else:
+            rows = rows[self._within_length(self.lengths[rows], len(query), score_cutoff)]
+        self._score(query, self.sorted_words, rows, fuzz.ratio, score_cutoff, scores)
+        return scores
+
+    def token_set_scores(self, candidate_norm: str, score_cutoff: float = 0,
+                         rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        fuzz.token_set_ratio of candidate_norm against every name, or only the
+        names at rows (such as a shortlist); 0 below score_cutoff and elsewhere
+        """
+        tokens = set(candidate_norm.split())
+        scores = np.zeros(len(self.names))
+        if not tokens:
+            return scores
+        shared = [self.postings[self.vocabulary[t]] for t in tokens if t in self.vocabulary]
+        sharing = np.unique(np.concatenate(shared)) if shared else np.zeros(0, dtype=np.int64)
+        query = " ".join(sorted(tokens))
+        disjoint = self._within_length(self.set_lengths, len(query), score_cutoff)
+        disjoint[sharing] = False
+        if rows is not None:
+            sharing = np.intersect1d(sharing, rows, assume_unique=True)
+            disjoint = rows[disjoint[rows]]
+        else:
+            disjoint = np.flatnonzero(disjoint)
+        self._score(query, self.word_sets, disjoint, fuzz.ratio, score_cutoff, scores)
+        self._score(candidate_norm, self.choices, sharing, fuzz.token_set_ratio, score_cutoff, scores)
+        return scores
+
+    def prefix_word_matches(self, candidate_norm: str, word_cutoff: float = 80,
+                            rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Per name (or per name at rows), how many candidate words fuzzily match the
+        word at the same position from the start of the name (0 for names shorter
+        than the candidate)
+        """
+        words = candidate_norm.split()
+        word_ids = self.word_ids if rows is None else self.word_ids[rows]
+        word_counts = self.word_counts if rows is None else self.word_counts[rows]
+        matches = np.zeros(len(word_ids), dtype=np.int32)
+        if not words or len(words) > self.word_ids.shape[1]:
+            return matches
+        for position, word in enumerate(words):
+            # Matching words at this position, plus a False slot that word id -1 reads
+            candidates = self.position_words[position]
+            found = candidates[self._within_length(self.vocabulary_lengths[candidates], len(word), word_cutoff)]
+            scores = np.zeros(len(self.vocabulary_words) + 1)
+            self._score(word, self.vocabulary_words, found, fuzz.ratio, word_cutoff, scores)
+            matches += scores[word_ids[:, position]] >= word_cutoff
+        matches[word_counts < len(words)] = 0
+        return matches
+
+    def best_prefix_match(self, candidate_norm: str, sort_scores: np.ndarray, min_word_ratio: float = 0.7,
+                          word_cutoff: float = 80, rows: Optional[np.ndarray] = None) -> Tuple[Optional[int], float]:
+        """
+        Name most similar to the candidate (sort_scores, from token_sort_scores)
+        among the names (at rows, when given) whose leading words match at least
+        min_word_ratio of the candidate's words
+
+        Returns:
+            (index, score), or (None, 0) when no name starts like the candidate
+        """
+        words = len(candidate_norm.split())
+        if not words:
+            return None, 0
+        eligible = self.prefix_word_matches(candidate_norm, word_cutoff, rows) / words >= min_word_ratio
+        if not eligible.any():
+            return None, 0
+        candidates = np.flatnonzero(eligible) if rows is None else rows[eligible]
+        best = int(candidates[np.argmax(sort_scores[candidates])])
+        return best, float(sort_scores[best])
+
+    def top(self, scores: np.ndarray, score_cutoff: float, limit: int) -> List[Tuple[str, float, int]]:
+        """
+        Best (normalized name, score, index) at or above score_cutoff, highest first
+        and in name order on ties, as process.extract returns them
+        """
+        indices = np.flatnonzero(scores >= score_cutoff)
+        order = indices[np.argsort(-scores[indices], kind="stable")[:limit]]
+        return [(self.normalized[i], float(scores[i]), int(i)) for i in order]
+
+
+# ---------------- Benchmark ----------------
+def _synthetic_names(names: Sequence[str], count: int) -> List[str]:
+    """count names made by recombining the words of names (for load tests beyond the real list)"""
+    rng = random.Random(7)
+    words = [name.split() for name in names if name.split()]
+    synthetic = list(names[:count])
+    while len(synthetic) < count:
+        base = rng.choice(words)
+        other = rng.choice(words)
+        synthetic.append(" ".join(base[:rng.randint(1, len(base))] + other[-rng.randint(1, len(other)):]))
+    return synthetic
+
+
+def _loop_prefix_match(normalized: Sequence[str], candidate_norm: str) -> Tuple[Optional[int], float]:
+    """Stage 2.5 as a Python loop over the names (reference for the benchmark)"""
+    candidate_words = candidate_norm.split()
+    best, best_score = None, 0
+    for i, name in enumerate(normalized):
+        name_words = name.split()
+        if len(candidate_words) <= len(name_words):
+            matched = sum(fuzz.ratio(cw, aw) >= 80 for cw, aw in zip(candidate_words, name_words))
+            if matched / len(candidate_words) >= 0.7:
+                score = fuzz.token_sort_ratio(candidate_norm, name)
+                if score > best_score:
+                    best, best_score = i, score
+    return best, best_score
+
+
+def benchmark(names: Sequence[str], sizes: Sequence[int], queries: int = 20) -> None:
+    """
+    Per-query latency of the vectorized stages as served (trigram shortlist,
+    whole list only when it is empty), over the whole list, and of the loop
+    they replace
+    """
+    rng = random.Random(11)
+    for size in sizes:
+        started = time.perf_counter()
+        matrix = NameMatrix(_synthetic_names(names, size))
+        build = time.perf_counter() - started
+        # Misspelt leading words of real names, like a mistranscribed mention
+        samples = []
+        for name in rng.sample(matrix.normalized, min(queries, len(matrix))):
+            words = name.split()[:3]
+            samples.append(" ".join(w[:-1] + "a" if len(w) > 3 else w for w in words))
+
+        def stages(candidate, rows):
+            scores = matrix.token_sort_scores(candidate, 75, rows)
+            matrix.best_prefix_match(candidate, scores, rows=rows)
+            matrix.top(scores, 85, 3)
+            matrix.top(matrix.token_set_scores(candidate, 80, rows), 80, 1)
+
+        started = time.perf_counter()
+        for candidate in samples:
+            stages(candidate, matrix.candidate_rows(candidate))
+        shortlisted = (time.perf_counter() - started) / len(samples) * 1000
+
+        started = time.perf_counter()
+        for candidate in samples:
+            stages(candidate, None)
+        whole = (time.perf_counter() - started) / len(samples) * 1000
+
+        started = time.perf_counter()
+        for candidate in samples[:5]:
+            _loop_prefix_match(matrix.normalized, candidate)
+            process.extract(candidate, matrix.normalized, scorer=fuzz.token_sort_ratio, score_cutoff=85, limit=3)
+            process.extract(candidate, matrix.normalized, scorer=fuzz.token_set_ratio, score_cutoff=80, limit=1)
+        loop = (time.perf_counter() - started) / min(5, len(samples)) * 1000
+
+        print(f"{size:>7} names | build {build:6.2f}s | trigram shortlist {shortlisted:8.2f} ms/query | "
+              f"whole list {whole:8.2f} ms/query | "
+              f"loop {loop:8.2f} ms/query | {loop / shortlisted:5.1f}x")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark transcript name matching against the agency list")
+    parser.add_argument("--db", default="hajj_companies.db", help="SQLite database to take agency names from")
+    parser.add_argument("--sizes", default="15000,50000,100000", help="Comma-separated name list sizes")
+    parser.add_argument("--queries", type=int, default=20, help="Candidates timed per size")
+    args = parser.parse_args(argv)
+
+    # Read-only, so a mistyped path fails instead of creating an empty file
+    conn = sqlite3.connect(schema.file_uri(args.db), uri=True)
+    names = [name.strip() for row in conn.execute("SELECT hajj_company_ar, hajj_company_en FROM agencies")
+             for name in row if name and name.strip()]
+    conn.close()
+    print(f"cdist workers={WORKERS}, {len(names)} agency names in {args.db}")
+    benchmark(names, [int(size) for size in args.sizes.split(",")], args.queries)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Query Budget Module
+Row cap, plan pre-check and execution limits for generated SQL
+"""
+
+import re
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# SQLite calls the progress handler once every this many VM instructions
+PROGRESS_INTERVAL = 10_000
+
+_TRAILING_LIMIT = re.compile(r"\bLIMIT\s+(\d+)(\s+OFFSET\s+\d+|\s*,\s*\d+)?\s*$", re.IGNORECASE)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a query is rejected before running or stopped while running"""
+
+
+class QueryBudget:
+    """Per-query limits: maximum rows returned, VM instructions and wall-clock seconds"""
+
+    __slots__ = ("max_rows", "max_steps", "timeout_seconds")
+
+    def __init__(self, max_rows: int = 200, max_steps: int = 20_000_000, timeout_seconds: float = 2.0):
+        self.max_rows = max_rows
+        self.max_steps = max_steps
+        self.timeout_seconds = timeout_seconds
+
+    def __repr__(self) -> str:
+        return f"QueryBudget(max_rows={self.max_rows}, max_steps={self.max_steps}, timeout_seconds={self.timeout_seconds})"
+
+
+# ---------------- Row Cap ----------------
+def apply_row_cap(sql: str, max_rows: int) -> str:
+    """
+    Bound the number of rows a SELECT can return
+
+    A trailing LIMIT within the cap is kept as written; anything else is wrapped
+    so the cap applies to the whole statement (compound queries included).
+    The derived table is named, which PostgreSQL requires.
+    """
+    match = _TRAILING_LIMIT.search(sql)
+    if match and int(match.group(1)) <= max_rows:
+        return sql
+    return f"SELECT * FROM (\n{sql}\n) AS capped LIMIT {int(max_rows)}"
+
+
+# ---------------- Plan Check ----------------
+def _is_full_scan(detail: str) -> bool:
+    """True for a plan step that visits every row of a table or index"""
+    if not detail.startswith("SCAN "):
+        return False
+    return "CONSTANT ROW" not in detail and "VIRTUAL TABLE" not in detail
+
+
+def find_unbounded_nesting(plan: List[Tuple[int, int, int, str]]) -> Optional[str]:
+    """
+    Look for full scans nested inside other full scans in EXPLAIN QUERY PLAN rows
+
+    SQLite lists the tables of one nested-loop join as siblings, so two full
+    scans under the same parent multiply. A full scan inside a correlated
+    subquery runs once per outer row and does the same.
+
+    Returns:
+        A short description of the offending plan step, or None when the plan is bounded
+    """
+    children: Dict[int, List[Tuple[int, str]]] = {}
+    for node_id, parent, _, detail in plan:
+        children.setdefault(parent, []).append((node_id, detail))
+
+    def has_full_scan(node_id: int) -> bool:
+        return any(_is_full_scan(d) or has_full_scan(c) for c, d in children.get(node_id, []))
+
+    for parent, nodes in children.items():
+        scans = [d for _, d in nodes if _is_full_scan(d)]
+        if len(scans) >= 2:
+            return f"nested full scans: {' x '.join(scans)}"
+        correlated = [c for c, d in nodes if d.startswith("CORRELATED") and has_full_scan(c)]
+        if correlated and scans:
+            return f"full scan per row of {scans[0]}"
+    return None
+
+
+def check_plan(conn, sql: str, params: Optional[Dict] = None) -> None:
+    """Run EXPLAIN QUERY PLAN on a SQLAlchemy connection and raise if the plan is unbounded"""
+    plan = [tuple(row) for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params or {})]
+    problem = find_unbounded_nesting(plan)
+    if problem:
+        raise QueryBudgetExceeded(f"Query plan rejected ({problem})")
+
+
+# ---------------- Execution Limits ----------------
+@contextmanager
+def execution_limits(dbapi_conn, budget: QueryBudget) -> Iterator[None]:
+    """
+    Abort the statement running on dbapi_conn once it exceeds the instruction
+    or wall-clock budget (SQLite raises OperationalError: interrupted)
+    """
+    deadline = time.monotonic() + budget.timeout_seconds
+    max_calls = max(1, budget.max_steps // PROGRESS_INTERVAL)
+    calls = 0
+
+    def on_progress() -> int:
+        nonlocal calls
+        calls += 1
+        return int(calls > max_calls or time.monotonic() > deadline)
+
+    dbapi_conn.set_progress_handler(on_progress, PROGRESS_INTERVAL)
+    try:
+        yield
+    except Exception as e:
+        if calls > max_calls or time.monotonic() > deadline:
+            logger.warning(f"⏱️ Query stopped after {calls * PROGRESS_INTERVAL:,} steps: {e}")
+            raise QueryBudgetExceeded("Query exceeded its execution budget") from e
+        raise
+    finally:
+        dbapi_conn.set_progress_handler(None, 0)
@@ -0,0 +1,175 @@
+"""
+Query Cache Module
+Process-wide TTL + LRU cache for query results, invalidated when the database file changes
+"""
+
+import os
+import re
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL_SECONDS = 600
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace and trailing semicolons so formatting does not split cache keys"""
+    return _WHITESPACE.sub(" ", sql).strip().rstrip(";").strip()
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    """Identity of the file on disk; changes on rewrite or atomic replacement"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+# Reads a database's change log: cursor → (new cursor, agency ids changed since cursor,
+# or None when unknown)
+ChangeFeed = Callable[[Optional[str]], Tuple[Optional[str], Optional[Set[str]]]]
+
+
+def make_key(db_path: str, sql: str, params: Optional[Dict] = None, kind: str = "df") -> Tuple:
+    """Cache key from database, normalized SQL, bound parameters and result shape"""
+    frozen = tuple(sorted((k, repr(v)) for k, v in params.items())) if params else ()
+    return (db_path, kind, normalize_sql(sql), frozen)
+
+
+class QueryCache:
+    """
+    Bounded LRU cache with per-entry TTL, keyed per database file
+
+    When the file changes every entry for it is dropped, except entries tagged
+    with the agencies they depend on while the file's change feed shows none of
+    those agencies changed.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, Optional[FrozenSet[str]]]]" = OrderedDict()
+        self._signatures: Dict[str, Optional[Tuple[int, int, int]]] = {}
+        self._feeds: Dict[str, ChangeFeed] = {}
+        self._cursors: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.retained = 0
+
+    # ---------------- Lookup ----------------
+    def get(self, key: Tuple) -> Optional[Any]:
+        """Return the cached value or None; key[0] must be the database path"""
+        self._check_file(key[0])
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value, _ = entry
+            if expires_at < now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Tuple, value: Any, agency_ids: Optional[FrozenSet[str]] = None) -> None:
+        """Store value; agency_ids lists the agencies it depends on (None: the whole database)"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value, agency_ids)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # ---------------- Invalidation ----------------
+    def set_change_feed(self, db_path: str, feed: ChangeFeed) -> None:
+        """Let entries for db_path that are tagged with agencies survive changes to other agencies"""
+        with self._lock:
+            self._feeds[db_path] = feed
+            fresh = db_path not in self._signatures
+        if not fresh:
+            return
+        # Signature first: a swap between the two reads is then seen as a change
+        signature = file_signature(db_path)
+        cursor, _ = feed(None)
+        with self._lock:
+            if db_path not in self._signatures:
+                self._signatures[db_path] = signature
+                self._cursors[db_path] = cursor
+
+    def _check_file(self, db_path: str) -> None:
+        """Drop the entries for db_path that a change of the file made stale"""
+        signature = file_signature(db_path)
+        with self._lock:
+            known = self._signatures.get(db_path, signature)
+            if known == signature:
+                self._signatures[db_path] = signature
+                return
+            feed = self._feeds.get(db_path)
+            cursor = self._cursors.get(db_path)
+        # Outside the lock: the feed reads the new file
+        cursor, changed = feed(cursor) if feed else (None, None)
+        with self._lock:
+            if self._signatures.get(db_path) != known:
+                return  # Another thread already handled this change
+            self._signatures[db_path] = signature
+            self._cursors[db_path] = cursor
+            stale = [
+                k for k, (_, _, agency_ids) in self._entries.items()
+                if k[0] == db_path and (changed is None or agency_ids is None or agency_ids & changed)
+            ]
+            kept = sum(1 for k in self._entries if k[0] == db_path) - len(stale)
+            for k in stale:
+                del self._entries[k]
+            self.invalidations += 1
+            self.retained += kept
+        if changed is None:
+            logger.info(f"♻️ Database file changed, dropped {len(stale)} cached results for {db_path}")
+        else:
+            logger.info(
+                f"♻️ {len(changed)} agencies changed in {db_path}: dropped {len(stale)} cached results, kept {kept}"
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._signatures.clear()
+            self._feeds.clear()
+            self._cursors.clear()
+
+    # ---------------- Metrics ----------------
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "retained": self.retained,
+            }
+
+
+# Shared by every DatabaseManager in the process (all Streamlit sessions)
+query_cache = QueryCache()
@@ -0,0 +1,741 @@
+"""
+Database Schema Module
+Idempotent migrations that add derived search structures to the agencies database
+"""
+
+import os
+import re
+import time
+import uuid
+import hashlib
+import sqlite3
+import threading
+import logging
+from typing import Dict, Callable, Iterable, List, Optional, Set, Tuple
+from urllib.parse import quote
+
+from core import geo
+from utils.normalization import normalize_column_value, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Bump when a new migration step is appended to MIGRATIONS
+SCHEMA_VERSION = 9
+
+# Columns an agency is loaded with from the source export, in insert order;
+# source_hash fingerprints exactly these values
+SOURCE_COLUMNS = [
+    "hajj_company_ar", "hajj_company_en", "formatted_address", "city", "country",
+    "email", "contact_info", "rating_reviews", "is_authorized", "google_maps_link",
+    "المدينة", "الدولة",
+]
+
+# Columns mirrored into the full-text search index (normalized name, city, country)
+SEARCH_COLUMNS = [
+    "name_en_norm",
+    "name_ar_norm",
+    "city_norm",
+    "country_norm",
+    "city_ar_norm",
+    "country_ar_norm",
+]
+
+# Precomputed normalized shadow columns: (shadow column, source column)
+NORMALIZED_COLUMNS = [
+    ("name_en_norm", "hajj_company_en"),
+    ("name_ar_norm", "hajj_company_ar"),
+    ("address_norm", "formatted_address"),
+    ("city_norm", "city"),
+    ("country_norm", "country"),
+    ("city_ar_norm", "المدينة"),
+    ("country_ar_norm", "الدولة"),
+]
+
+# Numeric columns parsed from rating_reviews text like "4.6 (5243 reviews)":
+# (column, SQL type, SQL function)
+NUMERIC_COLUMNS = [
+    ("rating", "REAL", "parse_rating"),
+    ("review_count", "INTEGER", "parse_review_count"),
+]
+
+_RATING_REVIEWS = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(?:\(\s*([\d,]+)\s*reviews?\s*\))?", re.IGNORECASE)
+
+# Columns copied from an entity's representative agencies row into the canonical agency table
+ENTITY_COLUMNS = [
+    "hajj_company_en",
+    "hajj_company_ar",
+    "formatted_address",
+    "city",
+    "country",
+    "المدينة",
+    "الدولة",
+    "email",
+    "contact_info",
+    "rating_reviews",
+    "rating",
+    "review_count",
+    "is_authorized",
+    "google_maps_link",
+] + [shadow for shadow, _ in NORMALIZED_COLUMNS]
+
+_HAS_LETTER = re.compile(r"[^\W\d_]")
+
+# Source columns geocode() reads, in argument order
+GEO_SOURCE_COLUMNS = ["formatted_address", "google_maps_link", "city", "المدينة", "country"]
+
+# Dimensions precomputed into agency_stats_breakdown: (dimension name, source column)
+STATS_DIMENSIONS = [
+    ("city", "city"),
+    ("country", "country"),
+    ("city_ar", "المدينة"),
+    ("country_ar", "الدولة"),
+    ("authorization", "is_authorized"),
+]
+
+_migrated: Dict[str, int] = {}
+_lock = threading.Lock()
+
+
+def _quote(column: str) -> str:
+    return f'"{column}"'
+
+
+def parse_rating(text: Optional[str]) -> Optional[float]:
+    """4.6 from "4.6 (5243 reviews)", None when there is no rating"""
+    match = _RATING_REVIEWS.match(text) if text else None
+    return float(match.group(1)) if match else None
+
+
+def parse_review_count(text: Optional[str]) -> Optional[int]:
+    """5243 from "4.6 (5243 reviews)", None when the count is missing"""
+    match = _RATING_REVIEWS.match(text) if text else None
+    if not match or not match.group(2):
+        return None
+    return int(match.group(2).replace(",", ""))
+
+
+def agency_entity_id(name_en: Optional[str], name_ar: Optional[str], address: Optional[str],
+                     city: Optional[str], country: Optional[str]) -> str:
+    """
+    Stable id of the company a row describes, from its normalized columns
+
+    Rows are the same agency when they share the English name (the Arabic one when
+    the English name has no letters) and the address, or the city and country when
+    there is no address. Arabic spelling variants therefore collapse into one entity.
+    """
+    name = name_en if name_en and _HAS_LETTER.search(name_en) else (name_ar or "")
+    place = address or f"{city or ''}|{country or ''}"
+    return hashlib.sha1(f"{name}\x1f{place}".encode("utf-8")).hexdigest()[:16]
+
+
+def source_hash(*values) -> str:
+    """Fingerprint of one agency's source values (SOURCE_COLUMNS order)"""
+    joined = "\x1f".join("\x00" if v is None else str(v) for v in values)
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()
+
+
+# ---------------- Migration Steps ----------------
+def _create_search_index(conn: sqlite3.Connection, columns: List[str]) -> None:
+    """FTS5 trigram index over agency names and locations, kept in sync by triggers"""
+    _create_search_table(conn, columns)
+    _create_search_triggers(conn, columns)
+    rebuild_search_index(conn)
+
+
+def _create_search_table(conn: sqlite3.Connection, columns: List[str]) -> None:
+    cols = ", ".join(_quote(c) for c in columns)
+    conn.execute("DROP TABLE IF EXISTS agencies_fts")
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE agencies_fts USING fts5(
+            {cols},
+            content='agencies',
+            content_rowid='id',
+            tokenize='trigram'
+        )
+    """)
+
+
+def _create_search_triggers(conn: sqlite3.Connection, columns: List[str]) -> None:
+    """
+    Triggers indexing normalize_text() of the source columns of each indexed shadow
+    column. The shadow columns are only written by agencies_norm_* after these fire,
+    so reading them here would index NULLs on insert and delete values never indexed
+    """
+    sources = dict(NORMALIZED_COLUMNS)
+    cols = ", ".join(_quote(c) for c in columns)
+    watched = ", ".join(sorted({_quote(sources[c]) for c in columns}))
+    new_cols = ", ".join(f"normalize_text(new.{_quote(sources[c])})" for c in columns)
+    old_cols = ", ".join(f"normalize_text(old.{_quote(sources[c])})" for c in columns)
+
+    # Writers must use connect() so normalize_text is available to these triggers
+    for trigger in ("agencies_fts_ai", "agencies_fts_ad", "agencies_fts_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute(f"""
+        CREATE TRIGGER agencies_fts_ai AFTER INSERT ON agencies BEGIN
+            INSERT INTO agencies_fts(rowid, {cols}) VALUES (new.id, {new_cols});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER agencies_fts_ad AFTER DELETE ON agencies BEGIN
+            INSERT INTO agencies_fts(agencies_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER agencies_fts_au AFTER UPDATE OF {watched} ON agencies BEGIN
+            INSERT INTO agencies_fts(agencies_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+            INSERT INTO agencies_fts(rowid, {cols}) VALUES (new.id, {new_cols});
+        END
+    """)
+
+
+def _repair_search_index(conn: sqlite3.Connection) -> None:
+    """Search triggers of earlier builds read the shadow columns before they were written"""
+    _create_search_triggers(conn, SEARCH_COLUMNS)
+    rebuild_search_index(conn)
+
+
+def _add_normalized_columns(conn: sqlite3.Connection) -> None:
+    """Shadow columns holding the normalized form of each lookup column, plus their indexes"""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(agencies)")}
+    for shadow, _ in NORMALIZED_COLUMNS:
+        if shadow not in existing:
+            conn.execute(f"ALTER TABLE agencies ADD COLUMN {shadow} TEXT")
+    refresh_normalized_columns(conn)
+
+    # Name indexes also cover is_authorized so "is X authorized?" never touches the table
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agencies_name_en_norm ON agencies(name_en_norm, is_authorized)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agencies_name_ar_norm ON agencies(name_ar_norm, is_authorized)")
+    for shadow, _ in NORMALIZED_COLUMNS[2:]:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_agencies_{shadow} ON agencies({shadow})")
+    conn.execute("ANALYZE agencies")
+
+
+def _create_search_structures(conn: sqlite3.Connection) -> None:
+    """
+    Normalized shadow columns with their triggers, and the FTS5 index over them
+    (also replaces the raw-column index of databases left at version 1 or 2)
+    """
+    _add_normalized_columns(conn)
+    _create_derived_triggers(conn, [(shadow, "normalize_text", source) for shadow, source in NORMALIZED_COLUMNS])
+    _create_search_index(conn, SEARCH_COLUMNS)
+
+
+def _create_derived_triggers(conn: sqlite3.Connection, derived: List[Tuple[str, str, str]]) -> None:
+    """
+    Triggers recomputing derived columns, given as (column, SQL function, source column),
+    whenever a source column is written
+    """
+    # Writers must use connect() so the Python functions are available to these triggers
+    sources = ", ".join(sorted({_quote(source) for _, _, source in derived}))
+    assignments = ", ".join(
+        f"{column} = {function}(new.{_quote(source)})" for column, function, source in derived
+    )
+    for trigger in ("agencies_norm_ai", "agencies_norm_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute(f"""
+        CREATE TRIGGER agencies_norm_ai AFTER INSERT ON agencies BEGIN
+            UPDATE agencies SET {assignments} WHERE id = new.id;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER agencies_norm_au AFTER UPDATE OF {sources} ON agencies BEGIN
+            UPDATE agencies SET {assignments} WHERE id = new.id;
+        END
+    """)
+
+
+def _create_stats_tables(conn: sqlite3.Connection) -> None:
+    """Materialized totals and per-dimension breakdowns read by the sidebar"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS agency_stats (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS agency_stats_breakdown (
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            authorized INTEGER NOT NULL,
+            PRIMARY KEY (dimension, value)
+        ) WITHOUT ROWID
+    """)
+    refresh_stats(conn)
+
+
+def _add_numeric_rating_columns(conn: sqlite3.Connection) -> None:
+    """rating / review_count parsed from rating_reviews, indexed for ranking and per-place ranking"""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(agencies)")}
+    for column, sql_type, _ in NUMERIC_COLUMNS:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE agencies ADD COLUMN {column} {sql_type}")
+    refresh_numeric_columns(conn)
+    _create_derived_triggers(
+        conn,
+        [(shadow, "normalize_text", source) for shadow, source in NORMALIZED_COLUMNS]
+        + [(column, function, "rating_reviews") for column, _, function in NUMERIC_COLUMNS],
+    )
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agencies_rating ON agencies(rating, review_count)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agencies_review_count ON agencies(review_count)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agencies_city_rating ON agencies(city_norm, rating, review_count)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agencies_country_rating ON agencies(country_norm, rating, review_count)")
+    # Superseded by the composite indexes above (same leading column)
+    conn.execute("DROP INDEX IF EXISTS idx_agencies_city_norm")
+    conn.execute("DROP INDEX IF EXISTS idx_agencies_country_norm")
+    conn.execute("ANALYZE agencies")
+
+
+def _create_entity_tables(conn: sqlite3.Connection) -> None:
+    """Canonical agency table (one row per company) and the alias table of its name variants"""
+    existing = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(agencies)")}
+    if "agency_id" not in existing:
+        conn.execute("ALTER TABLE agencies ADD COLUMN agency_id TEXT")
+    columns = ",\n".join(f"{_quote(c)} {existing.get(c) or 'TEXT'}" for c in ENTITY_COLUMNS)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS agency (
+            agency_id TEXT PRIMARY KEY,
+            row_id INTEGER NOT NULL,
+            variants INTEGER NOT NULL,
+            {columns}
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS agency_alias (
+            alias_norm TEXT NOT NULL,
+            agency_id TEXT NOT NULL,
+            alias TEXT,
+            PRIMARY KEY (alias_norm, agency_id)
+        ) WITHOUT ROWID
+    """)
+    refresh_stats(conn)
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agencies_agency_id ON agencies(agency_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agency_alias_agency_id ON agency_alias(agency_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agency_rating ON agency(rating, review_count)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agency_city_rating ON agency(city_norm, rating, review_count)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agency_country_rating ON agency(country_norm, rating, review_count)")
+    for shadow in ("address_norm", "city_ar_norm", "country_ar_norm"):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_agency_{shadow} ON agency({shadow})")
+    conn.execute("ANALYZE")
+
+
+def _create_change_log(conn: sqlite3.Connection) -> None:
+    """
+    Per-row source hashes for delta syncs, a trigger keeping agency_id current,
+    and the change log downstream caches read to invalidate selectively
+    """
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(agencies)")}
+    if "source_hash" not in existing:
+        conn.execute("ALTER TABLE agencies ADD COLUMN source_hash TEXT")
+    refresh_source_hashes(conn)
+
+    # Fires when the normalization triggers rewrite the shadow columns of a written row
+    entity_sources = ("name_en_norm", "name_ar_norm", "address_norm", "city_norm", "country_norm")
+    conn.execute("DROP TRIGGER IF EXISTS agencies_entity_au")
+    conn.execute(f"""
+        CREATE TRIGGER agencies_entity_au AFTER UPDATE OF {", ".join(entity_sources)} ON agencies BEGIN
+            UPDATE agencies
+            SET agency_id = agency_entity_id({", ".join(f"new.{c}" for c in entity_sources)})
+            WHERE id = new.id;
+        END
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS agency_syncs (
+            sync_id TEXT PRIMARY KEY,
+            parent_id TEXT,
+            synced_at REAL NOT NULL,
+            source TEXT,
+            inserted INTEGER NOT NULL DEFAULT 0,
+            updated INTEGER NOT NULL DEFAULT 0,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            last_seq INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS agency_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            sync_id TEXT NOT NULL,
+            op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+            row_id INTEGER NOT NULL,
+            agency_id TEXT,
+            old_agency_id TEXT
+        )
+    """)
+    # Base of the log: every file built from scratch starts a new lineage
+    record_sync(conn, None, "base")
+
+
+def _create_location_index(conn: sqlite3.Connection) -> None:
+    """
+    R*Tree of geocoded agency locations (one point per agencies row) kept current by
+    triggers, and the geo_place gazetteer proximity queries start from
+    """
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS agency_geo USING rtree(
+            id, min_lat, max_lat, min_lng, max_lng,
+            +lat REAL, +lng REAL, +precision INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS geo_place (
+            name_norm TEXT NOT NULL,
+            name TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            city TEXT NOT NULL,
+            country TEXT,
+            lat REAL NOT NULL,
+            lng REAL NOT NULL,
+            PRIMARY KEY (name_norm, city)
+        ) WITHOUT ROWID
+    """)
+    refresh_places(conn)
+    refresh_locations(conn)
+
+    # Writers must use connect() so geocode_* are available to these triggers
+    watched = ", ".join(_quote(c) for c in GEO_SOURCE_COLUMNS)
+    for trigger in ("agencies_geo_ai", "agencies_geo_au", "agencies_geo_ad"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute(f"""
+        CREATE TRIGGER agencies_geo_ai AFTER INSERT ON agencies BEGIN
+            {_located_insert("new")};
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER agencies_geo_au AFTER UPDATE OF {watched} ON agencies BEGIN
+            DELETE FROM agency_geo WHERE id = old.id;
+            {_located_insert("new")};
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER agencies_geo_ad AFTER DELETE ON agencies BEGIN
+            DELETE FROM agency_geo WHERE id = old.id;
+        END
+    """)
+    # Proximity results join the R*Tree back to each company's representative row
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agency_row_id ON agency(row_id)")
+
+
+def _located_insert(row: str) -> str:
+    """INSERT of one row's geocoded point into agency_geo (nothing when it cannot be placed)"""
+    args = ", ".join(f"{row}.{_quote(c)}" for c in GEO_SOURCE_COLUMNS)
+    return f"""
+            INSERT INTO agency_geo (id, min_lat, max_lat, min_lng, max_lng, lat, lng, precision)
+            SELECT id, lat, lat, lng, lng, lat, lng, precision FROM (
+                SELECT {row}.id AS id, geocode_lat({args}) AS lat, geocode_lng({args}) AS lng,
+                       geocode_precision({args}) AS precision
+            ) WHERE lat IS NOT NULL"""
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    # Versions 1 (raw-column search index) and 2 (normalized columns) are folded into 3
+    (3, "normalized columns and fts5 trigram search index", _create_search_structures),
+    (4, "materialized statistics", _create_stats_tables),
+    (5, "numeric rating columns", _add_numeric_rating_columns),
+    (6, "canonical agency entities", _create_entity_tables),
+    (7, "delta sync change log", _create_change_log),
+    (8, "geocoded location index", _create_location_index),
+    (9, "search index triggers over normalized source columns", _repair_search_index),
+]
+
+
+# ---------------- Public API ----------------
+def register_functions(conn: sqlite3.Connection) -> None:
+    """Expose the Python helpers that triggers and refresh statements call"""
+    # Already done on this connection: redefining a function fails while a statement
+    # is active, and the R*Tree keeps a node blob open until its transaction ends
+    if conn.execute("SELECT 1 FROM pragma_function_list WHERE name = 'distance_km'").fetchone():
+        return
+    conn.create_function("normalize_text", 1, normalize_column_value, deterministic=True)
+    conn.create_function("parse_rating", 1, parse_rating, deterministic=True)
+    conn.create_function("parse_review_count", 1, parse_review_count, deterministic=True)
+    conn.create_function("agency_entity_id", 5, agency_entity_id, deterministic=True)
+    conn.create_function("source_hash", -1, source_hash, deterministic=True)
+    for index, name in enumerate(("geocode_lat", "geocode_lng", "geocode_precision")):
+        conn.create_function(name, len(GEO_SOURCE_COLUMNS), geo.geocode_part(index), deterministic=True)
+    conn.create_function("distance_km", 4, geo.distance_km, deterministic=True)
+
+
+def file_uri(db_path: str, options: str = "mode=ro") -> str:
+    """SQLite URI for db_path with its path percent-quoted, read-only by default"""
+    return f"file:{quote(os.path.abspath(db_path))}?{options}"
+
+
+def connect(db_path: str, **kwargs) -> sqlite3.Connection:
+    """Open a connection that can write to agencies (triggers need the registered functions)"""
+    conn = sqlite3.connect(db_path, **kwargs)
+    register_functions(conn)
+    return conn
+
+
+def refresh_normalized_columns(conn: sqlite3.Connection) -> None:
+    """Recompute every normalized shadow column from its source column"""
+    register_functions(conn)
+    assignments = ", ".join(
+        f"{shadow} = normalize_text({_quote(source)})" for shadow, source in NORMALIZED_COLUMNS
+    )
+    conn.execute(f"UPDATE agencies SET {assignments}")
+
+
+def refresh_numeric_columns(conn: sqlite3.Connection) -> None:
+    """Recompute rating / review_count from rating_reviews"""
+    register_functions(conn)
+    assignments = ", ".join(f"{column} = {function}(rating_reviews)" for column, _, function in NUMERIC_COLUMNS)
+    conn.execute(f"UPDATE agencies SET {assignments}")
+
+
+def rebuild_search_index(conn: sqlite3.Connection) -> None:
+    """Repopulate the FTS index from the agencies table"""
+    conn.execute("INSERT INTO agencies_fts(agencies_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO agencies_fts(agencies_fts) VALUES ('optimize')")
+
+
+def refresh_source_hashes(conn: sqlite3.Connection) -> None:
+    """Recompute source_hash from the source columns of every row"""
+    register_functions(conn)
+    conn.execute(f"UPDATE agencies SET source_hash = source_hash({', '.join(_quote(c) for c in SOURCE_COLUMNS)})")
+
+
+def refresh_places(conn: sqlite3.Connection) -> None:
+    """Reload geo_place from the gazetteer in core.geo"""
+    conn.execute("DELETE FROM geo_place")
+    places = [(names, "city", names[0], country, lat, lng) for names, country, lat, lng in geo.CITIES]
+    places += [(names, "district", parent, None, lat, lng) for names, parent, lat, lng in geo.DISTRICTS]
+    conn.executemany(
+        "INSERT OR IGNORE INTO geo_place (name_norm, name, kind, city, country, lat, lng) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (normalize_text(name), names[0], kind, city, country, lat, lng)
+            for names, kind, city, country, lat, lng in places
+            for name in names
+        ],
+    )
+
+
+def refresh_locations(conn: sqlite3.Connection) -> None:
+    """Geocode every agencies row again into agency_geo"""
+    register_functions(conn)
+    conn.execute("DELETE FROM agency_geo")
+    conn.execute(f"""
+        INSERT INTO agency_geo (id, min_lat, max_lat, min_lng, max_lng, lat, lng, precision)
+        SELECT id, lat, lat, lng, lng, lat, lng, precision FROM (
+            SELECT id, geocode_lat({_geo_args()}) AS lat, geocode_lng({_geo_args()}) AS lng,
+                   geocode_precision({_geo_args()}) AS precision
+            FROM agencies
+        ) WHERE lat IS NOT NULL
+    """)
+
+
+def _geo_args() -> str:
+    return ", ".join(_quote(c) for c in GEO_SOURCE_COLUMNS)
+
+
+def refresh_entities(conn: sqlite3.Connection, agency_ids: Optional[Iterable[str]] = None) -> None:
+    """
+    Regroup agencies rows into the canonical agency and agency_alias tables
+
+    Each entity takes its columns from its lowest-id row; every distinct normalized
+    English and Arabic name of its rows becomes an alias. With agency_ids, only those
+    entities are rebuilt (the ids of written rows, before and after the write).
+    """
+    register_functions(conn)
+    if agency_ids is None:
+        scope, alias_scope = "", ""
+        conn.execute("""
+            UPDATE agencies
+            SET agency_id = agency_entity_id(name_en_norm, name_ar_norm, address_norm, city_norm, country_norm)
+        """)
+    else:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS entity_scope (agency_id TEXT PRIMARY KEY) WITHOUT ROWID")
+        conn.execute("DELETE FROM temp.entity_scope")
+        conn.executemany(
+            "INSERT OR IGNORE INTO temp.entity_scope (agency_id) VALUES (?)",
+            ((agency_id,) for agency_id in agency_ids if agency_id),
+        )
+        in_scope = "agency_id IN (SELECT agency_id FROM temp.entity_scope)"
+        scope, alias_scope = f"WHERE {in_scope}", f"AND {in_scope}"
+    cols = ", ".join(_quote(c) for c in ENTITY_COLUMNS)
+    source_cols = ", ".join(f"a.{_quote(c)}" for c in ENTITY_COLUMNS)
+    conn.execute(f"DELETE FROM agency {scope}")
+    conn.execute(f"""
+        INSERT INTO agency (agency_id, row_id, variants, {cols})
+        SELECT a.agency_id, a.id, g.variants, {source_cols}
+        FROM (
+            SELECT agency_id, MIN(id) AS row_id, COUNT(*) AS variants FROM agencies {scope} GROUP BY agency_id
+        ) g
+        JOIN agencies a ON a.id = g.row_id
+    """)
+    conn.execute(f"DELETE FROM agency_alias {scope}")
+    for shadow, source in NORMALIZED_COLUMNS[:2]:
+        conn.execute(f"""
+            INSERT OR IGNORE INTO agency_alias (alias_norm, agency_id, alias)
+            SELECT {shadow}, agency_id, {_quote(source)} FROM agencies
+            WHERE {shadow} IS NOT NULL AND {shadow} != ''
+            {alias_scope}
+            ORDER BY id
+        """)
+
+
+def refresh_stats(conn: sqlite3.Connection, entities: bool = True) -> None:
+    """
+    Recompute agency_stats and agency_stats_breakdown from agencies
+
+    Run after any bulk write to agencies; readers never aggregate the table themselves.
+    Once the canonical agency table exists it is refreshed first (skip with
+    entities=False when the caller already refreshed the entities it wrote).
+    Companies are counted by distinct English name, as the sidebar always has,
+    not per agency entity (one name registered in two countries is two entities).
+    """
+    if entities and has_table(conn, "agency"):
+        refresh_entities(conn)
+    source = "agencies"
+    companies = "COUNT(DISTINCT hajj_company_en)"
+    authorized = "COUNT(DISTINCT CASE WHEN is_authorized = 'Yes' THEN hajj_company_en END)"
+    conn.execute("DELETE FROM agency_stats")
+    conn.execute(f"""
+        INSERT INTO agency_stats (name, value)
+        SELECT 'total', {companies} FROM {source}
+        UNION ALL SELECT 'authorized', {authorized} FROM {source}
+        UNION ALL SELECT 'countries', COUNT(DISTINCT country) FROM {source}
+        UNION ALL SELECT 'cities', COUNT(DISTINCT city) FROM {source}
+        UNION ALL SELECT 'countries_ar', COUNT(DISTINCT "الدولة") FROM {source}
+        UNION ALL SELECT 'cities_ar', COUNT(DISTINCT "المدينة") FROM {source}
+        UNION ALL SELECT 'rows', COUNT(*) FROM agencies
+    """)
+    conn.execute("DELETE FROM agency_stats_breakdown")
+    for dimension, column in STATS_DIMENSIONS:
+        conn.execute(f"""
+            INSERT INTO agency_stats_breakdown (dimension, value, total, authorized)
+            SELECT ?, {_quote(column)}, {companies}, {authorized}
+            FROM {source}
+            WHERE {_quote(column)} IS NOT NULL AND {_quote(column)} != ''
+            GROUP BY {_quote(column)}
+        """, (dimension,))
+
+
+# ---------------- Change Log ----------------
+def record_sync(conn: sqlite3.Connection, parent_id: Optional[str], source: Optional[str],
+                inserted: int = 0, updated: int = 0, deleted: int = 0, sync_id: Optional[str] = None) -> str:
+    """Append a sync to agency_syncs, after its changes were logged; returns its id"""
+    sync_id = sync_id or uuid.uuid4().hex
+    last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM agency_changes").fetchone()[0]
+    conn.execute(
+        """INSERT INTO agency_syncs (sync_id, parent_id, synced_at, source, inserted, updated, deleted, last_seq)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        (sync_id, parent_id, time.time(), source, inserted, updated, deleted, last_seq),
+    )
+    return sync_id
+
+
+def head_sync(conn: sqlite3.Connection) -> Optional[str]:
+    """Id of the latest sync applied to this file"""
+    row = conn.execute("SELECT sync_id FROM agency_syncs ORDER BY rowid DESC LIMIT 1").fetchone()
+    return row[0] if row else None
+
+
+def changes_since(conn: sqlite3.Connection, sync_id: Optional[str]) -> Tuple[Optional[str], Optional[Set[str]]]:
+    """
+    Agencies touched after sync_id, as (head sync id, agency ids before and after each change)
+
+    The set is None when this file's log does not reach back to sync_id (another
+    lineage, e.g. a full rebuild, or no log at all) or has nothing after it although
+    the file changed (written outside a sync): treat everything as changed.
+    """
+    if not has_table(conn, "agency_syncs"):
+        return None, None
+    head = head_sync(conn)
+    row = conn.execute("SELECT last_seq FROM agency_syncs WHERE sync_id = ?", (sync_id,)).fetchone() if sync_id else None
+    if row is None or head == sync_id:
+        return head, None
+    changed: Set[str] = set()
+    for agency_id, old_agency_id in conn.execute(
+        "SELECT agency_id, old_agency_id FROM agency_changes WHERE seq > ?", (row[0],)
+    ):
+        changed.update(i for i in (agency_id, old_agency_id) if i)
+    return head, changed
+
+
+def read_changes(db_path: str, sync_id: Optional[str]) -> Tuple[Optional[str], Optional[Set[str]]]:
+    """changes_since on a short-lived read-only connection to db_path"""
+    try:
+        conn = sqlite3.connect(file_uri(db_path), uri=True)
+        try:
+            return changes_since(conn, sync_id)
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None, None
+
+
+def has_table(conn: sqlite3.Connection, name: str) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = ?", (name,)
+    ).fetchone()
+    return row is not None
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """
+    Run every pending migration step on an open autocommit connection
+    (isolation_level=None), each step in its own transaction. Returns the new version
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for step_version, description, step in MIGRATIONS:
+        if step_version <= version:
+            continue
+        logger.info(f"🛠️ Applying schema migration {step_version}: {description}")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {step_version}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        version = step_version
+    return version
+
+
+def migrate(db_path: str) -> int:
+    """
+    Bring the database at db_path up to SCHEMA_VERSION (once per process)
+
+    Returns:
+        The schema version the database is at. Lower than SCHEMA_VERSION when it
+        could not be migrated (e.g. read-only file) and callers should use fallbacks
+    """
+    with _lock:
+        if db_path in _migrated:
+            return _migrated[db_path]
+        if not os.path.exists(db_path):
+            logger.warning(f"Database file not found: {db_path}")
+            return 0
+        try:
+            conn = connect(db_path, isolation_level=None)
+            try:
+                if not has_table(conn, "agencies"):
+                    logger.warning(f"No agencies table in {db_path}, skipping migrations")
+                    version = 0
+                else:
+                    version = apply_migrations(conn)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Schema migration stopped for {db_path}: {e}")
+            version = current_version(db_path)
+        _migrated[db_path] = version
+        return version
+
+
+def current_version(db_path: str) -> int:
+    """Read the schema version without migrating, 0 if the file cannot be read"""
+    try:
+        # Read-only, so a missing file is reported instead of created empty
+        conn = sqlite3.connect(file_uri(db_path), uri=True)
+        try:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return 0
@@ -0,0 +1,300 @@
+"""
+Agency Snapshot Module
+Process-wide columnar copy of the agency table for structured filters without SQLite
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import logging
+from typing import AbstractSet, Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.name_matching import NameAutomaton, SoundIndex
+from core.query_cache import file_signature
+from core.schema import file_uri, has_table
+
+logger = logging.getLogger(__name__)
+
+# Columns of a structured result, spelled as the SQL lookups return them
+RESULT_COLUMNS = (
+    "agency_id", "hajj_company_en", "hajj_company_ar", "formatted_address",
+    "city", "country", "المدينة", "الدولة",
+    "email", "contact_Info", "rating_reviews", "rating", "review_count", "is_authorized",
+    "google_maps_link",
+)
+
+# Normalized location columns a "place" filter matches (any of them)
+PLACE_COLUMNS = ("city_norm", "country_norm", "city_ar_norm", "country_ar_norm")
+
+# Result orders and the keyset (sort key of the last row seen) each pages on:
+# source order → (row_id,); best rated first → (rating, review count or -1, row_id)
+ORDER_ID = "id"
+ORDER_RATING = "rating"
+
+_snapshots: Dict[str, "AgencySnapshot"] = {}
+_lock = threading.Lock()
+
+
+# ---------------- Columns ----------------
+class DictionaryColumn:
+    """
+    Low-cardinality text column stored as int32 codes into its distinct values,
+    with a packed bitmap (one bit per row) per value built on first use
+    """
+
+    __slots__ = ("values", "codes", "size", "_index", "_bitmaps")
+
+    def __init__(self, raw: Sequence[Optional[str]]):
+        index: Dict[Optional[str], int] = {}
+        self.codes = np.fromiter((index.setdefault(v, len(index)) for v in raw), dtype=np.int32, count=len(raw))
+        self.values: List[Optional[str]] = list(index)
+        self.size = len(raw)
+        self._index = index
+        self._bitmaps: Dict[int, np.ndarray] = {}
+
+    def __contains__(self, value: Optional[str]) -> bool:
+        return value in self._index
+
+    def bitmap(self, value: Optional[str]) -> np.ndarray:
+        """Rows equal to value; all zero when the value does not occur"""
+        code = self._index.get(value)
+        if code is None:
+            return empty_bitmap(self.size)
+        bitmap = self._bitmaps.get(code)
+        if bitmap is None:
+            # Concurrent first uses compute the same array; either copy may be kept
+            bitmap = self._bitmaps[code] = np.packbits(self.codes == code)
+        return bitmap
+
+
+def empty_bitmap(size: int) -> np.ndarray:
+    return np.zeros((size + 7) // 8, dtype=np.uint8)
+
+
+def bitmap_from_positions(positions: np.ndarray, size: int) -> np.ndarray:
+    mask = np.zeros(size, dtype=bool)
+    mask[positions] = True
+    return np.packbits(mask)
+
+
+# ---------------- Snapshot ----------------
+class AgencySnapshot:
+    """
+    Immutable in-memory copy of the agency table (one row per company)
+
+    Result rows are kept as tuples in RESULT_COLUMNS order; the filterable
+    columns are dictionary encoded (locations, authorization) or NumPy arrays
+    (rating, review count), so a structured query is a few bitmap ANDs/ORs.
+    """
+
+    def __init__(self, rows: List[tuple], encoded: Dict[str, Sequence[Optional[str]]],
+                 aliases: Dict[str, List[int]], signature: Optional[Tuple[int, int, int]] = None,
+                 row_ids: Optional[Sequence[int]] = None):
+        self.rows = rows
+        self.size = len(rows)
+        # agency.row_id of each row, ascending (rows are loaded in that order)
+        self.row_ids = np.array(row_ids if row_ids is not None else range(self.size), dtype=np.int64)
+        self.signature = signature
+        self.columns = {name: DictionaryColumn(values) for name, values in encoded.items()}
+        rating_at = RESULT_COLUMNS.index("rating")
+        reviews_at = RESULT_COLUMNS.index("review_count")
+        email_at = RESULT_COLUMNS.index("email")
+        self.rating = np.array([r[rating_at] if r[rating_at] is not None else np.nan for r in rows], dtype=np.float64)
+        self.review_count = np.array([r[reviews_at] if r[reviews_at] is not None else -1 for r in rows], dtype=np.int64)
+        self.has_email = np.packbits(np.array([bool(r[email_at]) for r in rows], dtype=bool))
+        self.aliases = {alias: np.array(positions, dtype=np.int64) for alias, positions in aliases.items()}
+        self.all_rows = np.packbits(np.ones(self.size, dtype=bool))
+        self._names: Optional[NameAutomaton] = None
+        self._sounds: Optional[SoundIndex] = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def has_place(self, place: str) -> bool:
+        """True when place is a known normalized city or country (English or Arabic)"""
+        return any(place in self.columns[c] for c in PLACE_COLUMNS)
+
+    def has_name(self, name: str) -> bool:
+        return name in self.aliases
+
+    def _automaton(self) -> NameAutomaton:
+        # Built on first use; a concurrent duplicate build is harmless
+        if self._names is None:
+            self._names = NameAutomaton(list(self.aliases))
+        return self._names
+
+    def find_names(self, text_norm: str) -> List[Tuple[int, int, str]]:
+        """Agency aliases mentioned in normalized text (leftmost-longest whole words) as (first word, end word, alias)"""
+        automaton = self._automaton()
+        return [(start, end, automaton.phrases[index]) for start, end, index in automaton.find(text_norm)]
+
+    def find_names_by_sound(self, text_norm: str, ignore: AbstractSet[str] = frozenset()) -> List[Tuple[int, int, str]]:
+        """
+        Word windows of normalized text (without ignore words) spelling one
+        agency's name in another script or transliteration, as (first word,
+        end word, alias)
+        """
+        automaton = self._automaton()
+        if self._sounds is None:
+            self._sounds = SoundIndex(automaton.phrases)
+        mentions = []
+        for start, end, hits in self._sounds.find(text_norm, ignore):
+            aliases = [automaton.phrases[index] for index in hits]
+            if len({tuple(self.aliases[alias]) for alias in aliases}) == 1:
+                mentions.append((start, end, aliases[0]))
+        return mentions
+
+    # ---------------- Filtering ----------------
+    def filter(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Row positions matching every filter, best rated first when top_rated is set"""
+        bitmap = self.all_rows
+        name = filters.get("name")
+        if name is not None:
+            positions = self.aliases.get(name)
+            bitmap = bitmap & (bitmap_from_positions(positions, self.size) if positions is not None
+                               else empty_bitmap(self.size))
+        place = filters.get("place")
+        if place is not None:
+            places = empty_bitmap(self.size)
+            for column in PLACE_COLUMNS:
+                places = places | self.columns[column].bitmap(place)
+            bitmap = bitmap & places
+        authorized = filters.get("authorized")
+        if authorized is not None:
+            bitmap = bitmap & self.columns["is_authorized"].bitmap(authorized)
+        if filters.get("has_email"):
+            bitmap = bitmap & self.has_email
+        min_reviews = filters.get("min_reviews")
+        if min_reviews is not None:
+            bitmap = bitmap & np.packbits(self.review_count > int(min_reviews))
+        if filters.get("top_rated"):
+            bitmap = bitmap & np.packbits(~np.isnan(self.rating))
+
+        positions = np.flatnonzero(np.unpackbits(bitmap, count=self.size))
+        if filters.get("top_rated"):
+            # lexsort sorts by its last key first; it is stable, so ties stay in row_id order
+            order = np.lexsort((-self.review_count[positions], -self.rating[positions]))
+            positions = positions[order]
+        return positions
+
+    # ---------------- Paging ----------------
+    def sort_key(self, position: int, order: str) -> Tuple:
+        """Keyset of the row at position for the given order (see ORDER_ID / ORDER_RATING)"""
+        row_id = int(self.row_ids[position])
+        if order == ORDER_RATING:
+            return (float(self.rating[position]), int(self.review_count[position]), row_id)
+        return (row_id,)
+
+    def after(self, positions: np.ndarray, order: str, key: Sequence) -> np.ndarray:
+        """The rows of positions (already in order) that sort after key"""
+        row_ids = self.row_ids[positions]
+        if order == ORDER_RATING:
+            rating, reviews, row_id = key
+            ratings = self.rating[positions]
+            counts = self.review_count[positions]
+            later = (ratings < rating) | (
+                (ratings == rating) & ((counts < reviews) | ((counts == reviews) & (row_ids > row_id)))
+            )
+            return positions[later]
+        return positions[row_ids > key[0]]
+
+    def select(self, filters: Dict[str, Any], max_rows: Optional[int] = None,
+               after: Optional[Sequence] = None) -> Tuple[Tuple[str, ...], List[tuple], int, Optional[Tuple]]:
+        """
+        Run a structured query
+
+        Args:
+            after: Keyset of the last row of the previous page; only later rows are returned
+
+        Returns:
+            (columns, rows, total matches, keyset of the last row when more rows follow it).
+            Count queries return a single ("count",) row; otherwise at most
+            min(filters["limit"], max_rows) rows.
+        """
+        positions = self.filter(filters)
+        if filters.get("count"):
+            return ("count",), [(int(len(positions)),)], 1, None
+        order = sort_order(filters)
+        if after is not None:
+            positions = self.after(positions, order, after)
+        limit = filters.get("limit")
+        if max_rows is not None:
+            limit = max_rows if limit is None else min(limit, max_rows)
+        shown = positions if limit is None else positions[:limit]
+        last_key = self.sort_key(int(shown[-1]), order) if 0 < len(shown) < len(positions) else None
+        rows = self.rows
+        return RESULT_COLUMNS, [rows[i] for i in shown.tolist()], int(len(positions)), last_key
+
+
+def sort_order(filters: Dict[str, Any]) -> str:
+    """Order the rows matching filters are listed (and paged) in"""
+    return ORDER_RATING if filters.get("top_rated") else ORDER_ID
+
+
+# ---------------- Loading ----------------
+def load_snapshot(db_path: str) -> Optional[AgencySnapshot]:
+    """Read the agency and agency_alias tables of db_path; None before schema v6"""
+    # Signature first: a swap during the read is then seen as a change next time
+    signature = file_signature(db_path)
+    started = time.perf_counter()
+    conn = sqlite3.connect(file_uri(db_path), uri=True)
+    try:
+        if not has_table(conn, "agency"):
+            return None
+        selected = ", ".join(
+            'contact_info AS "contact_Info"' if c == "contact_Info" else f'"{c}"' for c in RESULT_COLUMNS
+        )
+        encoded_names = PLACE_COLUMNS + ("is_authorized",)
+        cursor = conn.execute(
+            f"SELECT {selected}, {', '.join(PLACE_COLUMNS)}, row_id FROM agency ORDER BY row_id"
+        )
+        rows: List[tuple] = []
+        row_ids: List[int] = []
+        encoded: Dict[str, List[Optional[str]]] = {name: [] for name in encoded_names}
+        width = len(RESULT_COLUMNS)
+        authorized_at = RESULT_COLUMNS.index("is_authorized")
+        for record in cursor:
+            rows.append(record[:width])
+            for name, value in zip(PLACE_COLUMNS, record[width:-1]):
+                encoded[name].append(value)
+            encoded["is_authorized"].append(record[authorized_at])
+            row_ids.append(record[-1])
+        position = {row[0]: i for i, row in enumerate(rows)}
+        aliases: Dict[str, List[int]] = {}
+        for alias_norm, agency_id in conn.execute("SELECT alias_norm, agency_id FROM agency_alias"):
+            if agency_id in position:
+                aliases.setdefault(alias_norm, []).append(position[agency_id])
+    finally:
+        conn.close()
+    snapshot = AgencySnapshot(rows, encoded, aliases, signature, row_ids)
+    logger.info(f"🧊 Loaded agency snapshot: {len(rows)} agencies in {time.perf_counter() - started:.3f}s")
+    return snapshot
+
+
+def get_snapshot(db_path: str) -> Optional[AgencySnapshot]:
+    """
+    Process-wide snapshot of db_path, reloaded when the database file changes
+    (a rebuild or delta sync swaps the file, which changes its signature)
+    """
+    path = os.path.abspath(db_path)
+    signature = file_signature(db_path)
+    with _lock:
+        cached = _snapshots.get(path)
+        if cached is not None and cached.signature == signature:
+            return cached
+        if cached is not None:
+            logger.info(f"♻️ Database file changed, reloading agency snapshot for {db_path}")
+        snapshot = load_snapshot(db_path)
+        if snapshot is None:
+            _snapshots.pop(path, None)
+        else:
+            _snapshots[path] = snapshot
+        return snapshot
+
+
+def clear_snapshots() -> None:
+    with _lock:
+        _snapshots.clear()
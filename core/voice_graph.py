@@ -41,11 +41,13 @@ class VoiceAssistantState(TypedDict):
     sql_filters: Optional[List[str]]
     sql_explanation: Optional[str]
     sql_error: Optional[str]
+    structured_filters: Optional[Dict]
     
     # Results
     result_rows: Optional[List[Dict]]
     columns: Optional[List[str]]
     row_count: Optional[int]
+    results_truncated: Optional[bool]
     
     # Responses
     summary: Optional[str]
@@ -146,10 +148,21 @@ class VoiceGraphBuilder:
         logger.info(f"Original: {state['user_input']}")
         logger.info(f"Cleaned: {cleaned_text}")
 
+        filters = self.db_manager.get_structured_filters(cleaned_text)
+        if filters:
+            return {
+                "sql_query": None,
+                "sql_query_type": "structured",
+                "sql_filters": [f"{k} = {v}" for k, v in filters.items() if k != "limit"],
+                "sql_explanation": "Answered from the in-memory agency snapshot",
+                "structured_filters": filters,
+            }
+
         sql_result = self.voice_llm.generate_sql(
             cleaned_text,  # Use corrected text
             state["language"],
-            context
+            context,
+            schema=self.db_manager.get_sql_prompt_schema(),
         )
         
         return {
@@ -196,7 +209,8 @@ class VoiceGraphBuilder:
             state["language"],
             state.get("row_count", 0),
             state.get("result_rows", []),
-            state.get("conversation_context", "")
+            state.get("conversation_context", ""),
+            truncated=bool(state.get("results_truncated")),
         )
         
         return {"summary": summary_result["summary"]}
@@ -8,11 +8,13 @@ import streamlit as st
 from openai import OpenAI
 import io
 import re
-from typing import Optional, List, Dict, Literal
+from typing import Any, Optional, List, Dict, Literal
 from pydantic import BaseModel, Field
 import logging
 from langsmith.wrappers import wrap_openai
 import json
+
+from core.database import sql_prompt_schema
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -97,6 +99,9 @@ class NEEDSInfoResponse(BaseModel):
 
 class LLMManager:
     """Manages OpenAI API calls with error handling and rate limiting"""
+
+    # Result rows generate_summary reads; the graph fetches no more than this
+    SUMMARY_ROW_LIMIT = 50
     
     def __init__(self):
         """Initialize OpenAI client"""
@@ -535,12 +540,14 @@ Provide helpful, accurate information that keeps pilgrims safe, informed, and aw
             logger.error(f"General answer generation failed: {e}")
             return "I encountered an error. Please try rephrasing your question."
     
-    def generate_sql(self, user_input: str, language: str ,context_string= None) -> Optional[Dict]:
+    def generate_sql(self, user_input: str, language: str ,context_string= None,
+                     schema: Optional[Dict[str, Any]] = None) -> Optional[Dict]:
         """
-        Generate SQL query from user input with structured output
+        Generate SQL query from user input with structured output; schema is what the
+        store can be queried with (DatabaseManager.get_sql_prompt_schema)
         Returns: Dict with sql_query, query_type, filters, explanation, safety_checked
         """
-        sql_prompt = self._get_sql_system_prompt(language, context_string) 
+        sql_prompt = self._get_sql_system_prompt(language, context_string, schema) 
         
         try:
             response = self.client.beta.chat.completions.parse(
@@ -574,14 +581,17 @@ Provide helpful, accurate information that keeps pilgrims safe, informed, and aw
             logger.error(f"Structured SQL generation failed: {e}")
             return None
     
-    def generate_summary(self, user_input: str, language: str, row_count: int, sample_rows: List[Dict], context_string=None) -> Dict:
+    def generate_summary(self, user_input: str, language: str, row_count: int, sample_rows: List[Dict], context_string=None,
+                         truncated: bool = False) -> Dict:
         """
         Generate natural, friendly, and structured summary of query results.
         Adds assistant-like sentences and recommendations based on intent.
+        truncated: the query matched more rows than the row_count shown
         """
+        count_text = f"{row_count}+" if truncated else str(row_count)
         data_preview= ""
         if row_count>0:
-            data_preview = json.dumps(sample_rows[:50], ensure_ascii=False)
+            data_preview = json.dumps(sample_rows[:self.SUMMARY_ROW_LIMIT], ensure_ascii=False)
 
         summary_prompt = f"""
 You are a multilingual safety-aware assistant for Hajj and Umrah pilgrims.  
@@ -590,6 +600,7 @@ Your goal is to convert database results into natural spoken responses that soun
 ═══════════════════════════════════════════════════════════════
 🧭 INPUT CONTEXT
 Database results: {data_preview}
+Rows found: {count_text}{" (only the first " + str(row_count) + " matches are shown; say so, never present it as the total)" if truncated else ""}
 Reference context: {context_string}
 ═══════════════════════════════════════════════════════════════
 
@@ -729,7 +740,7 @@ Keep it concise, warm, safe, and optimized for voice playback.
         except Exception as e:
             logger.error(f"Structured summary generation failed: {e}")
             return {
-                "summary": f"📊 Found {row_count} matching records.",
+                "summary": f"📊 Found {count_text} matching records.",
             }
 
     def text_to_speech(self, text: str, language: str) -> Optional[io.BytesIO]:
@@ -756,30 +767,46 @@ Keep it concise, warm, safe, and optimized for voice playback.
             return None
     
     @staticmethod
-    def _get_sql_system_prompt(language: str, context_string=None) -> str:
-        """Get SQL generation system prompt"""
+    def _get_sql_system_prompt(language: str, context_string=None, schema: Optional[Dict[str, Any]] = None) -> str:
+        """Get SQL generation system prompt for the store described by schema (sql_prompt_schema)"""
+        schema = schema or sql_prompt_schema()
+        table = schema["table"]
+        columns = "\n".join(f"    - {column}" for column in schema["columns"])
+        agency_id = "agency_id, " if schema["entity_ids"] else ""
+        rules = ""
+        if schema["ratings"]:
+            rules += """
+    9. "Top rated" / "best" → `WHERE rating IS NOT NULL ORDER BY rating DESC, review_count DESC`
+    - "rated above X" → `rating >= X`; "more than N reviews" → `review_count > N`
+    - Never parse rating_reviews text with LIKE or SUBSTR, use the numeric columns"""
+        if schema["locations"]:
+            rules += f"""
+    10. "Near X" / "within N km of X" → proximity through the location index:
+    - geo_place(name_norm, name, kind, city, lat, lng): known cities and districts (e.g. Al Aziziyah, Ajyad, Mina)
+    - agency_geo(id, min_lat, max_lat, min_lng, max_lng, lat, lng, precision): one point per agency, join with `{table} e ON e.row_id = g.id`
+    - precision: 1 city centroid, 2 district, 3 plus code, 4 exact; use `g.precision >= 2` when X is a district
+    - Constrain min_lat/min_lng to a box around the place (0.05 degrees ≈ 5 km), then order by `distance_km(g.lat, g.lng, p.lat, p.lng)`"""
+        examples = ""
+        if schema["ratings"]:
+            examples += f"""
+    Q: "Top rated agencies in Makkah with more than 100 reviews"
+    → SELECT hajj_company_en, hajj_company_ar, city, rating, review_count, is_authorized FROM {table} WHERE rating IS NOT NULL AND review_count > 100 AND (city LIKE '%مكة%' OR LOWER(city) LIKE '%makkah%' OR LOWER(city) LIKE '%mecca%') ORDER BY rating DESC, review_count DESC LIMIT 25;
+"""
+        if schema["locations"]:
+            examples += f"""
+    Q: "Authorized agencies near Ajyad"
+    → SELECT e.hajj_company_en, e.hajj_company_ar, e.formatted_address, e.is_authorized, ROUND(distance_km(g.lat, g.lng, p.lat, p.lng), 2) AS distance_km FROM geo_place p JOIN agency_geo g ON g.min_lat BETWEEN p.lat - 0.05 AND p.lat + 0.05 AND g.min_lng BETWEEN p.lng - 0.05 AND p.lng + 0.05 JOIN {table} e ON e.row_id = g.id WHERE p.name_norm = normalize_text('Ajyad') AND g.precision >= 2 AND e.is_authorized = 'Yes' ORDER BY distance_km LIMIT 10;
+"""
         return f"""
     You are a multilingual SQL fraud-prevention expert protecting Hajj pilgrims.
 
     🎯 MISSION: Generate an SQL query for database analysis on Hajj agencies.
-    Do NOT generalize to world data — always query from the table 'agencies'.
+    Do NOT generalize to world data — always query from the table '{table}' (one row per company, never SELECT DISTINCT company rows).
     Use the CONTEXT and USER QUESTION to create a safe, accurate SQL SELECT query.
     Context: {context_string}
 
     TABLE STRUCTURE:
-    - hajj_company_ar
-    - hajj_company_en
-    - formatted_address
-    - city
-    - country
-    - email
-    - contact_Info
-    - rating_reviews
-    - is_authorized ('Yes' or 'No')
-    - google_maps_link
-    - link_valid (boolean)
-    - المدينة(city but in Arabic)
-    - الدولة (country but in Arabic)
+{columns}
 
 
 
@@ -807,12 +834,12 @@ Keep it concise, warm, safe, and optimized for voice playback.
     4. "Countries" or "number of countries" → use:
     - `SELECT COUNT(DISTINCT country)` if asking how many
     - `SELECT DISTINCT country` if asking for list
-    - Always based on agencies table
+    - Always based on {table} table
     5. "Cities" or "number of cities" → same logic as above but for `city`
     6. Never assume or add “Saudi Arabia” unless mentioned explicitly.
-    7. When user asks about “countries that have agencies” → use `DISTINCT country` from `agencies`
-    8. Always return agency-related data only, not external or world data.
-    9    --------------------------------------------
+    7. When user asks about “countries that have agencies” → use `DISTINCT country` from `{table}`
+    8. Always return agency-related data only, not external or world data.{rules}
+    --------------------------------------------
 
     🌍 LOCATION MATCHING PATTERNS:
     Use flexible LIKE and LOWER() conditions for cities/countries.
@@ -837,39 +864,39 @@ Keep it concise, warm, safe, and optimized for voice playback.
 ...
 ⚙️ For company name searches:
 Always normalize and deduplicate company names.
-Use LOWER(TRIM()) and SELECT DISTINCT to avoid case duplicates.
+Use LOWER(TRIM()); the agency table already holds one row per company, so no DISTINCT is needed.
 
     Make sure you help and understand the user
 
 
 
     Q: "هل شركة الهدى معتمدة؟"
-    → ELECT DISTINCT hajj_company_en, hajj_company_ar, formatted_address, city, country, email, contact_Info, rating_reviews, is_authorized, google_maps_link
-FROM agencies
+    → SELECT {agency_id}hajj_company_en, hajj_company_ar, formatted_address, city, country, email, contact_info AS "contact_Info", rating_reviews, is_authorized, google_maps_link
+FROM {table}
 WHERE (LOWER(TRIM(hajj_company_en)) LIKE LOWER('%alhuda%')
    OR LOWER(TRIM(hajj_company_ar)) LIKE LOWER('%الهدى%'))
 LIMIT 50;
     Q: "Authorized agencies in Makkah"
-    → SELECT * FROM agencies WHERE is_authorized = 'Yes' AND (city LIKE '%مكة%' OR LOWER(city) LIKE '%mecca%' OR LOWER(city) LIKE '%makkah%') LIMIT 25;
+    → SELECT * FROM {table} WHERE is_authorized = 'Yes' AND (city LIKE '%مكة%' OR LOWER(city) LIKE '%mecca%' OR LOWER(city) LIKE '%makkah%') LIMIT 25;
 
     Q: "كم عدد الشركات في المدينة؟"
-    → SELECT COUNT(*) FROM agencies WHERE (city LIKE '%المدينة%' OR LOWER(city) LIKE '%medina%' OR LOWER(city) LIKE '%madinah%');
+    → SELECT COUNT(*) FROM {table} WHERE (city LIKE '%المدينة%' OR LOWER(city) LIKE '%medina%' OR LOWER(city) LIKE '%madinah%');
 
     Q: "How many countries have agencies?"
-    → SELECT COUNT(DISTINCT country) FROM agencies;
+    → SELECT COUNT(DISTINCT country) FROM {table};
 
     Q: "List of countries that have agencies"
-    → SELECT DISTINCT country FROM agencies LIMIT 25;
+    → SELECT DISTINCT country FROM {table} LIMIT 25;
 
     Q: "Number of authorized countries"
-    → SELECT COUNT(DISTINCT country) FROM agencies WHERE is_authorized = 'Yes';
+    → SELECT COUNT(DISTINCT country) FROM {table} WHERE is_authorized = 'Yes';
 
     Q: "Countries with authorized agencies"
-    → SELECT DISTINCT country FROM agencies WHERE is_authorized = 'Yes' LIMIT 25;
+    → SELECT DISTINCT country FROM {table} WHERE is_authorized = 'Yes' LIMIT 25;
 
     Q: "Show all cities where agencies exist"
-    → SELECT DISTINCT city FROM agencies LIMIT 25;
-    """
+    → SELECT DISTINCT city FROM {table} LIMIT 25;
+{examples}    """
     
     @staticmethod
     def _extract_sql_from_response(response_text: str) -> Optional[str]:
@@ -10,8 +10,7 @@ import logging
 import re
 from sqlalchemy import text
 from num2words import num2words
-from functools import lru_cache
-from rapidfuzz import process, fuzz
+from rapidfuzz import fuzz
 
 from core.voice_models import (
     VoiceIntentClassification,
@@ -20,6 +19,8 @@ from core.voice_models import (
 )
 from core.database import DatabaseManager
 from core.voice_llm import LLMManager
+from core.agency_names import AgencyNames, get_agency_names
+from utils.normalization import GENERIC_NAME_TERMS, normalize_text
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -27,31 +28,25 @@ logger.setLevel(logging.INFO)
 
 class VoiceQueryProcessor:
     """Handles agency name matching and query processing"""
+
+    # A token_set_ratio match replaces the spoken words only when they hold this many
+    # specific words and this share of the name's length: one common word ("hotel",
+    # "ahlan") is contained in many names and scores 100 there
+    MIN_SPECIFIC_WORDS = 2
+    MIN_NAME_SHARE = 0.5
     
     def __init__(self, db, voice_llm):
         self.db = db
         self.voice_llm = voice_llm
         self.client = self.voice_llm._get_client()
 
-    @lru_cache(maxsize=1)
+    def get_agency_names(self) -> AgencyNames:
+        """Process-wide agency names of the connected store (shared, reloaded when it changes)"""
+        return get_agency_names(self.db.backend)
+
     def get_all_agency_names(self) -> list:
-        """Get ALL 7000+ agency names (CACHED for performance)"""
-        engine = self.db._create_engine()
-        
-        with engine.connect() as conn:
-            result = conn.execute(
-                text("SELECT hajj_company_ar, hajj_company_en FROM agencies")
-            )
-            
-            names = []
-            for ar, en in result.fetchall():
-                if ar and ar.strip():
-                    names.append(ar.strip())
-                if en and en.strip() and en != ar:
-                    names.append(en.strip())
-            
-            logger.info(f"📊 Cached {len(names)} agency names")
-            return names
+        """Get ALL 7000+ agency names"""
+        return self.get_agency_names().names
 
     def get_relevant_agencies_for_prompt(
         self, 
@@ -63,15 +58,17 @@ class VoiceQueryProcessor:
         
         # Strategy 1: Extract from conversation
         if conversation_context:
-            all_agencies = self.get_all_agency_names()
+            names = self.get_agency_names()
+            all_agencies, matrix = names.names, names.matrix
             for msg in conversation_context[-3:]:
                 if isinstance(msg, str):
-                    for agency in all_agencies:
-                        if agency.lower() in msg.lower():
-                            if agency not in relevant_names:
-                                relevant_names.append(agency)
-                                if len(relevant_names) >= limit:
-                                    return relevant_names
+                    # One automaton pass finds every agency named in the message
+                    for index in matrix.mentions(normalize_text(msg)):
+                        agency = all_agencies[index]
+                        if agency not in relevant_names:
+                            relevant_names.append(agency)
+                            if len(relevant_names) >= limit:
+                                return relevant_names
         
         # Strategy 2: Get top agencies
         top_agencies = self._get_top_agencies(limit=limit)
@@ -94,7 +91,7 @@ class VoiceQueryProcessor:
 
     def _get_top_agencies(self, limit: int = 20) -> list:
         """Get most popular/established agencies"""
-        engine = self.db._create_engine()
+        engine = self.db.engine
         
         try:
             with engine.connect() as conn:
@@ -126,26 +123,22 @@ class VoiceQueryProcessor:
         Optimized transcript correction that PRESERVES THE FULL QUERY.
         Handles partial agency names and transliteration variations.
         """
-        all_agencies = self.get_all_agency_names()
+        names = self.get_agency_names()
+        all_agencies, matrix = names.names, names.matrix
         
         # Stage 0: Quick exact match
-        agency_set = {name.lower(): name for name in all_agencies}
-        raw_lower = raw_text.lower().strip()
-        
-        if raw_lower in agency_set:
-            match = agency_set[raw_lower]
-            logger.info(f"✅ Exact match (full text): {match}")
-            return match
-        
-        # Stage 1: Check if ANY agency name appears as EXACT substring
-        for agency in all_agencies:
-            agency_lower = agency.lower()
-            if agency_lower in raw_lower:
-                import re
-                pattern = r'\b' + re.escape(agency_lower) + r'\b'
-                if re.search(pattern, raw_lower, re.IGNORECASE):
-                    logger.info(f"✅ Exact substring match: {agency} (no correction needed)")
-                    return raw_text
+        raw_norm = normalize_text(raw_text)
+        
+        exact = matrix.find_exact(raw_norm)
+        if exact is not None:
+            logger.info(f"✅ Exact match (full text): {all_agencies[exact]}")
+            return all_agencies[exact]
+        
+        # Stage 1: Check if ANY agency name appears as a whole-word substring
+        mentioned = matrix.mentions(raw_norm)
+        if mentioned:
+            logger.info(f"✅ Exact substring match: {all_agencies[mentioned[0]]} (no correction needed)")
+            return raw_text
         
         # Stage 2: Extract potential agency name from query
         candidate = self._extract_agency_mention(raw_text)
@@ -154,71 +147,46 @@ class VoiceQueryProcessor:
             logger.info(f"ℹ️ No agency name detected in query")
             return raw_text
         
-        # ✅ NEW: Stage 2.5 - Check for PARTIAL name matches
-        # Many users say partial names like "Namaa al-Barakah" instead of full name
-        # Match against agency name BEGINNINGS
-        candidate_lower = candidate.lower()
-        
-        best_partial_match = None
-        best_partial_score = 0
-        
-        for agency in all_agencies:
-            agency_lower = agency.lower()
-            agency_words = agency_lower.split()
-            candidate_words = candidate_lower.split()
-            
-            # Check if candidate matches the BEGINNING of agency name
-            if len(candidate_words) <= len(agency_words):
-                # Compare word by word from the start
-                match_count = 0
-                for cw, aw in zip(candidate_words, agency_words):
-                    # Use fuzzy matching for each word to handle "Namaa"/"Nama"/"Namma"
-                    word_similarity = fuzz.ratio(cw, aw)
-                    if word_similarity >= 80:  # Allow slight variations
-                        match_count += 1
-                
-                # If most words match, it's likely this agency
-                match_ratio = match_count / len(candidate_words) if candidate_words else 0
-                
-                if match_ratio >= 0.7:  # At least 70% of words match
-                    # Calculate overall similarity
-                    overall_score = fuzz.token_sort_ratio(candidate_lower, agency_lower)
-                    
-                    if overall_score > best_partial_score:
-                        best_partial_score = overall_score
-                        best_partial_match = agency
-        
-        if best_partial_match and best_partial_score >= 75:
+        # Stage 2.5 - Check for PARTIAL name matches
+        # Many users say partial names like "Namaa al-Barakah" instead of full name:
+        # at least 70% of the candidate words must fuzzily match (ratio >= 80, for
+        # "Namaa"/"Nama"/"Namma") the words at the BEGINNING of the agency name,
+        # then the most similar such name wins. Stages 2.5 to 4 score only the
+        # names sharing the most character trigrams with the candidate (a
+        # shortlist), and every name only when it shares none.
+        candidate_norm = normalize_text(candidate)
+        candidate_words = candidate_norm.split()
+        shortlist = matrix.candidate_rows(candidate_norm)
+        sort_scores = matrix.token_sort_scores(candidate_norm, min(75, threshold), shortlist)
+        
+        best_partial, best_partial_score = matrix.best_prefix_match(candidate_norm, sort_scores, rows=shortlist)
+        
+        if best_partial is not None and best_partial_score >= 75:
+            best_partial_match = all_agencies[best_partial]
             corrected = self._replace_agency_in_query(raw_text, candidate, best_partial_match)
             logger.info(f"✅ Partial name match: {best_partial_match} (score: {best_partial_score}) → replaced in context")
             return corrected
         
-        # Stage 3: Standard fuzzy match on extracted candidate
-        matches = process.extract(
-            candidate,
-            all_agencies,
-            scorer=fuzz.token_sort_ratio,
-            score_cutoff=threshold,
-            limit=3
-        )
+        # Stage 3: Standard fuzzy match on extracted candidate (token_sort_ratio, scored above)
+        matches = matrix.top(sort_scores, threshold, 3)
         
         if matches:
             best_match = matches[0]
-            matched_agency = best_match[0]
+            matched_agency = all_agencies[best_match[2]]
             match_score = best_match[1]
             
             # Check for ambiguity
             if len(matches) > 1:
                 second_score = matches[1][1]
                 if abs(match_score - second_score) < 5:
-                    logger.warning(f"⚠️ Ambiguous match: {matched_agency} vs {matches[1][0]} - keeping original")
+                    logger.warning(f"⚠️ Ambiguous match: {matched_agency} vs {all_agencies[matches[1][2]]} - keeping original")
                     return raw_text
             
             # Verify word overlap
-            candidate_words = set(candidate.lower().split())
-            matched_words = set(matched_agency.lower().split())
+            candidate_word_set = set(candidate_words)
+            matched_words = set(best_match[0].split())
             
-            if len(candidate_words & matched_words) / len(candidate_words) < 0.4:
+            if not candidate_word_set or len(candidate_word_set & matched_words) / len(candidate_word_set) < 0.4:
                 logger.warning(f"⚠️ Low word overlap between '{candidate}' and '{matched_agency}' - keeping original")
                 return raw_text
             
@@ -227,26 +195,49 @@ class VoiceQueryProcessor:
             return corrected
         
         # Stage 4: Try token_set_ratio (better for partial matches)
-        matches = process.extract(
-            candidate,
-            all_agencies,
-            scorer=fuzz.token_set_ratio,  # ✅ Better for subset matching
-            score_cutoff=80,
-            limit=1
-        )
+        matches = matrix.top(matrix.token_set_scores(candidate_norm, 80, shortlist), 80, 1)
+        
+        if matches and not self._is_specific_match(candidate_norm, matches[0][0]):
+            logger.info(f"ℹ️ '{candidate}' too generic to stand for '{all_agencies[matches[0][2]]}'")
+            matches = []
         
         if matches:
-            matched_agency = matches[0][0]
+            matched_agency = all_agencies[matches[0][2]]
             match_score = matches[0][1]
             
             corrected = self._replace_agency_in_query(raw_text, candidate, matched_agency)
             logger.info(f"✅ Token set match: {matched_agency} (score: {match_score}) → replaced in context")
             return corrected
         
+        # Stage 5: Same name spelt in another script or transliteration
+        # ("Namaa al Barakah" for "نماء البركة", Roman Urdu): one hash probe of the
+        # consonant-skeleton key per word window of the candidate, only against
+        # names written in the other script
+        sound = names.sound_match(candidate_norm, DatabaseManager.NAME_QUESTION_WORDS)
+        if sound is not None:
+            start, end, index = sound
+            spoken = candidate if end - start == len(candidate_words) else " ".join(candidate_words[start:end])
+            corrected = self._replace_agency_in_query(raw_text, spoken, all_agencies[index])
+            logger.info(f"✅ Transliteration match: {all_agencies[index]} → replaced in context")
+            return corrected
+        
         # No confident match found
         logger.info(f"ℹ️ No confident match found, returning original: {raw_text}")
         return raw_text
 
+    def _is_specific_match(self, candidate_norm: str, name_norm: str) -> bool:
+        """
+        Whether a spoken candidate says enough of a name to stand for it on
+        token_set_ratio. A single-word name ("Al Tayyar") needs its word spoken exactly
+        """
+        candidate_words = candidate_norm.split()
+        name_words = [w for w in name_norm.split() if len(w) > 2]
+        if len(name_words) == 1:
+            return name_words[0] in candidate_words
+        specific = [w for w in candidate_words if len(w) > 2 and w not in GENERIC_NAME_TERMS]
+        return (len(specific) >= self.MIN_SPECIFIC_WORDS
+                and len(candidate_norm) >= self.MIN_NAME_SHARE * len(name_norm))
+
     def _replace_agency_in_query(self, original_query: str, extracted_part: str, corrected_name: str) -> str:
         """
         Replace the extracted agency mention with the corrected name in the original query.
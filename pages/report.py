@@ -18,6 +18,7 @@ from supabase import create_client, Client
 
 # Import core modules
 from core.report_llm import RLLMManager
+from core.autocomplete import suggest
 from utils.translations import t, LANGUAGE_MAP
 
 # Configure logging
@@ -759,6 +760,36 @@ def render_unified_sidebar(lang: str):
 # MAIN REPORT BOT INTERFACE
 # =============================================================================
 
+def record_agency_name(name: str, lang: str):
+    """Store the reported agency name and move on to step 2"""
+    st.session_state.complaint_data["agency_name"] = name
+    st.session_state.report_messages.append({
+        "role": "assistant",
+        "content": t("report_agency_recorded", lang, name=name) + "<br><br>" + t("report_step_2", lang)
+    })
+    st.session_state.report_step = 2
+
+
+def render_agency_suggestions(lang: str):
+    """Type-ahead over known agency names so the exact name can be picked"""
+    prefix = st.text_input(
+        t("agency_search_label", lang), key="report_agency_search",
+        placeholder=t("agency_search_placeholder", lang), label_visibility="collapsed"
+    )
+    if not prefix:
+        return
+    suggestions = suggest(prefix)
+    if not suggestions:
+        st.caption(t("no_agency_suggestions", lang))
+        return
+    st.caption(t("report_agency_suggestions", lang))
+    for i, suggestion in enumerate(suggestions):
+        if st.button(suggestion.label(lang), key=f"report_agency_suggestion_{i}", use_container_width=True):
+            st.session_state.report_messages.append({"role": "user", "content": suggestion.name})
+            record_agency_name(suggestion.name, lang)
+            st.rerun()
+
+
 def render_report_bot():
     """Render report bot interface"""
     
@@ -809,6 +840,10 @@ def render_report_bot():
             else:
                 st.markdown(message["content"])
     
+    # Agency name suggestions (step 1)
+    if st.session_state.report_step == 1:
+        render_agency_suggestions(lang)
+
     # Chat input
     if prompt := st.chat_input(t("chat_input_placeholder", lang), key="report_chat_input"):
         st.session_state.report_messages.append({"role": "user", "content": prompt})
@@ -818,12 +853,7 @@ def render_report_bot():
         
         # Process based on step
         if step == 1:
-            data["agency_name"] = prompt
-            st.session_state.report_messages.append({
-                "role": "assistant",
-                "content": t("report_agency_recorded", lang, name=prompt) + "<br><br>" + t("report_step_2", lang)
-            })
-            st.session_state.report_step = 2
+            record_agency_name(prompt, lang)
             
         elif step == 2:
             data["city"] = prompt
@@ -829,6 +829,7 @@ elif st.session_state.is_processing and st.session_state.get("pending_audio_byte
             "sql_filters": [],
             "sql_explanation": "",
             "sql_error": "",
+            "structured_filters": None,
             "result_rows": [],
             "columns": [],
             "row_count": 0,
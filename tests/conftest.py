@@ -0,0 +1,74 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from core.agency_names import clear_agency_names  # noqa: E402
+from core.autocomplete import clear_indexes  # noqa: E402
+from core.engine import dispose_engines  # noqa: E402
+from core.query_cache import query_cache  # noqa: E402
+from core.schema import migrate  # noqa: E402
+from core.snapshot import clear_snapshots  # noqa: E402
+
+SAMPLE_AGENCIES = [
+    ("فندق جبل عمر جميرا الفندقية", "Jabal Omar Jumeirah Hotel",
+     "Al Shubaikah, Ibrahim Al-Khalil Road، Jabal Omar, Ash Shubaikah, Makkah 24231, Saudi Arabia",
+     "Makkah", "Saudi Arabia", None, "+966 12 556 0111", "4.6 (5243 reviews)", "Yes",
+     "https://www.google.com/maps/search/?api=1&query=Jabal%20Omar%20Jumeirah%20Hotel", "مكه المكرمه", "المملكه العربيه السعوديه"),
+    ("مجموعة الهدى", "AL HUDA GROUP", "Al-Irsal St, Ramallah", "Ramallah", "Palestine",
+     "info@alhuda.ps", "+970 2 296 0000", "4.1 (88 reviews)", "Yes", None, "رام الله", "فلسطين"),
+    ("الهدى", "AL HOUDA", "Rue de la Station 12, Sint-Niklaas, Belgium", "Sint-Niklaas", "Belgium",
+     None, "+32 3 776 0000", "3.9 (12 reviews)", "No", None, "سينت نيكلاس", "بلجيكا"),
+    ("مكة للسياحة", "MAKKAH TRAVEL", "Al Mansoura, Dakahlia Governorate, Egypt", "Dakahlia Governorate", "Egypt",
+     "makkah@travel.eg", "+20 50 222 0000", None, "Yes", None, "الدقهلية", "مصر"),
+    ("الاحمد تورس اند ترافلس", "AL AHMED TOURS & TRAVELS",
+     "9FQ4+W7Q, Jamia Masjid Road, Mozampura, Hyderabad, Telangana 500001, India",
+     "Hyderabad", "India", None, "+91 81424 75832", "4.8 (301 reviews)", "Yes", None, "حيدر أباد", "الهند"),
+]
+
+
+def build_agencies_db(path, rows=SAMPLE_AGENCIES, migrated=True):
+    """Agencies file holding rows, migrated like one core.ingest built unless migrated is False"""
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE agencies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hajj_company_ar TEXT,
+            hajj_company_en TEXT,
+            formatted_address TEXT,
+            city TEXT,
+            country TEXT,
+            email TEXT,
+            contact_info TEXT,
+            rating_reviews TEXT,
+            is_authorized BOOLEAN,
+            google_maps_link TEXT,
+            "المدينة" TEXT,
+            "الدولة" TEXT
+        )
+    """)
+    conn.executemany(
+        """INSERT INTO agencies (hajj_company_ar, hajj_company_en, formatted_address, city, country,
+           email, contact_info, rating_reviews, is_authorized, google_maps_link, "المدينة", "الدولة")
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+    if migrated:
+        migrate(str(path))
+    return str(path)
+
+
+@pytest.fixture
+def agencies_db(tmp_path):
+    """Small copy of the agencies schema with a handful of real-looking rows"""
+    dispose_engines()
+    query_cache.clear()
+    clear_snapshots()
+    clear_indexes()
+    clear_agency_names()
+    return build_agencies_db(tmp_path / "agencies.db")
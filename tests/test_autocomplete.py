@@ -0,0 +1,45 @@
+import sqlite3
+
+from core.autocomplete import get_name_index, suggest
+from core.backend import SQLiteBackend
+from core.database import DatabaseManager
+
+
+def test_suggestions_match_name_and_word_starts(agencies_db):
+    db = DatabaseManager(agencies_db)
+
+    # Short prefixes come from the precomputed table, longer ones from the sorted arrays;
+    # the agency with more reviews ranks first
+    assert [s.name_en for s in db.suggest_agencies("al h")] == ["AL HUDA GROUP", "AL HOUDA"]
+    for prefix in ("AL HU", "Al-Hu"):
+        assert [s.name_en for s in db.suggest_agencies(prefix)] == ["AL HUDA GROUP"]
+    assert [s.name for s in db.suggest_agencies("huda")] == ["AL HUDA GROUP"]
+    assert [s.name for s in db.suggest_agencies("jab", limit=1)] == ["Jabal Omar Jumeirah Hotel"]
+
+    # A whole-name match ranks above a later word; Urdu letters fold to Arabic
+    assert [s.name for s in db.suggest_agencies("الهد")] == ["الهدى", "مجموعة الهدى"]
+    [makkah] = db.suggest_agencies("مکہ")
+    assert makkah.name == "مكة للسياحة" and makkah.name_en == "MAKKAH TRAVEL"
+    assert makkah.label("English") == "مكة للسياحة — Dakahlia Governorate, Egypt"
+    assert makkah.label("العربية") == "مكة للسياحة — الدقهلية، مصر"
+
+    assert db.suggest_agencies("a") == [] and db.suggest_agencies("zzzz") == []
+
+
+def test_name_index_is_shared_and_reloads_on_change(agencies_db):
+    DatabaseManager(agencies_db)
+    backend = SQLiteBackend(agencies_db)
+    index = get_name_index(backend)
+    assert get_name_index(SQLiteBackend(agencies_db)) is index
+
+    conn = sqlite3.connect(agencies_db)
+    agency_id = conn.execute("SELECT agency_id FROM agency WHERE hajj_company_en = 'AL HUDA GROUP'").fetchone()[0]
+    conn.execute(
+        "INSERT INTO agency_alias (alias_norm, agency_id, alias) VALUES (?, ?, ?)",
+        ("zamzam huda", agency_id, "ZAMZAM HUDA"),
+    )
+    conn.commit()
+    conn.close()
+
+    assert [s.agency_id for s in suggest("zamz", backend=backend)] == [agency_id]
+    assert get_name_index(backend) is not index
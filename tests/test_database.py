@@ -0,0 +1,408 @@
+import logging
+import sqlite3
+
+from core import schema
+from core.database import DatabaseManager
+from core.llm import LLMManager
+from core.schema import SCHEMA_VERSION, current_version, migrate
+from core.voice_llm import LLMManager as VoiceLLMManager
+from tests.conftest import SAMPLE_AGENCIES, build_agencies_db
+
+
+def test_migration_builds_search_index(agencies_db, tmp_path):
+    baseline = build_agencies_db(tmp_path / "baseline.db", migrated=False)
+    assert migrate(baseline) == SCHEMA_VERSION
+    conn = sqlite3.connect(baseline)
+    hits = conn.execute(
+        "SELECT rowid FROM agencies_fts WHERE agencies_fts MATCH ?", ('"jabal omar"',)
+    ).fetchall()
+    assert hits == [(1,)]
+
+
+def test_serving_reads_an_unmigrated_file_as_is(agencies_db, tmp_path, caplog):
+    baseline = build_agencies_db(tmp_path / "baseline.db", migrated=False)
+    with caplog.at_level(logging.WARNING, logger="core.backend"):
+        db = DatabaseManager(baseline)
+    assert f"schema version 0 of {SCHEMA_VERSION}" in caplog.text
+    assert db.schema_version == 0 and not db.has_search_index and not db.has_entities
+    assert list(db.search_agency_fuzzy("huda")["hajj_company_en"]) == ["AL HUDA GROUP"]
+    assert current_version(baseline) == 0
+
+
+def test_search_index_follows_table_changes(agencies_db):
+    conn = schema.connect(agencies_db)
+    conn.execute("UPDATE agencies SET hajj_company_en = 'Zamzam Pilgrims' WHERE id = 2")
+    conn.execute("DELETE FROM agencies WHERE id = 3")
+    conn.execute("INSERT INTO agencies (hajj_company_en, city) VALUES ('Bait Al Maqdis', 'Jerusalem')")
+    conn.commit()
+
+    def match(term):
+        return conn.execute(
+            "SELECT rowid FROM agencies_fts WHERE agencies_fts MATCH ?", (f'"{term}"',)
+        ).fetchall()
+
+    assert match("zamzam") == [(2,)]
+    assert match("houda") == []
+    assert match("maqdis") == [(6,)]
+    assert conn.execute("SELECT name_en_norm FROM agencies WHERE id = 2").fetchone() == ("zamzam pilgrims",)
+
+
+def test_inserted_row_is_searchable_and_index_stays_consistent(agencies_db):
+    conn = schema.connect(agencies_db)
+    integrity = "INSERT INTO agencies_fts(agencies_fts, rank) VALUES ('integrity-check', 1)"
+    for write in (
+        "INSERT INTO agencies (hajj_company_en, city) VALUES ('Bait Al Maqdis', 'Jerusalem')",
+        "UPDATE agencies SET city = 'Al Quds' WHERE hajj_company_en = 'Bait Al Maqdis'",
+        "DELETE FROM agencies WHERE id = 3",
+    ):
+        conn.execute(write)
+        conn.execute(integrity)
+    schema.refresh_stats(conn)
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(agencies_db)
+    assert list(db.search_agency_fuzzy("maqdis")["hajj_company_en"]) == ["Bait Al Maqdis"]
+
+
+def test_fuzzy_search_uses_trigram_index(agencies_db):
+    db = DatabaseManager(agencies_db)
+    assert db.has_search_index
+
+    df = db.search_agency_fuzzy("huda")
+    assert list(df["hajj_company_en"]) == ["AL HUDA GROUP"]
+
+    # Name hits rank above city hits
+    df = db.search_agency_fuzzy("makkah")
+    assert list(df["hajj_company_en"]) == ["MAKKAH TRAVEL", "Jabal Omar Jumeirah Hotel"]
+
+    # Misspelt names have no substring hit; the trigram shortlist re-ranked by rapidfuzz finds them
+    df = db.search_agency_fuzzy("al hudda grup")
+    assert list(df["hajj_company_en"]) == ["AL HUDA GROUP"]
+    assert db.search_agency_fuzzy("zzqx travl").empty
+
+
+def test_exact_lookup_uses_normalized_columns(agencies_db):
+    # Enough rows for the planner to prefer the index after ANALYZE
+    conn = schema.connect(agencies_db)
+    conn.executemany(
+        "INSERT INTO agencies (hajj_company_en, hajj_company_ar, city, country) VALUES (?, ?, ?, ?)",
+        [(f"Agency {i}", f"وكالة {i}", f"City {i % 400}", f"Country {i % 100}") for i in range(2000)],
+    )
+    conn.commit()
+
+    db = DatabaseManager(agencies_db)
+    assert db.has_normalized_columns
+
+    # Hamza, ta marbuta and extra whitespace fold onto the stored spelling
+    df = db.search_agency_fuzzy("  مكة   للسياحه ")
+    assert list(df["hajj_company_en"]) == ["MAKKAH TRAVEL"]
+
+    sql, params = db.get_heuristic_query("Jabal Omar Jumeirah Hotel")
+    plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    assert "SEARCH agency_alias USING PRIMARY KEY (alias_norm=?)" in plan
+    assert not any(step.startswith("SCAN") for step in plan)
+
+
+def test_execute_rows_returns_tuples_without_pandas(agencies_db, monkeypatch):
+    db = DatabaseManager(agencies_db)
+    monkeypatch.setattr("core.database.pd.read_sql", None)
+
+    result, error = db.execute_rows(
+        "SELECT hajj_company_en, rating_reviews FROM agencies WHERE country = :c", {"c": "Egypt"}
+    )
+
+    assert error is None
+    assert result.columns == ("hajj_company_en", "rating_reviews")
+    assert result.rows == [("MAKKAH TRAVEL", None)]
+    assert result.records() == [{"hajj_company_en": "MAKKAH TRAVEL", "rating_reviews": None}]
+    assert list(result.to_dataframe()["hajj_company_en"]) == ["MAKKAH TRAVEL"]
+
+
+def test_graph_execute_node_uses_row_api(agencies_db, monkeypatch):
+    from core.graph import ChatGraph
+
+    db = DatabaseManager(agencies_db)
+    monkeypatch.setattr(db, "execute_query", None)
+    graph = ChatGraph(db, llm_manager=None)
+
+    out = graph._node_execute_sql({
+        "sql_query": "SELECT hajj_company_en FROM agencies WHERE is_authorized = 'No'",
+        "sql_params": None,
+    })
+
+    assert out == {
+        "result_rows": [{"hajj_company_en": "AL HOUDA"}],
+        "columns": ["hajj_company_en"],
+        "row_count": 1,
+        "results_truncated": False,
+        "next_cursor": None,
+    }
+
+
+def test_graph_summary_knows_the_rows_were_capped(agencies_db):
+    from core.graph import ChatGraph
+
+    class SummaryLLM:
+        SUMMARY_ROW_LIMIT = 2
+
+        def generate_summary(self, user_input, language, row_count, rows, truncated=False, **kwargs):
+            self.seen = (row_count, truncated)
+            return {"summary": ""}
+
+    llm = SummaryLLM()
+    graph = ChatGraph(DatabaseManager(agencies_db), llm_manager=llm)
+    state = {"user_input": "list all agencies", "language": "English", "sql_params": None,
+             "sql_query": "SELECT hajj_company_en FROM agencies"}
+    state.update(graph._node_execute_sql(state))
+    graph._node_summarize_results(state)
+    assert llm.seen == (2, True)
+
+
+def test_stats_read_from_materialized_tables(agencies_db):
+    db = DatabaseManager(agencies_db)
+
+    assert db.get_stats() == {
+        "total": 5, "authorized": 4, "countries": 5, "cities": 5, "countries_ar": 5, "cities_ar": 5,
+    }
+    assert db.get_stats_breakdown("authorization") == [
+        {"value": "Yes", "total": 4, "authorized": 4},
+        {"value": "No", "total": 1, "authorized": 0},
+    ]
+    assert db.get_stats_breakdown("country", limit=1)[0]["total"] == 1
+
+    conn = sqlite3.connect(agencies_db)
+    plan = " ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN SELECT name, value FROM agency_stats"))
+    conn.close()
+    assert "agencies" not in plan.replace("agency_stats", "")
+
+
+def test_stats_count_companies_by_english_name(agencies_db):
+    conn = schema.connect(agencies_db)
+    # The same company registered in a second country becomes a second agency entity
+    conn.execute("""
+        INSERT INTO agencies (hajj_company_ar, hajj_company_en, formatted_address, city, country, is_authorized,
+                              "المدينة", "الدولة")
+        VALUES ('مجموعة الهدى', 'AL HUDA GROUP', 'King Road, Amman', 'Amman', 'Jordan', 'Yes', 'عمان', 'الأردن')
+    """)
+    schema.refresh_stats(conn)
+    conn.commit()
+    assert conn.execute("SELECT COUNT(*) FROM agency").fetchone() == (6,)
+    conn.close()
+
+    stats = DatabaseManager(agencies_db).get_stats()
+    assert stats["total"] == 5 and stats["authorized"] == 4 and stats["countries"] == 6
+
+
+def test_refresh_stats_after_bulk_write(agencies_db):
+    conn = schema.connect(agencies_db)
+    conn.execute("DELETE FROM agencies WHERE is_authorized = 'No'")
+    schema.refresh_stats(conn)
+    conn.commit()
+    stats = dict(conn.execute("SELECT name, value FROM agency_stats"))
+    breakdown = conn.execute(
+        "SELECT value FROM agency_stats_breakdown WHERE dimension = 'authorization'"
+    ).fetchall()
+    conn.close()
+
+    assert stats["total"] == 4 and stats["authorized"] == 4
+    assert breakdown == [("Yes",)]
+
+
+def test_max_rows_pushed_down_with_truncation_flag(agencies_db):
+    db = DatabaseManager(agencies_db)
+
+    result, error = db.execute_rows("SELECT hajj_company_en FROM agencies ORDER BY id", max_rows=2)
+    assert error is None
+    assert result.rows == [("Jabal Omar Jumeirah Hotel",), ("AL HUDA GROUP",)]
+    assert result.truncated
+
+    result, _ = db.execute_rows("SELECT hajj_company_en FROM agencies", max_rows=5)
+    assert len(result) == 5 and not result.truncated
+
+
+def test_iter_batches_streams_in_chunks(agencies_db):
+    db = DatabaseManager(agencies_db)
+
+    batches = list(db.iter_batches("SELECT id FROM agencies ORDER BY id", batch_size=2))
+    assert [b.rows for b in batches] == [[(1,), (2,)], [(3,), (4,)], [(5,)]]
+
+    empty = list(db.iter_batches("SELECT id, city FROM agencies WHERE id < 0"))
+    assert len(empty) == 1 and empty[0].columns == ("id", "city") and empty[0].rows == []
+
+    # Stopping early hands the connection back to the pool
+    stream = db.iter_batches("SELECT id FROM agencies", batch_size=1)
+    next(stream)
+    stream.close()
+    assert db.engine.pool.checkedout() == 0
+
+
+def test_parse_rating_reviews():
+    assert schema.parse_rating("4.6 (5243 reviews)") == 4.6
+    assert schema.parse_review_count("4.6 (5243 reviews)") == 5243
+    assert schema.parse_review_count("5 (1,204 reviews)") == 1204
+    assert schema.parse_rating("4.0") == 4.0 and schema.parse_review_count("4.0") is None
+    assert schema.parse_rating(None) is None and schema.parse_rating("No reviews") is None
+
+
+def test_rating_columns_follow_rating_reviews(agencies_db):
+    conn = schema.connect(agencies_db)
+    assert conn.execute("SELECT rating, review_count FROM agencies WHERE id = 1").fetchone() == (4.6, 5243)
+    assert conn.execute("SELECT rating, review_count FROM agencies WHERE id = 4").fetchone() == (None, None)
+    indexes = {r[1] for r in conn.execute("PRAGMA index_list(agencies)")}
+    assert {"idx_agencies_rating", "idx_agencies_city_rating", "idx_agencies_country_rating"} <= indexes
+
+    conn.execute("UPDATE agencies SET rating_reviews = '4.9 (10 reviews)' WHERE id = 4")
+    conn.commit()
+    assert conn.execute("SELECT rating, review_count FROM agencies WHERE id = 4").fetchone() == (4.9, 10)
+    conn.close()
+
+
+def test_heuristic_top_rated_orders_by_numeric_rating(agencies_db):
+    db = DatabaseManager(agencies_db)
+    assert db.has_rating_columns
+
+    sql, params = db.get_heuristic_query("top rated agencies")
+    result, error = db.execute_rows(sql, params)
+    assert error is None
+    assert [r["hajj_company_en"] for r in result.records()] == [
+        "AL AHMED TOURS & TRAVELS", "Jabal Omar Jumeirah Hotel", "AL HUDA GROUP", "AL HOUDA",
+    ]
+
+    sql, params = db.get_heuristic_query("best agencies with more than 100 reviews in Makkah")
+    result, _ = db.execute_rows(sql, params)
+    assert [r["hajj_company_en"] for r in result.records()] == ["Jabal Omar Jumeirah Hotel"]
+
+    sql, params = db.get_heuristic_query("أفضل الشركات في فلسطين")
+    result, _ = db.execute_rows(sql, params)
+    assert [r["hajj_company_en"] for r in result.records()] == ["AL HUDA GROUP"]
+
+
+# Same company and address as AL AHMED TOURS & TRAVELS, Arabic name spelled differently
+AL_AHMED_VARIANT = ("الاحمد تورس ايند ترافلس",) + SAMPLE_AGENCIES[4][1:]
+
+
+def test_duplicate_rows_collapse_into_one_agency(tmp_path):
+    db_path = build_agencies_db(tmp_path / "dupes.db", SAMPLE_AGENCIES + [AL_AHMED_VARIANT])
+    db = DatabaseManager(db_path)
+    assert db.has_entities
+
+    result, _ = db.execute_rows("SELECT agency_id, variants, hajj_company_ar FROM agency ORDER BY row_id")
+    assert len(result) == 5
+    agency_id, variants, name_ar = result.rows[-1]
+    assert (variants, name_ar) == (2, "الاحمد تورس اند ترافلس")
+
+    # Either spelling finds the one entity, no DISTINCT involved
+    df = db.search_agency_fuzzy("الاحمد تورس ايند ترافلس")
+    assert list(df["agency_id"]) == [agency_id]
+    sql, params = db.get_heuristic_query("al ahmed tours & travels")
+    assert "DISTINCT" not in sql
+    rows, _ = db.execute_rows(sql, params)
+    assert [r["agency_id"] for r in rows.records()] == [agency_id]
+
+    agency = db.get_agency(agency_id)
+    assert agency["hajj_company_en"] == "AL AHMED TOURS & TRAVELS"
+    assert set(agency["aliases"]) == {"AL AHMED TOURS & TRAVELS", "الاحمد تورس اند ترافلس", "الاحمد تورس ايند ترافلس"}
+    assert db.get_agency("missing") is None
+
+    # Companies are counted once
+    assert db.get_stats()["total"] == 5
+
+
+def test_agency_ids_are_stable_across_rebuilds(tmp_path):
+    first = DatabaseManager(build_agencies_db(tmp_path / "a.db"))
+    second = DatabaseManager(build_agencies_db(tmp_path / "b.db", list(reversed(SAMPLE_AGENCIES))))
+
+    def ids(db):
+        result, _ = db.execute_rows("SELECT hajj_company_en, agency_id FROM agency")
+        return dict(result.rows)
+
+    assert ids(first) == ids(second)
+    assert len(set(ids(first).values())) == 5
+
+
+def test_keyset_pages_follow_the_cursor_without_overlap(agencies_db):
+    db = DatabaseManager(agencies_db)
+
+    def walk(filters):
+        result, error = db.execute_structured({**filters, "limit": 2})
+        assert error is None
+        pages = [[r["hajj_company_en"] for r in result.records()]]
+        cursor = result.next_cursor
+        while cursor:
+            page, error = db.fetch_page(cursor, page_size=2)
+            assert error is None and len(page) <= 2
+            pages.append([r["hajj_company_en"] for r in page.records()])
+            cursor = page.next_cursor
+        return pages
+
+    listed = walk({})
+    assert sum(listed, []) == [row[1] for row in SAMPLE_AGENCIES] and len(listed) == 3
+    ranked = walk({"top_rated": True})
+    assert sum(ranked, []) == ["AL AHMED TOURS & TRAVELS", "Jabal Omar Jumeirah Hotel", "AL HUDA GROUP", "AL HOUDA"]
+
+    # Without the snapshot the same pages come from keyset SQL
+    db.has_snapshot = False
+    assert walk({}) == listed and walk({"top_rated": True}) == ranked
+    sql, params = db.keyset_query({"authorized": "Yes"}, after=[3])
+    assert "row_id > :after_id" in sql and "OFFSET" not in sql and params["after_id"] == 3
+
+    assert db.fetch_page("not-a-cursor")[1].startswith("Invalid page cursor")
+
+
+def test_graph_state_carries_the_next_cursor(agencies_db):
+    from core.graph import ChatGraph
+
+    db = DatabaseManager(agencies_db)
+    graph = ChatGraph(db, llm_manager=None)
+    state = graph._node_generate_sql({"user_input": "show all authorized agencies", "language": "English"})
+    out = graph._node_execute_sql({**state, "structured_filters": {**state["structured_filters"], "limit": 3}})
+    assert out["row_count"] == 3 and out["next_cursor"]
+
+    page, error = db.fetch_page(out["next_cursor"])
+    assert error is None and [r["hajj_company_en"] for r in page.records()] == ["AL AHMED TOURS & TRAVELS"]
+    assert page.next_cursor is None
+
+
+def test_sql_list_answers_page_by_row_id(agencies_db):
+    from core.graph import ChatGraph
+
+    class PageLLM:
+        SUMMARY_ROW_LIMIT = 2
+
+    db = DatabaseManager(agencies_db)
+    graph = ChatGraph(db, llm_manager=PageLLM())
+    authorized = [row[1] for row in SAMPLE_AGENCIES if row[8] == "Yes"]
+    # The heuristic list path and LLM-written SQL in row_id order page alike
+    heuristic = db.get_heuristic_query("list authorized agencies")
+    written = ("SELECT row_id, hajj_company_en FROM agency WHERE is_authorized = :a ORDER BY row_id LIMIT 100;", {"a": "Yes"})
+    for sql, params in (heuristic, written):
+        out = graph._node_execute_sql({"sql_query": sql, "sql_params": params})
+        names = [r["hajj_company_en"] for r in out["result_rows"]]
+        cursor = out["next_cursor"]
+        while cursor:
+            page, error = db.fetch_page(cursor, page_size=1)
+            assert error is None
+            names += [r["hajj_company_en"] for r in page.records()]
+            cursor = page.next_cursor
+        assert names == authorized
+
+    # Any other order cannot be resumed by row_id
+    out = graph._node_execute_sql({"sql_query": "SELECT row_id, hajj_company_en FROM agency ORDER BY hajj_company_en",
+                                   "sql_params": None})
+    assert out["results_truncated"] and out["next_cursor"] is None
+
+
+def test_sql_prompts_describe_only_what_the_store_has(agencies_db, monkeypatch):
+    db = DatabaseManager(agencies_db)
+    assert db.get_sql_prompt_schema()["locations"]
+    for prompt in (LLMManager._get_sql_system_prompt, VoiceLLMManager._get_sql_system_prompt):
+        full = prompt("English", schema=db.get_sql_prompt_schema())
+        assert "distance_km(" in full and '"4.6 (5243 reviews)"' in full
+
+    # PostgreSQL has no location tables nor the SQL functions they are queried with
+    monkeypatch.setattr(db.backend, "name", "postgresql")
+    for prompt in (LLMManager._get_sql_system_prompt, VoiceLLMManager._get_sql_system_prompt):
+        published = prompt("English", schema=db.get_sql_prompt_schema())
+        assert "agency_geo" not in published and "normalize_text(" not in published
+        assert "review_count" in published and "FROM agency" in published
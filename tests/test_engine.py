@@ -0,0 +1,80 @@
+import os
+import sqlite3
+
+import pytest
+from sqlalchemy import text
+
+from core import schema
+from core.database import DatabaseManager
+from core.engine import build_url, get_engine, DEFAULT_ENGINE_PROFILE
+
+
+def test_engine_is_read_only_and_tuned(agencies_db):
+    db = DatabaseManager(agencies_db)
+    assert "mode=ro" in str(db.engine.url) and "immutable=1" in str(db.engine.url)
+
+    with db.engine.connect() as conn:
+        assert conn.execute(text("PRAGMA query_only")).scalar() == 1
+        assert conn.execute(text("PRAGMA temp_store")).scalar() == 2
+        assert conn.execute(text("PRAGMA cache_size")).scalar() == -DEFAULT_ENGINE_PROFILE["cache_size_kib"]
+        assert conn.execute(text("SELECT normalize_text('مكّة')")).scalar() == "مكه"
+        with pytest.raises(Exception):
+            conn.execute(text("DELETE FROM agencies"))
+
+
+def test_engine_shared_per_path(agencies_db, tmp_path):
+    from tests.conftest import build_agencies_db
+
+    other = build_agencies_db(tmp_path / "other.db", [])
+    assert DatabaseManager(agencies_db).engine is DatabaseManager(agencies_db).engine
+    # One cached engine per file, not one for whichever instance came first
+    assert DatabaseManager(other).engine is not DatabaseManager(agencies_db).engine
+    df, _ = DatabaseManager(other).execute_query("SELECT COUNT(*) AS n FROM agencies")
+    assert int(df["n"][0]) == 0
+
+
+def test_engine_recycled_when_file_changes(agencies_db):
+    engine = get_engine(agencies_db)
+    conn = schema.connect(agencies_db)
+    conn.execute("DELETE FROM agencies")
+    conn.commit()
+    conn.close()
+    os.utime(agencies_db, ns=(0, os.stat(agencies_db).st_mtime_ns + 1_000_000))
+
+    fresh = get_engine(agencies_db)
+    assert fresh is not engine
+    with fresh.connect() as c:
+        assert c.execute(text("SELECT COUNT(*) FROM agencies")).scalar() == 0
+
+
+def test_wal_database_not_opened_immutable(tmp_path):
+    path = str(tmp_path / "wal.db")
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE t (x)")
+    conn.commit()
+    url = build_url(path, DEFAULT_ENGINE_PROFILE)
+    conn.close()
+    assert "mode=ro" in url and "immutable" not in url
+
+
+def test_in_memory_profile_serves_a_copy_reloaded_on_change(agencies_db):
+    db = DatabaseManager(agencies_db, {"in_memory": True})
+    engine = db.engine
+    assert "mode=memory" in str(engine.url) and "cache=shared" in str(engine.url)
+    with engine.connect() as c, engine.connect() as other:
+        assert c.execute(text("SELECT COUNT(*) FROM agencies")).scalar() == 5
+        # Pooled connections share one copy
+        assert other.execute(text("SELECT COUNT(*) FROM agency")).scalar() == 5
+        assert c.execute(text("PRAGMA query_only")).scalar() == 1
+
+    conn = schema.connect(agencies_db)
+    conn.execute("DELETE FROM agencies WHERE is_authorized = 'No'")
+    conn.commit()
+    conn.close()
+    os.utime(agencies_db, ns=(0, os.stat(agencies_db).st_mtime_ns + 1_000_000))
+
+    fresh = db.engine
+    assert fresh is not engine and str(fresh.url) != str(engine.url)
+    with fresh.connect() as c:
+        assert c.execute(text("SELECT COUNT(*) FROM agencies")).scalar() == 4
@@ -0,0 +1,69 @@
+import sqlite3
+
+from core import schema
+from core.database import DatabaseManager
+from core.fact_cards import render_card
+from core.graph import ChatGraph
+from core.llm import LLMManager
+
+
+class UnavailableClient:
+    """OpenAI client stand-in: every completion fails, so an LLM summary falls back to a row count"""
+
+    def __getattr__(self, name):
+        return self
+
+    def parse(self, **kwargs):
+        raise RuntimeError("no LLM in tests")
+
+
+def _agency_id(db_path, name_en):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT agency_id FROM agency WHERE hajj_company_en = ?", (name_en,)).fetchone()[0]
+
+
+def test_fact_cards_cover_every_language_and_follow_writes(agencies_db):
+    db = DatabaseManager(agencies_db)
+    agency_id = _agency_id(agencies_db, "AL HUDA GROUP")
+    cards = db.get_fact_card(agency_id)
+    assert set(cards) == {"English", "العربية", "اردو"}
+
+    assert render_card(cards, "English").splitlines()[:3] == [
+        "🏢 **AL HUDA GROUP (مجموعة الهدى)**", "", "- **Status:** ✅ Authorized",
+    ]
+    assert render_card(cards, "العربية", "city") == "🏢 **مجموعة الهدى (AL HUDA GROUP)**\n\n- **المدينة:** رام الله"
+    assert render_card(cards, "English", "rating").endswith("- **Rating:** 4.1 ⭐ (88 reviews)")
+    assert render_card(cards, "اردو", "contact_methods").endswith(
+        "- **رابطہ نمبر:** +970 2 296 0000\n- **ای میل:** info@alhuda.ps"
+    )
+
+    conn = schema.connect(agencies_db)
+    conn.execute("UPDATE agencies SET email = NULL WHERE hajj_company_en = 'AL HUDA GROUP'")
+    schema.refresh_entities(conn, [agency_id])
+    conn.commit()
+    conn.close()
+    assert db.get_fact_card(agency_id)["English"]["email"] == "- **Email:** Not available"
+    # Rendered per request from the agency row: no card table, only the asked language
+    assert set(db.get_fact_card(agency_id, "اردو")) == {"اردو"}
+    assert not schema.has_table(sqlite3.connect(agencies_db), "agency_card")
+
+
+def test_single_agency_answers_skip_the_llm(agencies_db):
+    llm = LLMManager.__new__(LLMManager)
+    llm.client = UnavailableClient()
+    graph = ChatGraph(DatabaseManager(agencies_db), llm)
+
+    def answer(question, rows=None):
+        state = {"user_input": question, "language": "English"}
+        if rows is None:
+            state.update(graph._node_generate_sql(state))
+            rows = graph._node_execute_sql(state)
+        return graph._node_summarize_results({**state, **rows})["summary"]
+
+    assert answer("AL HUDA GROUP").startswith("🏢 **AL HUDA GROUP (مجموعة الهدى)**\n\n- **Status:** ✅ Authorized")
+    rows = graph._node_execute_sql({"sql_query": "SELECT * FROM agency WHERE hajj_company_en = 'AL HOUDA'"})
+    assert answer("what is the email of al houda", rows) == "🏢 **AL HOUDA (الهدى)**\n\n- **Email:** Not available"
+    assert answer("Is Al Houda authorized?", rows).startswith("🏢 **AL HOUDA (الهدى)**\n\n- **Status:** ❌")
+
+    # Open-ended questions about the company still go to the LLM
+    assert answer("would al houda suit elderly pilgrims travelling alone", rows) == "📊 Found 1 matching records."
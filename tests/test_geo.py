@@ -0,0 +1,86 @@
+import sqlite3
+
+from core import geo, schema
+from core.database import DatabaseManager
+
+
+def test_short_plus_code_recovered_against_city_centroid():
+    full = geo._encode_prefix(17.3898, 78.4557, 10)
+    short = full[4:8] + "+" + full[8:]
+    lat, lng = geo.recover_plus_code(short, 17.3850, 78.4867)
+    assert abs(lat - 17.3898) < 0.001 and abs(lng - 78.4557) < 0.001
+    assert geo.decode_plus_code(full[:8] + "+" + full[8:]) == (lat, lng)
+
+
+def test_geocode_prefers_the_most_precise_source():
+    hyderabad = geo.geocode("9FQ4+W7Q, Jamia Masjid Road, Mozampura, Hyderabad", None, "Hyderabad", None, "India")
+    assert hyderabad[2] == geo.PRECISION_PLUS_CODE
+    assert geo.distance_km(hyderabad[0], hyderabad[1], 17.3850, 78.4867) < 10
+
+    shubaikah = geo.geocode("Ibrahim Al Khalil Rd, Ash Shubaikah, Makkah", None, "Makkah", None, "Saudi Arabia")
+    assert shubaikah[2] == geo.PRECISION_DISTRICT
+    assert geo.geocode("King Fahd Rd", None, "Riyadh", None, "Saudi Arabia")[2] == geo.PRECISION_CITY
+    assert geo.geocode("Somewhere", "https://maps.google.com/?q=21.4225,39.8262", None, None, None)[2] == geo.PRECISION_EXACT
+    # Same city name, other country: not placed
+    assert geo.geocode("Main St", None, "Hyderabad", None, "Pakistan") is None
+    assert geo.lookup_place("العزيزية").name == "Al Aziziyah"
+
+
+def test_nearby_agencies_come_from_the_rtree(agencies_db):
+    db = DatabaseManager(agencies_db)
+    assert db.has_locations
+
+    result, error = db.find_nearby("Ajyad", radius_km=3)
+    assert error is None
+    assert [r["hajj_company_en"] for r in result.records()] == ["Jabal Omar Jumeirah Hotel"]
+    assert 0 < result.records()[0]["distance_km"] < 1
+
+    sql, params = db.get_heuristic_query("authorized agencies near Hyderabad?")
+    conn = sqlite3.connect(agencies_db)
+    schema.register_functions(conn)
+    plan = " | ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+    assert "VIRTUAL TABLE INDEX" in plan and "SCAN e" not in plan
+    assert [row[1] for row in conn.execute(sql, params)] == ["AL AHMED TOURS & TRAVELS"]
+
+
+def test_nearest_agencies_widen_the_search_until_enough_are_found(agencies_db):
+    db = DatabaseManager(agencies_db)
+    # Only the Makkah hotel lies within the first rings; Hyderabad is thousands of km away
+    result, error = db.find_nearby(lat=21.4225, lng=39.8262, limit=1)
+    assert error is None
+    assert [r["hajj_company_en"] for r in result.records()] == ["Jabal Omar Jumeirah Hotel"]
+
+    # Fewer agencies than asked for within the widest ring: all of them
+    result, error = db.find_nearby("العزيزية", limit=5)
+    assert error is None
+    assert [(r["hajj_company_en"], r["distance_km"]) for r in result.records()] == [("Jabal Omar Jumeirah Hotel", 5.85)]
+
+    assert db.find_nearby("Atlantis") == (None, "Unknown place: Atlantis")
+    assert db.find_nearby() == (None, "A place or a lat/lng point is required")
+
+
+def test_proximity_questions_are_answered_by_find_nearby(agencies_db):
+    db = DatabaseManager(agencies_db)
+    filters = db.get_structured_filters("Agencies near Al Aziziyah?")
+    assert filters == {"near": "al aziziyah", "limit": 10}
+    result, error = db.execute_structured(filters, max_rows=50)
+    assert error is None
+    assert [(r["hajj_company_en"], r["distance_km"]) for r in result.records()] == [("Jabal Omar Jumeirah Hotel", 5.85)]
+
+    filters = db.get_structured_filters("authorized agencies within 3 km of Ajyad")
+    assert filters == {"radius_km": 3.0, "near": "ajyad", "authorized": "Yes", "limit": 10}
+    result, _ = db.execute_structured(filters)
+    assert [r["hajj_company_en"] for r in result.records()] == ["Jabal Omar Jumeirah Hotel"]
+    # A place the gazetteer does not know is left to the other routes
+    assert not (db.get_structured_filters("agencies near me") or {}).get("near")
+
+
+def test_location_index_follows_table_changes(agencies_db):
+    conn = schema.connect(agencies_db)
+    conn.execute("UPDATE agencies SET city = 'Jeddah', country = 'Saudi Arabia' WHERE id = 2")
+    conn.execute("DELETE FROM agencies WHERE id = 1")
+    conn.commit()
+
+    located = dict(conn.execute("SELECT id, precision FROM agency_geo"))
+    assert 1 not in located
+    assert located[2] == geo.PRECISION_CITY
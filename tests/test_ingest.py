@@ -0,0 +1,146 @@
+import csv
+import sqlite3
+
+from core import ingest, schema
+from core.database import DatabaseManager
+from core.query_cache import file_signature, query_cache
+from core.schema import SCHEMA_VERSION
+
+HEADER = ["Hajj Company (Arabic)", "Hajj Company (English)", "formattedAddress", "City", "Country", "email",
+          "Contact_Info", "Rating Reviews", "is_autorized", "Google_Maps_Link", "Link_Valid"]
+
+
+def write_csv(path, rows, encoding="cp1256"):
+    with open(path, "w", newline="", encoding=encoding, errors="replace") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+    return str(path)
+
+
+def test_detects_windows_arabic_encoding(tmp_path):
+    path = write_csv(tmp_path / "agencies.csv", [["مكة للسياحة", "MAKKAH TRAVEL", "", "مكة", "مصر", "", "", "", "Yes", "", "FALSE"]])
+    assert ingest.detect_encoding(path) == "cp1256"
+    assert ingest.detect_encoding(write_csv(tmp_path / "utf8.csv", [], encoding="utf-8")) == "utf-8-sig"
+
+
+def test_ingest_builds_migrated_database(tmp_path):
+    path = write_csv(tmp_path / "agencies.csv", [
+        ["الهدى", "AL HOUDA", "Rue de la Station 12", "Sint-Niklaas", "Belgium", "", "+32", "3.9 (12 reviews)", "No",
+         "https://maps.example/1", "TRUE"],
+        ["مكة للسياحة", "MAKKAH TRAVEL", "Al Mansoura", "الدقهلية", "", "", "", "", "Yes",
+         "https://maps.example/broken", "FALSE"],
+    ])
+    db_path = str(tmp_path / "new.db")
+
+    result = ingest.ingest(path, db_path, chunk_size=1)
+
+    assert result["rows"] == 2
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    rows = conn.execute(
+        'SELECT hajj_company_en, city, country, "المدينة", "الدولة", email, google_maps_link FROM agencies ORDER BY id'
+    ).fetchall()
+    assert rows == [
+        ("AL HOUDA", "Sint-Niklaas", "Belgium", None, None, None, "https://maps.example/1"),
+        ("MAKKAH TRAVEL", None, "Unknown", "الدقهلية", "Unknown", None, None),
+    ]
+    assert conn.execute("SELECT value FROM agency_stats WHERE name = 'total'").fetchone() == (2,)
+    conn.close()
+    assert list(DatabaseManager(db_path).search_agency_fuzzy("houda")["hajj_company_en"]) == ["AL HOUDA"]
+
+
+def test_ingest_carries_over_locations_and_lossless_text(agencies_db, tmp_path):
+    path = write_csv(tmp_path / "agencies.csv", [
+        # City in Arabic this time; English names must come from the deployed row
+        ["فندق جبل عمر جميرا الفندقية", "Jabal Omar Jumeirah Hotel",
+         "Al Shubaikah, Ibrahim Al-Khalil Road، Jabal Omar, Ash Shubaikah, Makkah 24231, Saudi Arabia",
+         "مكة المكرمة", "Saudi Arabia", "", "+966 12 556 0111", "4.6 (5243 reviews)", "Yes", "", "FALSE"],
+        # New agency in a known city
+        ["الحرمين", "AL HARAMAIN", "King Fahd Rd", "Makkah", "Saudi Arabia", "", "", "", "Yes", "", "FALSE"],
+        # Urdu letters are lost in cp1256 ('ٹ' → '?'), the deployed spelling is kept
+        ["الاحمد ٹورس اند ترافلس", "AL AHMED TOURS & TRAVELS",
+         "9FQ4+W7Q, Jamia Masjid Road, Mozampura, Hyderabad, Telangana 500001, India",
+         "Hyderabad", "India", "", "", "4.9 (310 reviews)", "Yes", "", "FALSE"],
+    ])
+    conn = schema.connect(agencies_db)
+    conn.execute("UPDATE agencies SET hajj_company_ar = 'الاحمد ٹورس اند ترافلس' WHERE hajj_company_en LIKE 'AL AHMED%'")
+    conn.commit()
+    conn.close()
+
+    ingest.ingest(path, agencies_db)
+
+    conn = sqlite3.connect(agencies_db)
+    rows = conn.execute(
+        'SELECT hajj_company_ar, city, country, "المدينة", "الدولة", rating_reviews FROM agencies ORDER BY id'
+    ).fetchall()
+    conn.close()
+    assert rows[0][1:5] == ("Makkah", "Saudi Arabia", "مكه المكرمه", "المملكه العربيه السعوديه")
+    assert rows[1][1:5] == ("Makkah", "Saudi Arabia", "مكه المكرمه", "المملكه العربيه السعوديه")
+    assert rows[2][0] == "الاحمد ٹورس اند ترافلس"
+    assert rows[2][5] == "4.9 (310 reviews)"
+
+
+def test_swap_is_atomic_for_open_readers(agencies_db, tmp_path):
+    reader = sqlite3.connect(agencies_db)
+    before = reader.execute("SELECT COUNT(*) FROM agencies").fetchone()[0]
+    path = write_csv(tmp_path / "agencies.csv", [["الهدى", "AL HOUDA", "", "Gent", "Belgium", "", "", "", "No", "", "FALSE"]])
+
+    ingest.ingest(path, agencies_db)
+
+    # The open connection still reads the old file; new managers see the new one
+    assert reader.execute("SELECT COUNT(*) FROM agencies").fetchone()[0] == before
+    reader.close()
+    df, _ = DatabaseManager(agencies_db).execute_query("SELECT COUNT(*) AS n FROM agencies")
+    assert int(df["n"][0]) == 1
+    assert not list(tmp_path.glob(".*.ingest"))
+
+
+def test_delta_sync_applies_only_changed_rows(tmp_path):
+    kept = ["الهدى", "AL HOUDA", "Rue de la Station 12", "Sint-Niklaas", "Belgium", "", "+32", "3.9 (12 reviews)",
+            "No", "", "FALSE"]
+    edited = ["مكة للسياحة", "MAKKAH TRAVEL", "Al Mansoura", "Dakahlia", "Egypt", "", "", "", "Yes", "", "FALSE"]
+    removed = ["الحرمين", "AL HARAMAIN", "King Fahd Rd", "Makkah", "Saudi Arabia", "", "", "", "Yes", "", "FALSE"]
+    db_path = str(tmp_path / "agencies.db")
+    ingest.ingest(write_csv(tmp_path / "day1.csv", [kept, edited, removed]), db_path)
+
+    db = DatabaseManager(db_path)
+    ids = dict(db.execute_rows("SELECT hajj_company_en, agency_id FROM agency")[0].rows)
+    assert db.get_agency(ids["AL HOUDA"])["email"] is None
+    assert db.get_agency(ids["MAKKAH TRAVEL"])["email"] is None
+
+    added = ["الصفا", "AL SAFA TRAVEL", "Safa St 1", "Jeddah", "Saudi Arabia", "", "", "4.2 (9 reviews)", "Yes", "",
+             "FALSE"]
+    day2 = write_csv(tmp_path / "day2.csv", [kept, edited[:5] + ["info@makkah.eg"] + edited[6:], added])
+    result = ingest.sync(day2, db_path)
+
+    assert (result["inserted"], result["updated"], result["deleted"], result["unchanged"]) == (1, 1, 1, 1)
+    assert ids["AL HOUDA"] not in result["agency_ids"]
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT op, row_id FROM agency_changes ORDER BY seq").fetchall() == [
+        ("delete", 3), ("update", 2), ("insert", 4),
+    ]
+    assert conn.execute("SELECT rowid FROM agencies_fts WHERE agencies_fts MATCH '\"safa\"'").fetchall() == [(4,)]
+    assert conn.execute("SELECT hajj_company_en FROM agency ORDER BY row_id").fetchall() == [
+        ("AL HOUDA",), ("MAKKAH TRAVEL",), ("AL SAFA TRAVEL",),
+    ]
+    assert conn.execute("SELECT value FROM agency_stats WHERE name = 'total'").fetchone() == (3,)
+    ingest.check_integrity(conn)
+    conn.close()
+
+    # Only the cached results of changed agencies are dropped
+    start = query_cache.stats()
+    assert db.get_agency(ids["AL HOUDA"])["email"] is None
+    assert db.get_agency(ids["MAKKAH TRAVEL"])["email"] == "info@makkah.eg"
+    stats = query_cache.stats()
+    assert stats["hits"] - start["hits"] == 2
+    assert stats["retained"] - start["retained"] >= 2
+
+    # The added agency is reachable through the search index the sync kept current
+    assert list(db.search_agency_fuzzy("safa")["hajj_company_en"]) == ["AL SAFA TRAVEL"]
+
+    # Nothing changed: the file is left alone
+    signature = file_signature(db_path)
+    assert ingest.sync(day2, db_path)["sync_id"] is None
+    assert file_signature(db_path) == signature
+    assert not list(tmp_path.glob(".*.sync"))
@@ -0,0 +1,181 @@
+import os
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from core import schema
+from core.agency_names import get_agency_names
+from core.database import DatabaseManager
+from core.name_matching import NameAutomaton, NameMatrix, SoundIndex, TrigramIndex
+from core.voice_processor import VoiceQueryProcessor
+from tests.conftest import SAMPLE_AGENCIES, build_agencies_db
+from utils.normalization import normalize_text
+
+NAMES = [
+    "AL HUDA GROUP", "AL HOUDA", "مجموعة الهدى", "الهدى", "MAKKAH TRAVEL", "مكة للسياحة",
+    "Al Huda Hajj Umrah Tours", "Royal Group Huda", "AL AHMED TOURS & TRAVELS", "Huda Al Group Al",
+]
+
+
+class NoClientLLM:
+    def _get_client(self):
+        return None
+
+
+def test_name_matrix_scores_match_rapidfuzz():
+    matrix = NameMatrix(NAMES)
+    normalized = [normalize_text(name) for name in NAMES]
+    for candidate in ("al huda grop", "group al huda", "huda", "الهدا", "makka travl", "royal"):
+        for cutoff in (0, 75):
+            expected = process.cdist([candidate], normalized, scorer=fuzz.token_sort_ratio, score_cutoff=cutoff)[0]
+            assert np.allclose(matrix.token_sort_scores(candidate, cutoff), expected, atol=1e-4)
+            expected = process.cdist([candidate], normalized, scorer=fuzz.token_set_ratio, score_cutoff=cutoff)[0]
+            assert np.allclose(matrix.token_set_scores(candidate, cutoff), expected, atol=1e-4)
+        extracted = process.extract(candidate, normalized, scorer=fuzz.token_sort_ratio, score_cutoff=50, limit=3)
+        assert [i for _, _, i in matrix.top(matrix.token_sort_scores(candidate), 50, 3)] == [i for _, _, i in extracted]
+
+    # Leading words match word by word; names shorter than the candidate never do
+    assert list(matrix.prefix_word_matches("al hud grop")) == [3, 0, 0, 0, 0, 0, 2, 0, 1, 1]
+    assert matrix.best_prefix_match("al hud grop", matrix.token_sort_scores("al hud grop"))[0] == 0
+    assert matrix.find_exact("al huda group") == 0 and matrix.find_exact("al huda") is None
+
+    # Restricted to a shortlist, the scorers score exactly those names
+    rows = matrix.shortlist("al hud grop", limit=3)
+    for scorer in (matrix.token_sort_scores, matrix.token_set_scores):
+        full, restricted = scorer("al hud grop"), scorer("al hud grop", 0, rows)
+        assert np.array_equal(restricted[rows], full[rows]) and not np.delete(restricted, rows).any()
+    assert np.array_equal(matrix.prefix_word_matches("al hud grop", rows=rows), matrix.prefix_word_matches("al hud grop")[rows])
+    assert matrix.best_prefix_match("al hud grop", matrix.token_sort_scores("al hud grop", 0, rows), rows=rows)[0] == 0
+    # The stages read the shortlist, and every name only when no name shares a trigram
+    assert np.array_equal(matrix.candidate_rows("al hud grop"), matrix.shortlist("al hud grop"))
+    assert matrix.candidate_rows("qqq") is None
+
+
+def test_trigram_shortlist_ranks_names_by_shared_grams():
+    phrases = [normalize_text(name) for name in NAMES] + [f"agency number {i}" for i in range(400)]
+    index = TrigramIndex(phrases)
+    assert list(index.shortlist("al hudda grup", limit=2)) == [0, 9]
+    assert list(index.shortlist("مجموعه الهدا", limit=1)) == [2]
+    # Grams every "agency number" phrase has only rank the candidates the selective ones find
+    assert list(index.shortlist("agency numbr 12", limit=1)) == [len(NAMES) + 12]
+    assert len(index.shortlist("agency numbr")) == index.SHORTLIST_SIZE
+    assert list(index.shortlist("")) == [] and list(index.shortlist("qqq")) == []
+
+
+def test_transcript_correction_uses_the_name_matrix(agencies_db):
+    voice = VoiceQueryProcessor(DatabaseManager(agencies_db), NoClientLLM())
+    assert voice.correct_transcript_large_scale("al huda group") == "AL HUDA GROUP"
+    assert voice.correct_transcript_large_scale("Is Al Huda Grop authorized?") == "Is AL HUDA GROUP authorized?"
+    assert voice.correct_transcript_large_scale("Check Makka Travl") == "Check MAKKAH TRAVEL"
+    assert voice.correct_transcript_large_scale("what is the weather like") == "what is the weather like"
+    assert voice.correct_transcript_large_scale("check jabal omar hotel") == "check Jabal Omar Jumeirah Hotel"
+
+
+def test_automaton_spots_every_name_in_one_pass():
+    phrases = ["al huda", "al huda group", "huda group", "group", "", "مجموعه الهدي"]
+    automaton = NameAutomaton(phrases)
+    text = "is al huda group or مجموعه الهدي authorized"
+
+    assert sorted(automaton.find_all(text)) == [(1, 3, 0), (1, 4, 1), (2, 4, 2), (3, 4, 3), (5, 7, 5)]
+    assert automaton.find(text) == [(1, 4, 1), (5, 7, 5)]
+    # Whole words only
+    assert automaton.find_all("al hudagroup") == [] and not automaton.contains_any("al hudagroup")
+    assert automaton.contains_any("the group")
+
+
+def test_prompt_hints_start_with_names_from_the_conversation(agencies_db):
+    voice = VoiceQueryProcessor(DatabaseManager(agencies_db), NoClientLLM())
+    # Mentioned names in text order, then the first agencies
+    hints = voice.get_relevant_agencies_for_prompt(["compare مكة للسياحة and al houda please"], limit=3)
+    assert hints == ["مكة للسياحة", "AL HOUDA", "Jabal Omar Jumeirah Hotel"]
+    assert voice.get_relevant_agencies_for_prompt(["al huda group vs al houda"], limit=1) == ["AL HUDA GROUP"]
+
+
+def test_voice_processors_share_one_name_index(agencies_db):
+    db = DatabaseManager(agencies_db)
+    names = VoiceQueryProcessor(db, NoClientLLM()).get_agency_names()
+    assert VoiceQueryProcessor(DatabaseManager(agencies_db), NoClientLLM()).get_agency_names() is names
+
+    at = names.names.index("AL HOUDA")
+    assert names.lowered[at] == "al houda" and names.normalized[at] == "al houda"
+    assert names.names_of(names.agency_ids[at]) == ["الهدى", "AL HOUDA"]
+    assert names.matrix.normalized == names.normalized
+
+    conn = schema.connect(agencies_db)
+    conn.execute("UPDATE agencies SET hajj_company_en = 'AL HOUDA TOURS' WHERE hajj_company_en = 'AL HOUDA'")
+    conn.commit()
+    conn.close()
+    stat = os.stat(agencies_db)
+    os.utime(agencies_db, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    reloaded = get_agency_names(db.backend)
+    assert reloaded is not names and "AL HOUDA TOURS" in reloaded.names
+
+
+def test_sound_index_finds_names_spelt_in_another_script():
+    phrases = [normalize_text(name) for name in ("شركة نماء البركة لخدمات الحجاج", "مكة للسياحة", "البركة", "Link")]
+    sounds = SoundIndex(phrases)
+
+    # Whole names, the leading words of a longer one, never short or single common keys
+    assert sounds.lookup("makka siyaha") == [1]
+    assert sounds.lookup("namaa al barakah") == [0]
+    assert sounds.lookup("barakah") == [] and sounds.lookup("link") == []
+    assert sounds.find("is namaa al barakah authorized") == [(1, 4, [0])]
+    assert sounds.find("is namaa al barakah authorized", ignore={"namaa"}) == []
+
+
+def test_transcripts_resolve_names_spoken_in_another_script(agencies_db):
+    db = DatabaseManager(agencies_db)
+    voice = VoiceQueryProcessor(db, NoClientLLM())
+    # The agency's name in the script of the transcript replaces the spoken one
+    assert voice.correct_transcript_large_scale("Is Makka Siyaha authorized?") == "Is MAKKAH TRAVEL authorized?"
+    assert db.get_structured_filters("is makka siyaha authorized") == {"name": "مكه للسياحه", "limit": 50}
+
+
+GREETING_AGENCIES = [
+    ("وكالة مرحبا", "Marhaba Agency") + SAMPLE_AGENCIES[3][2:],
+    ("انشاء الله الخدمات للحج والعمرة الخصوصي المحدودة", "INSHA ALLAH HAJJ SERVICES PVT LTD") + SAMPLE_AGENCIES[4][2:],
+]
+
+
+def test_greetings_and_common_words_are_not_names(tmp_path):
+    phrases = [normalize_text(name) for row in GREETING_AGENCIES for name in row[:2]]
+    sounds = SoundIndex(phrases)
+    # One specific word, the first words of a long name, or the same script never match
+    for spoken in ("marhaba", "مرحبا", "insha allah", "انشا الله", "مرحبا كيف حالك"):
+        assert sounds.find(normalize_text(spoken)) == []
+    assert sounds.lookup("wakala marhaba") == [0] and sounds.lookup("marhaba") == []
+
+    db = DatabaseManager(build_agencies_db(tmp_path / "greetings.db", SAMPLE_AGENCIES + GREETING_AGENCIES))
+    voice = VoiceQueryProcessor(db, NoClientLLM())
+    assert voice.correct_transcript_large_scale("مرحبا كيف حالك") == "مرحبا كيف حالك"
+    for question in ("marhaba", "insha allah", "مرحبا كيف حالك"):
+        assert db.get_structured_filters(question) is None
+    assert db.get_structured_filters("is makka siyaha authorized") == {"name": "مكه للسياحه", "limit": 50}
+
+
+def test_generic_words_do_not_stand_for_a_name(tmp_path):
+    rows = SAMPLE_AGENCIES + GREETING_AGENCIES + [
+        ("أهلا للحج والعمرة", "AHLAN HAJJ & UMRAH SERVICES") + SAMPLE_AGENCIES[1][2:],
+        ("فيزا تورز", "Visa Tours") + SAMPLE_AGENCIES[2][2:],
+    ]
+    voice = VoiceQueryProcessor(DatabaseManager(build_agencies_db(tmp_path / "generic.db", rows)), NoClientLLM())
+    # Each is contained in a name (token_set_ratio 100) but says too little of it
+    for question in ("hotel", "ahlan", "umrah visa", "marhaba", "insha allah", "tell me about hajj services"):
+        assert voice.correct_transcript_large_scale(question) == question
+
+
+def test_single_word_names_are_corrected_from_their_word(tmp_path):
+    rows = SAMPLE_AGENCIES + GREETING_AGENCIES + [
+        ("الطيار", "Al Tayyar") + SAMPLE_AGENCIES[1][2:],
+        ("زمزم", "ZAMZAM") + SAMPLE_AGENCIES[2][2:],
+        ("فندق تورز", "Hotel Tours") + SAMPLE_AGENCIES[2][2:],
+    ]
+    voice = VoiceQueryProcessor(DatabaseManager(build_agencies_db(tmp_path / "single.db", rows)), NoClientLLM())
+    # The one word of the name, spoken exactly, stands for it (token_set_ratio 100)
+    assert voice.correct_transcript_large_scale("tayyar") == "Al Tayyar"
+    assert voice.correct_transcript_large_scale("is tayyar authorized?") == "is Al Tayyar authorized?"
+    assert voice.correct_transcript_large_scale("is zamzm authorized?") == "is ZAMZAM authorized?"
+    # One word of a longer name still does not
+    for question in ("hotel", "marhaba", "check omar"):
+        assert voice.correct_transcript_large_scale(question) == question
@@ -0,0 +1,48 @@
+from utils.normalization import (
+    contains_phrase,
+    normalize_company_name,
+    normalize_text,
+    phonetic_words,
+)
+
+
+def test_arabic_letter_variants_fold_together():
+    assert normalize_text("مكّة المكرمة") == normalize_text("مكه المكرمه")
+    assert normalize_text("إثراء الجود") == normalize_text("اثراء الجود")
+    assert normalize_text("الهدى") == normalize_text("الهدي")
+    assert normalize_text("نماء ـــ البركة") == "نماء البركه"
+
+
+def test_urdu_forms_match_arabic():
+    assert normalize_text("الہدیٰ") == normalize_text("الهدى")
+    assert normalize_text("کمپنی ۱۲") == "كمپني 12"
+
+
+def test_case_punctuation_and_whitespace():
+    assert normalize_text("  AL-KABIR   Travels & Tours ") == "al kabir travels tours"
+    assert normalize_text(None) == ""
+
+
+def test_company_words_are_stripped():
+    assert normalize_company_name("شركة مكة للسياحة") == "مكه للسياحه"
+    assert normalize_company_name("الہدیٰ ایجنسی") == "الهدي"
+    assert normalize_company_name("Royal City Agency") == "royal city"
+
+
+def test_contains_phrase_respects_word_boundaries():
+    text = normalize_text("Is Al Huda Group authorized?")
+    assert contains_phrase(text, "al huda group")
+    assert not contains_phrase(text, "al hud")
+    assert not contains_phrase(text, "")
+
+
+def phonetic_key(text):
+    return " ".join(key for key in phonetic_words(normalize_text(text)) if key)
+
+
+def test_phonetic_words_match_across_scripts():
+    assert phonetic_key("Namaa al-Barakah") == phonetic_key("نماء البركة") == "nm brk"
+    assert phonetic_key("Makkah Travel") == phonetic_key("مکہ ٹریول") == "mk trl"
+    assert phonetic_key("As-Salam") == phonetic_key("السلام") == "slm"
+    assert phonetic_key("Dhiyafa") == phonetic_key("Ziyafa") == phonetic_key("ضيافة")
+    assert phonetic_key("Alhuda") == phonetic_key("Al Huda") == "hd"
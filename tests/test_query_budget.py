@@ -0,0 +1,54 @@
+from core.database import DatabaseManager
+from core.query_budget import QueryBudget, apply_row_cap, find_unbounded_nesting
+
+
+def test_row_cap_added_when_missing_or_too_large():
+    assert apply_row_cap("SELECT * FROM agencies LIMIT 10", 200) == "SELECT * FROM agencies LIMIT 10"
+    capped = apply_row_cap("SELECT * FROM agencies LIMIT 5000", 200)
+    assert capped.endswith("LIMIT 200") and "LIMIT 5000" in capped
+    assert apply_row_cap("SELECT * FROM agencies -- all", 50).endswith("\n) AS capped LIMIT 50")
+
+
+def test_plan_check_flags_nested_scans():
+    cross_join = [(3, 0, 0, "SCAN a"), (5, 0, 0, "SCAN b")]
+    correlated = [(2, 0, 0, "SCAN a"), (5, 0, 0, "CORRELATED SCALAR SUBQUERY 1"), (10, 5, 0, "SCAN b")]
+    indexed_join = [(3, 0, 0, "SCAN a"), (16, 0, 0, "SEARCH b USING AUTOMATIC COVERING INDEX (x=?)")]
+    union = [(1, 0, 0, "COMPOUND QUERY"), (2, 1, 0, "LEFT-MOST SUBQUERY"), (6, 2, 0, "SCAN a"),
+             (9, 1, 0, "UNION ALL"), (13, 9, 0, "SCAN b")]
+
+    assert "nested full scans" in find_unbounded_nesting(cross_join)
+    assert "per row" in find_unbounded_nesting(correlated)
+    assert find_unbounded_nesting(indexed_join) is None
+    assert find_unbounded_nesting(union) is None
+
+
+def test_budgeted_query_is_row_capped(agencies_db):
+    db = DatabaseManager(agencies_db)
+    result, error = db.execute_rows("SELECT hajj_company_en FROM agencies", budget=QueryBudget(max_rows=2))
+    assert error is None
+    assert len(result) == 2
+
+
+def test_unbounded_cross_join_rejected_before_running(agencies_db):
+    db = DatabaseManager(agencies_db)
+    result, error = db.execute_rows(
+        "SELECT a.id FROM agencies a, agencies b WHERE a.email LIKE b.email", budget=QueryBudget()
+    )
+    assert result is None
+    assert "plan rejected" in error
+
+
+def test_runaway_query_stopped_by_step_budget(agencies_db):
+    db = DatabaseManager(agencies_db)
+    runaway = """
+        SELECT COUNT(*) FROM (
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT i FROM n
+        ) WHERE i < 0
+    """
+    result, error = db.execute_rows(runaway, budget=QueryBudget(max_steps=200_000, timeout_seconds=5))
+    assert result is None
+    assert "execution budget" in error
+
+    # The connection goes back to the pool without the handler
+    result, error = db.execute_rows("SELECT COUNT(*) FROM agencies")
+    assert error is None and result.rows == [(5,)]
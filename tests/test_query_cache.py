@@ -0,0 +1,81 @@
+import os
+import time
+
+from core import schema
+from core.database import DatabaseManager
+from core.query_cache import QueryCache, make_key, query_cache
+
+
+def test_key_ignores_formatting_but_not_params():
+    a = make_key("x.db", "SELECT *\n  FROM agencies ;", {"b": 2, "a": 1})
+    b = make_key("x.db", "SELECT * FROM agencies", {"a": 1, "b": 2})
+    c = make_key("x.db", "SELECT * FROM agencies", {"a": 1, "b": 3})
+    assert a == b
+    assert a != c
+
+
+def test_lru_and_ttl_eviction(tmp_path, monkeypatch):
+    db = str(tmp_path / "x.db")
+    cache = QueryCache(max_entries=2, ttl_seconds=10)
+    for i in range(3):
+        cache.put(make_key(db, f"SELECT {i}"), i)
+    assert cache.get(make_key(db, "SELECT 0")) is None
+    assert cache.get(make_key(db, "SELECT 2")) == 2
+    assert cache.stats()["evictions"] == 1
+
+    now = time.monotonic()
+    monkeypatch.setattr("core.query_cache.time.monotonic", lambda: now + 60)
+    assert cache.get(make_key(db, "SELECT 2")) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_repeated_query_skips_database(agencies_db, monkeypatch):
+    db = DatabaseManager(agencies_db)
+    sql = "SELECT hajj_company_en FROM agencies WHERE city = :city"
+    start = query_cache.stats()
+
+    first, _ = db.execute_query(sql, {"city": "Ramallah"})
+    monkeypatch.setattr("core.database.pd.read_sql", None)  # a cache miss would now fail
+    second, error = db.execute_query(sql, {"city": "Ramallah"})
+
+    assert error is None
+    assert second is first
+    stats = query_cache.stats()
+    assert stats["hits"] - start["hits"] == 1
+    assert stats["misses"] - start["misses"] == 1
+
+
+def test_cache_invalidated_when_file_changes(agencies_db):
+    db = DatabaseManager(agencies_db)
+    sql = "SELECT COUNT(*) AS n FROM agencies"
+    start = query_cache.stats()
+    before, _ = db.execute_query(sql)
+
+    conn = schema.connect(agencies_db)
+    conn.execute("DELETE FROM agencies WHERE hajj_company_en = 'AL HOUDA'")
+    conn.commit()
+    conn.close()
+    os.utime(agencies_db, ns=(0, os.stat(agencies_db).st_mtime_ns + 1_000_000))
+
+    after, _ = db.execute_query(sql)
+    assert int(after["n"][0]) == int(before["n"][0]) - 1
+    assert query_cache.stats()["invalidations"] - start["invalidations"] == 1
+
+
+def test_change_feed_keeps_entries_of_untouched_agencies(tmp_path):
+    db = tmp_path / "x.db"
+    db.write_bytes(b"v1")
+    feed_results = {None: ("s1", None), "s1": ("s2", {"b"}), "s2": ("s3", None)}
+    cache = QueryCache()
+    cache.set_change_feed(str(db), lambda cursor: feed_results[cursor])
+    for name, tags in (("a", frozenset({"a"})), ("b", frozenset({"b"})), ("all", None)):
+        cache.put(make_key(str(db), f"SELECT '{name}'"), name, tags)
+
+    db.write_bytes(b"v2 longer")
+    assert cache.get(make_key(str(db), "SELECT 'a'")) == "a"
+    assert cache.get(make_key(str(db), "SELECT 'b'")) is None
+    assert cache.get(make_key(str(db), "SELECT 'all'")) is None
+
+    # Unknown changes drop everything
+    db.write_bytes(b"v3 longer still")
+    assert cache.get(make_key(str(db), "SELECT 'a'")) is None
@@ -0,0 +1,99 @@
+import os
+import shutil
+import sqlite3
+
+from core import schema
+from core.database import DatabaseManager
+from core.snapshot import get_snapshot
+
+
+def names(result):
+    at = result.columns.index("hajj_company_en")
+    return [row[at] for row in result.rows]
+
+
+def test_slot_filled_questions_are_answered_from_snapshot(agencies_db, monkeypatch):
+    db = DatabaseManager(agencies_db)
+    monkeypatch.setattr(db, "execute_rows", None)
+
+    filters = db.get_structured_filters("Authorized agencies in Makkah")
+    assert filters == {"authorized": "Yes", "place": "makkah", "limit": 100}
+    result, error = db.execute_structured(filters)
+    assert error is None
+    assert names(result) == ["Jabal Omar Jumeirah Hotel"]
+
+    result, _ = db.execute_structured(db.get_structured_filters("أفضل الشركات في فلسطين"))
+    assert names(result) == ["AL HUDA GROUP"]
+
+    result, _ = db.execute_structured(db.get_structured_filters("top rated agencies"))
+    assert names(result) == ["AL AHMED TOURS & TRAVELS", "Jabal Omar Jumeirah Hotel", "AL HUDA GROUP", "AL HOUDA"]
+
+    result, _ = db.execute_structured(db.get_structured_filters("how many unauthorized agencies"))
+    assert result.rows == [(1,)]
+
+    result, _ = db.execute_structured(db.get_structured_filters("al ahmed tours & travels"), max_rows=1)
+    assert names(result) == ["AL AHMED TOURS & TRAVELS"]
+    assert not result.truncated
+
+
+def test_unrecognized_words_fall_back_to_sql(agencies_db):
+    db = DatabaseManager(agencies_db)
+
+    assert db.get_structured_filters("is al huda authorized?") is None
+    assert db.get_structured_filters("email?") is None
+    assert db.get_structured_filters("authorized agencies in Atlantis") is None
+    # Two companies, or words the fact card cannot answer
+    assert db.get_structured_filters("al houda or makkah travel?") is None
+    assert db.get_structured_filters("is al houda cheaper than makkah") is None
+
+
+def test_questions_about_one_named_company_become_name_filters(agencies_db):
+    db = DatabaseManager(agencies_db)
+
+    assert db.get_structured_filters("Is AL HUDA GROUP authorized?") == {"name": "al huda group", "limit": 50}
+    assert db.get_structured_filters("what is the email of al houda") == {"name": "al houda", "limit": 50}
+    assert db.get_structured_filters("تحقق من شركة مكة للسياحة") == {"name": "مكه للسياحه", "limit": 50}
+    result, _ = db.execute_structured(db.get_structured_filters("tell me about Al Houda"))
+    assert names(result) == ["AL HOUDA"]
+
+
+def test_snapshot_reloads_when_file_changes(agencies_db):
+    db = DatabaseManager(agencies_db)
+    before = get_snapshot(agencies_db)
+    assert get_snapshot(agencies_db) is before
+
+    conn = schema.connect(agencies_db)
+    conn.execute("UPDATE agencies SET is_authorized = 'No' WHERE hajj_company_en = 'MAKKAH TRAVEL'")
+    schema.refresh_entities(conn)
+    conn.commit()
+    conn.close()
+    stat = os.stat(agencies_db)
+    os.utime(agencies_db, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    after = get_snapshot(agencies_db)
+    assert after is not before
+    result, _ = db.execute_structured(db.get_structured_filters("how many unauthorized agencies"))
+    assert result.rows == [(2,)]
+    assert len(after) == sqlite3.connect(agencies_db).execute("SELECT COUNT(*) FROM agency").fetchone()[0]
+
+
+def test_paths_with_uri_characters_are_quoted(agencies_db, tmp_path):
+    odd = tmp_path / "hajj #2?.db"
+    shutil.copy(agencies_db, odd)
+
+    snapshot = get_snapshot(str(odd))
+    assert snapshot is not None and len(snapshot) == len(get_snapshot(agencies_db))
+    assert schema.read_changes(str(odd), None)[0] is not None
+
+
+def test_graph_routes_structured_questions_past_the_llm(agencies_db):
+    from core.graph import ChatGraph
+
+    db = DatabaseManager(agencies_db)
+    graph = ChatGraph(db, llm_manager=None)
+
+    state = graph._node_generate_sql({"user_input": "list agencies with email", "language": "English"})
+    assert state["sql_query_type"] == "structured"
+    out = graph._node_execute_sql(state)
+    assert [row["hajj_company_en"] for row in out["result_rows"]] == ["AL HUDA GROUP", "MAKKAH TRAVEL"]
+    assert out["row_count"] == 2
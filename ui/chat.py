@@ -72,6 +72,7 @@ class ChatInterface:
         """Render complete professional chat interface"""
         self._inject_professional_styles()
         self._display_chat_history()
+        self._render_agency_suggestions()
         self._handle_user_input()
 
     # ------------------------------------------------------------------------
@@ -299,6 +300,7 @@ div[data-testid="stHorizontalBlock"] {
             
             if role == "assistant":
                 self._render_timestamp_and_actions(msg, content, idx)
+                self._render_more_results_button(msg, idx)
             else:
                 self._render_timestamp_only(msg)
 
@@ -714,7 +716,80 @@ div[data-testid="stHorizontalBlock"] {
                 "timestamp": self._get_current_time()
             }
             self._render_timestamp_and_actions(msg, summary, msg_idx)
-            self._add_message("assistant", summary)
+            result_data = None
+            if state.get("next_cursor"):
+                result_data = {"next_cursor": state["next_cursor"], "shown": state.get("row_count") or 0}
+            self._add_message("assistant", summary, result_data)
+            self._render_more_results_button(st.session_state.chat_memory[-1], msg_idx)
+
+    # ------------------------------------------------------------------------
+    # PAGINATION
+    # ------------------------------------------------------------------------
+    def _render_more_results_button(self, msg: Dict, idx: int) -> None:
+        """Offer the next page of a list answer; fetched by cursor, without the LLM"""
+        cursor = (msg.get("result_data") or {}).get("next_cursor")
+        if not cursor:
+            return
+        lang = st.session_state.get("language", "العربية")
+        if st.button(t("more_results", lang), key=f"more_results_{idx}"):
+            self._show_more_results(msg, lang)
+            st.rerun()
+
+    def _show_more_results(self, msg: Dict, lang: str) -> None:
+        """Append the page after msg's results as a new assistant message"""
+        result_data = msg["result_data"]
+        result, error = self.graph.db.fetch_page(result_data["next_cursor"])
+        # The button moves to the new page's message
+        result_data["next_cursor"] = None
+        if error or not result:
+            self._add_message("assistant", t("no_more_results", lang))
+            return
+        shown = result_data.get("shown", 0)
+        content = self._format_result_page(result.records(), lang, shown + 1)
+        next_data = {"next_cursor": result.next_cursor, "shown": shown + len(result)} if result.next_cursor else None
+        self._add_message("assistant", content, next_data)
+
+    @staticmethod
+    def _format_result_page(rows, lang: str, start: int) -> str:
+        """Numbered markdown list of agency rows: name, place and authorization"""
+        english = lang == "English"
+        lines = [t("more_results_header", lang, start=start, end=start + len(rows) - 1), ""]
+        for number, row in enumerate(rows, start):
+            names = (row.get("hajj_company_en"), row.get("hajj_company_ar"))
+            name = (names if english else names[::-1])[0] or names[0] or names[1] or "—"
+            places = (row.get("city"), row.get("country")) if english else (row.get("المدينة"), row.get("الدولة"))
+            place = (", " if english else "، ").join(p for p in places if p)
+            authorized = str(row.get("is_authorized", "")).lower() in ("yes", "true", "1")
+            status = f"✅ {t('status_authorized', lang)}" if authorized else f"❌ {t('status_not_authorized', lang)}"
+            lines.append(f"{number}. **{name}** — {place} · {status}" if place else f"{number}. **{name}** · {status}")
+        return "\n".join(lines)
+
+    # ------------------------------------------------------------------------
+    # AGENCY SUGGESTIONS
+    # ------------------------------------------------------------------------
+    def _render_agency_suggestions(self) -> None:
+        """Type-ahead agency name lookup; picking a name asks about that exact agency"""
+        lang = st.session_state.get("language", "العربية")
+        prefix = st.text_input(
+            t("agency_search_label", lang), key="agency_search",
+            placeholder=t("agency_search_placeholder", lang), label_visibility="collapsed",
+        )
+        if not prefix:
+            return
+        suggestions = self.graph.db.suggest_agencies(prefix)
+        if not suggestions:
+            st.caption(t("no_agency_suggestions", lang))
+            return
+        for i, suggestion in enumerate(suggestions):
+            if st.button(suggestion.label(lang), key=f"agency_suggestion_{i}", use_container_width=True):
+                self._ask_about_agency(suggestion.name)
+
+    def _ask_about_agency(self, name: str) -> None:
+        """Send a picked agency name as the next question, like a sidebar example"""
+        self._add_message("user", name)
+        st.session_state.pending_example = True
+        st.session_state.pop("agency_search", None)
+        st.rerun()
 
     def _handle_error_response(self) -> None:
         """Handle error when no valid response"""
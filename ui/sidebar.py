@@ -24,6 +24,9 @@ STAT_ICONS = {
     'cities': '🏙️'
 }
 
+# Countries listed under the stat cards
+TOP_COUNTRIES = 5
+
 FEATURE_ICONS = {
     'feat_ai': '🤖',
     'feat_multilingual': '🌐',
@@ -532,6 +535,8 @@ class SidebarInterface:
         
         for key, label_key, icon in stat_items:
             self._render_stat_card(stats, key, label_key, icon, lang)
+        
+        self._render_top_countries(lang)
     
     @staticmethod
     def _get_stat_items() -> List[Tuple[str, str, str]]:
@@ -555,6 +560,19 @@ class SidebarInterface:
         """
         st.markdown(stat_html, unsafe_allow_html=True)
     
+    def _render_top_countries(self, lang: str) -> None:
+        """Render the countries with the most agencies (precomputed breakdown)"""
+        dimension = "country_ar" if lang == "العربية" else "country"
+        top = self.db.get_stats_breakdown(dimension, limit=TOP_COUNTRIES)
+        if not top:
+            return
+        
+        with st.expander(f"{STAT_ICONS['countries']} {t('top_countries', lang)}"):
+            for row in top:
+                st.markdown(
+                    f"**{row['value']}** — {row['total']:,} ({t('authorized', lang)}: {row['authorized']:,})"
+                )
+    
     # ------------------------------------------------------------------------
     # EXAMPLES SECTION
     # ------------------------------------------------------------------------
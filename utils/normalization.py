@@ -0,0 +1,158 @@
+"""
+Text Normalization Module
+Single Arabic/Urdu/English normalization used by SQL lookups, fuzzy matching and intent code
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Optional
+
+
+# ============================================================================
+# CHARACTER TABLES
+# ============================================================================
+# Letter variants folded onto one canonical Arabic form
+_LETTER_MAP = {
+    # Alef with hamza / madda / wasla
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    # Ta marbuta, alef maqsura and hamza carriers
+    "ة": "ه", "ى": "ي", "ؤ": "و", "ئ": "ي",
+    # Urdu / Persian letter forms
+    "ک": "ك", "ی": "ي", "ے": "ي", "ۓ": "ي", "ہ": "ه", "ھ": "ه", "ۃ": "ه", "ۂ": "ه",
+}
+
+# Arabic-Indic and Eastern Arabic-Indic (Urdu) digits
+_DIGIT_MAP = {ord(c): str(i) for i, c in enumerate("٠١٢٣٤٥٦٧٨٩")}
+_DIGIT_MAP.update({ord(c): str(i) for i, c in enumerate("۰۱۲۳۴۵۶۷۸۹")})
+
+_TRANSLATION = str.maketrans(_LETTER_MAP)
+_TRANSLATION.update(_DIGIT_MAP)
+
+# Harakat, superscript alef, Quranic marks and tatweel
+_DIACRITICS = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")
+_SEPARATORS = re.compile(r"[^\w\s]|_")
+_WHITESPACE = re.compile(r"\s+")
+
+# Generic words that carry no identity in an agency name
+GENERIC_NAME_TERMS = frozenset({
+    "company", "agency", "establishment", "travel", "travels",
+    "شركه", "وكاله", "مؤسسه",
+    "كمپني", "ايجنسي",
+})
+
+
+# ============================================================================
+# NORMALIZATION
+# ============================================================================
+def fold_arabic(text: str) -> str:
+    """Remove diacritics/tatweel and unify Arabic and Urdu letter variants"""
+    return _DIACRITICS.sub("", text).translate(_TRANSLATION)
+
+
+@lru_cache(maxsize=50_000)
+def normalize_text(text: Optional[str]) -> str:
+    """
+    Canonical form used for every equality and fuzzy comparison
+
+    Case-folds, folds Arabic/Urdu letter variants and digits, turns
+    punctuation into spaces and collapses whitespace.
+
+    Example:
+        "  شركة مكّة للسياحة - Al-Huda " → "شركه مكه للسياحه al huda"
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", str(text)).casefold()
+    text = fold_arabic(text)
+    text = _SEPARATORS.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+@lru_cache(maxsize=50_000)
+def normalize_company_name(text: Optional[str]) -> str:
+    """Normalized name with generic words (company, agency, شركة, ...) removed"""
+    words = [w for w in normalize_text(text).split() if w not in GENERIC_NAME_TERMS]
+    return " ".join(words)
+
+
+def normalize_column_value(value: Optional[str]) -> Optional[str]:
+    """normalize_text for stored columns, keeping NULL as NULL"""
+    if value is None:
+        return None
+    return normalize_text(value)
+
+
+def contains_phrase(text: str, phrase: str) -> bool:
+    """Whole-word containment between two already normalized strings"""
+    return bool(phrase) and f" {phrase} " in f" {text} "
+
+
+# ============================================================================
+# PHONETIC KEY
+# ============================================================================
+# Consonant classes shared by Arabic, Urdu and Latin spellings of a name.
+# Vowels, glides (w/y/v, و/ي), alef, hamza and ain carry no key; letters
+# transliterated several ways share a class (ض/ذ/ز/ظ and d/dh/z, ث/س/ص and s/th)
+_PHONETIC_MAP = {
+    # Latin digraphs first (matched before single letters)
+    "sh": "x", "ch": "x", "kh": "k", "gh": "j", "th": "s", "dh": "d", "ph": "f", "ck": "k",
+    "b": "b", "p": "b", "t": "t", "s": "s", "c": "k", "z": "d", "d": "d", "k": "k", "q": "k", "x": "k",
+    "g": "j", "j": "j", "h": "h", "r": "r", "l": "l", "m": "m", "n": "n", "f": "f",
+    # Arabic and Urdu letters (after fold_arabic)
+    "ب": "b", "پ": "b", "ت": "t", "ط": "t", "ٹ": "t", "ث": "s", "س": "s", "ص": "s",
+    "ش": "x", "چ": "x", "ج": "j", "غ": "j", "گ": "j", "ك": "k", "ق": "k", "خ": "k",
+    "ح": "h", "ه": "h", "د": "d", "ض": "d", "ذ": "d", "ز": "d", "ظ": "d", "ڈ": "d", "ژ": "d",
+    "ر": "r", "ڑ": "r", "ل": "l", "م": "m", "ن": "n", "ں": "n", "ف": "f",
+}
+_PHONETIC_UNITS = re.compile(r"sh|ch|kh|gh|th|dh|ph|ck|.")
+_ARABIC_LETTER = re.compile(r"[؀-ۿ]")
+# Latin article forms: always dropped, or dropped before a word starting with their
+# consonant (sun-letter assimilation, "as salam" = "السلام")
+_LATIN_ARTICLES = frozenset({"al", "el", "ul"})
+_LATIN_SUN_ARTICLE = re.compile(r"[aeu](?:sh|th|dh|[stdrnzl])")
+
+
+def has_arabic_script(text: str) -> bool:
+    """Whether text contains Arabic or Urdu letters"""
+    return bool(_ARABIC_LETTER.search(text))
+
+
+def _word_key(word: str) -> str:
+    if has_arabic_script(word):
+        # Definite article (also after li-: للسياحه) and ta marbuta (folded to ه)
+        if len(word) > 3 and word.startswith(("لل", "ال")):
+            word = word[2:]
+        if len(word) > 1 and word.endswith("ه"):
+            word = word[:-1]
+    else:
+        if len(word) >= 5 and word.startswith(("al", "el")):
+            word = word[2:]
+        if len(word) > 2 and word.endswith("h") and word[-2] in "aeiou":
+            word = word[:-1]
+    key = []
+    for unit in _PHONETIC_UNITS.findall(word):
+        letter = unit if unit.isdigit() else _PHONETIC_MAP.get(unit, "")
+        if letter and (not key or key[-1] != letter):
+            key.append(letter)
+    return "".join(key)
+
+
+def phonetic_words(text_norm: str) -> list:
+    """
+    Consonant skeleton of each word of a normalized text ("" for a word with
+    none, such as an article or a vowel-only word)
+
+    Example:
+        "namaa al barakah" → ["nm", "", "brk"], "نماء البركه" → ["nm", "brk"]
+    """
+    words = text_norm.split()
+    keys = [_word_key(word) for word in words]
+    for i, word in enumerate(words):
+        if word in _LATIN_ARTICLES:
+            keys[i] = ""
+        elif (i + 1 < len(words) and keys[i] and _LATIN_SUN_ARTICLE.fullmatch(word)
+              and keys[i + 1].startswith(keys[i])):
+            keys[i] = ""
+    return keys
+
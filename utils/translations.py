@@ -42,6 +42,7 @@ TRANSLATIONS = {
         "authorized": "Authorized",
         "countries": "Countries",
         "cities": "Cities",
+        "top_countries": "Top Countries",
         
         # Examples
         "ex_all_auth": "🔍 All authorized companies",
@@ -72,6 +73,25 @@ TRANSLATIONS = {
         "results_badge": "{count} Results",
         "authorized_badge": "{count} Authorized",
         "download_results": "Download Results",
+        "more_results": "➕ More results",
+        "more_results_header": "📋 Results {start}–{end}:",
+        "no_more_results": "No more results.",
+        "agency_search_label": "Agency name",
+        "agency_search_placeholder": "🔎 Start typing an agency name...",
+        "no_agency_suggestions": "No agency names start with that.",
+        "report_agency_suggestions": "Or pick the agency from the list:",
+        "status_authorized": "Authorized",
+        "status_not_authorized": "Not authorized",
+        "card_status": "Status",
+        "card_city": "City",
+        "card_country": "Country",
+        "card_address": "Address",
+        "card_contact": "Contact Info",
+        "card_email": "Email",
+        "card_rating": "Rating",
+        "card_maps": "Google Maps Link",
+        "card_reviews": "{count} reviews",
+        "card_not_available": "Not available",
         
         # Responses
         "greeting": "Hello! 👋\n\nI'm doing great, thank you! I'm here to help you find information about Hajj companies. What would you like to know?",
@@ -247,6 +267,7 @@ TRANSLATIONS = {
         "authorized": "المعتمدة",
         "countries": "الدول",
         "cities": "المدن",
+        "top_countries": "أكثر الدول شركات",
         
         # Examples
         "ex_all_auth": "🔍 جميع الشركات المعتمدة",
@@ -277,6 +298,25 @@ TRANSLATIONS = {
         "results_badge": "{count} نتيجة",
         "authorized_badge": "{count} معتمدة",
         "download_results": "تنزيل النتائج",
+        "more_results": "➕ المزيد من النتائج",
+        "more_results_header": "📋 النتائج {start}–{end}:",
+        "no_more_results": "لا توجد نتائج أخرى.",
+        "agency_search_label": "اسم الوكالة",
+        "agency_search_placeholder": "🔎 ابدأ بكتابة اسم الوكالة...",
+        "no_agency_suggestions": "لا توجد وكالات تبدأ بهذا الاسم.",
+        "report_agency_suggestions": "أو اختر الوكالة من القائمة:",
+        "status_authorized": "معتمدة",
+        "status_not_authorized": "غير معتمدة",
+        "card_status": "الحالة",
+        "card_city": "المدينة",
+        "card_country": "الدولة",
+        "card_address": "العنوان",
+        "card_contact": "رقم التواصل",
+        "card_email": "البريد الإلكتروني",
+        "card_rating": "التقييم",
+        "card_maps": "رابط خرائط جوجل",
+        "card_reviews": "{count} تقييم",
+        "card_not_available": "غير متوفر",
         
         # Responses
         "greeting": "وعليكم السلام ورحمة الله وبركاته! 🌙\n\nالحمد لله، أنا بخير! أنا هنا لمساعدتك في العثور على معلومات شركات الحج. كيف يمكنني مساعدتك؟",
@@ -452,6 +492,7 @@ TRANSLATIONS = {
         "authorized": "مجاز",
         "countries": "ممالک",
         "cities": "شہر",
+        "top_countries": "سب سے زیادہ ایجنسیوں والے ممالک",
         
         # Examples
         "ex_all_auth": "🔍 تمام مجاز کمپنیاں",
@@ -482,6 +523,25 @@ TRANSLATIONS = {
         "results_badge": "{count} نتائج",
         "authorized_badge": "{count} مجاز",
         "download_results": "نتائج ڈاؤن لوڈ کریں",
+        "more_results": "➕ مزید نتائج",
+        "more_results_header": "📋 نتائج {start}–{end}:",
+        "no_more_results": "مزید کوئی نتائج نہیں۔",
+        "agency_search_label": "ایجنسی کا نام",
+        "agency_search_placeholder": "🔎 ایجنسی کا نام لکھنا شروع کریں...",
+        "no_agency_suggestions": "اس نام سے کوئی ایجنسی شروع نہیں ہوتی۔",
+        "report_agency_suggestions": "یا فہرست سے ایجنسی منتخب کریں:",
+        "status_authorized": "مجاز",
+        "status_not_authorized": "غیر مجاز",
+        "card_status": "حالت",
+        "card_city": "شہر",
+        "card_country": "ملک",
+        "card_address": "پتہ",
+        "card_contact": "رابطہ نمبر",
+        "card_email": "ای میل",
+        "card_rating": "درجہ بندی",
+        "card_maps": "گوگل میپس لنک",
+        "card_reviews": "{count} جائزے",
+        "card_not_available": "دستیاب نہیں",
         
         # Responses
         "greeting": "السلام علیکم! 👋\n\nمیں بہت اچھا ہوں، شکریہ! میں یہاں حج کمپنیوں کے بارے میں معلومات تلاش کرنے میں آپ کی مدد کے لیے ہوں۔ آپ کیا جانا چاہتے ہیں؟",